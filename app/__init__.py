@@ -1,21 +1,29 @@
 from flask import Flask, redirect, url_for
 from flask_login import current_user
-from config import Config
 from sqlalchemy import func
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
 import os
+import threading
 
 # 导入数据库和模型
-from app.utils.db_manager import db, User, get_config, set_config
+from app.utils.db_manager import db, User, get_config, set_config, ensure_schema
 # 导入 LoginManager
 from app.utils.login_manager import login_manager
 # 导入 APScheduler
 from app.utils.scheduler import scheduler
+# SQLite 性能配置 (WAL / PRAGMA)
+from app.utils.sqlite_profile import configure_sqlite_engine
 
 # 导入定时任务函数
 # [修改说明] 这里导入的函数现在已经不再需要 app 参数了
-from app.modules.data_core.komari_api import run_periodic_static_sync, run_periodic_snapshot_sync
+from app.modules.data_core.komari_api import run_periodic_static_sync, run_periodic_snapshot_sync, get_snapshot_tick_minutes
+
+def create_app(config_class=None, with_scheduler=None):
+    # 默认配置延迟导入：config 在导入时读取 (或创建) db_config.json 并打印数据库模式，
+    # 只在创建应用时执行，命令行工具可以在导入前重定向输出 (如 db_benchmark)
+    if config_class is None:
+        from config import Config as config_class
 
-def create_app(config_class=Config):
     # 初始化 Flask 应用
     app = Flask(__name__)
     app.config.from_object(config_class)
@@ -42,11 +50,17 @@ def create_app(config_class=Config):
     # 初始化变量，确保它们在外部可用
     snapshot_interval = 5
     static_sync_interval = 60
+    ingest_mode = 'poll'
     
     # 4. 应用上下文初始化 (数据库与默认设置)
     with app.app_context():
+        # SQLite: 在创建任何连接之前注册 PRAGMA 配置
+        configure_sqlite_engine(db.engine)
+
         # 创建表结构
         db.create_all()
+        # 旧数据库的结构升级 (新增索引/字段)
+        ensure_schema()
         
         # 检查并创建默认管理员
         init_admin_user()
@@ -56,54 +70,213 @@ def create_app(config_class=Config):
 
         # 安全地读取配置
         try:
-            snapshot_interval = int(get_config('ACQUISITION_INTERVAL_MINUTES', 5))
+            # 自适应轮询模式下，快照任务按最小间隔 tick，由计划器决定每个节点是否到期
+            snapshot_interval = get_snapshot_tick_minutes()
             static_sync_interval = int(get_config('STATIC_SYNC_INTERVAL_MINUTES', 60))
         except (ValueError, TypeError) as e:
             print(f"警告: 配置间隔时间读取失败或格式错误，使用默认值。错误: {e}")
             snapshot_interval = 5
             static_sync_interval = 60
+
+        # 采集模式: poll (定时轮询 /api/recent) 或 stream (WebSocket 实时流)
+        ingest_mode = str(get_config('INGEST_MODE', 'poll')).strip().lower()
             
     # 5. 初始化并启动调度器
+    # SCHEDULER_ENABLED=0 时 Web 进程不运行采集任务，由独立采集进程 (python -m app.collector) 负责
+    if with_scheduler is None:
+        with_scheduler = app.config.get('SCHEDULER_ENABLED', True)
+
+    # 防止 Debug 模式下调度器启动两次
+    if with_scheduler and (not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        start_collector(app, snapshot_interval, static_sync_interval, ingest_mode)
+
+    return app
+
+# --- 采集调度 ---
+
+# 进程内的选主器 (同一时刻跨进程/主机只有一个采集器持有租约并执行任务)
+_collector_leader = None
+
+# 正在运行的调度任务实例数 (失去租约时等待它们结束)
+_running_jobs = 0
+_running_jobs_cond = threading.Condition()
+
+def _track_running_jobs(event):
+    global _running_jobs
+    with _running_jobs_cond:
+        _running_jobs += 1 if event.code == EVENT_JOB_SUBMITTED else -1
+        _running_jobs_cond.notify_all()
+
+def _wait_for_running_jobs(timeout):
+    with _running_jobs_cond:
+        return _running_jobs_cond.wait_for(lambda: _running_jobs <= 0, timeout)
+
+def start_collector(app, snapshot_interval, static_sync_interval, ingest_mode):
+    """
+    启动调度器并参与采集器选主。
+    只有获得数据库租约的进程才会注册采集任务；失去租约时移除任务，由备用进程接管。
+    """
+    global _collector_leader
+    from app.modules.data_core.leader import CollectorLeader
+
     scheduler.init_app(app)
     
     # 将 app 实例显式绑定到 scheduler 对象上
     # 这样在 komari_api.py 中可以通过 scheduler.app 访问上下文，
     # 而不需要将 app 对象作为参数传递（避免了 PostgreSQL 序列化报错）。
     scheduler.app = app 
+    scheduler.add_listener(_track_running_jobs, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+    scheduler.start()
 
-    # 防止 Debug 模式下调度器启动两次
-    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
-        scheduler.start()
-        
-        # 注册任务 1: 高频快照
-        if not scheduler.get_job('periodic_snapshot_sync'):
-            scheduler.add_job(
-                id='periodic_snapshot_sync',
-                func=run_periodic_snapshot_sync,
-                trigger='interval',
-                minutes=snapshot_interval,
-                max_instances=1,
-                replace_existing=True, 
-                # 清空 args，绝对不能传递 app 对象
-                args=[] 
-            )
-            print(f">>> [Scheduler] 快照同步任务已启动 (每 {snapshot_interval} 分钟)")
-
-        # 注册任务 2: 低频静态信息
-        if not scheduler.get_job('periodic_static_sync'):
-            scheduler.add_job(
-                id='periodic_static_sync',
-                func=run_periodic_static_sync,
-                trigger='interval',
-                minutes=static_sync_interval,
-                max_instances=1,
-                replace_existing=True,
-                # 清空 args
-                args=[] 
-            )
-            print(f">>> [Scheduler] 静态信息同步任务已启动 (每 {static_sync_interval} 分钟)")
+    _collector_leader = CollectorLeader(
+        app,
+        on_elected=lambda: register_collector_jobs(app, snapshot_interval, static_sync_interval, ingest_mode),
+        on_demoted=remove_collector_jobs,
+    )
+    _collector_leader.start()
+    return _collector_leader
 
-    return app
+def stop_collector():
+    """停止选主并释放租约 (进程正常退出时调用)"""
+    global _collector_leader
+    if _collector_leader is not None:
+        _collector_leader.stop()
+        _collector_leader = None
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+
+def register_collector_jobs(app, snapshot_interval, static_sync_interval, ingest_mode):
+    """[成为活跃采集器时] 注册周期任务，并续跑未完成的补采任务"""
+    # 注册任务 1: 高频快照 (stream 模式下由实时采集线程代替)
+    if ingest_mode == 'stream':
+        from app.modules.data_core.stream_ingest import start_stream_ingest
+        start_stream_ingest(app)
+    elif not scheduler.get_job('periodic_snapshot_sync'):
+        scheduler.add_job(
+            id='periodic_snapshot_sync',
+            func=run_periodic_snapshot_sync,
+            trigger='interval',
+            minutes=snapshot_interval,
+            max_instances=1,
+            replace_existing=True, 
+            # 清空 args，绝对不能传递 app 对象
+            args=[] 
+        )
+        print(f">>> [Scheduler] 快照同步任务已启动 (每 {snapshot_interval} 分钟)")
+
+    # 注册任务 2: 低频静态信息
+    if not scheduler.get_job('periodic_static_sync'):
+        scheduler.add_job(
+            id='periodic_static_sync',
+            func=run_periodic_static_sync,
+            trigger='interval',
+            minutes=static_sync_interval,
+            max_instances=1,
+            replace_existing=True,
+            # 清空 args
+            args=[] 
+        )
+        print(f">>> [Scheduler] 静态信息同步任务已启动 (每 {static_sync_interval} 分钟)")
+
+    # 注册任务 3: 过期数据清理
+    from app.modules.data_core.retention import run_periodic_retention, RETENTION_INTERVAL_MINUTES
+    if not scheduler.get_job('periodic_retention'):
+        scheduler.add_job(
+            id='periodic_retention',
+            func=run_periodic_retention,
+            trigger='interval',
+            minutes=RETENTION_INTERVAL_MINUTES,
+            max_instances=1,
+            replace_existing=True,
+            args=[]
+        )
+        print(f">>> [Scheduler] 过期数据清理任务已启动 (每 {RETENTION_INTERVAL_MINUTES} 分钟)")
+
+    # 注册任务 4: SQLite WAL 检查点 (仅 SQLite)
+    from app.utils.sqlite_profile import run_periodic_wal_checkpoint, WAL_CHECKPOINT_INTERVAL_MINUTES
+    if 'sqlite' in app.config.get('SQLALCHEMY_DATABASE_URI', '') and not scheduler.get_job('periodic_wal_checkpoint'):
+        scheduler.add_job(
+            id='periodic_wal_checkpoint',
+            func=run_periodic_wal_checkpoint,
+            trigger='interval',
+            minutes=WAL_CHECKPOINT_INTERVAL_MINUTES,
+            max_instances=1,
+            replace_existing=True,
+            args=[]
+        )
+        print(f">>> [Scheduler] WAL 检查点任务已启动 (每 {WAL_CHECKPOINT_INTERVAL_MINUTES} 分钟)")
+
+    # 注册任务 5: PostgreSQL 分区维护 (仅在 history_data 为分区表时)
+    from app.utils.pg_partitioning import is_history_partitioned, run_periodic_partition_maintenance, PARTITION_MAINTENANCE_INTERVAL_HOURS
+    with app.app_context():
+        partitioned = is_history_partitioned()
+    if partitioned and not scheduler.get_job('periodic_partition_maintenance'):
+        scheduler.add_job(
+            id='periodic_partition_maintenance',
+            func=run_periodic_partition_maintenance,
+            trigger='interval',
+            hours=PARTITION_MAINTENANCE_INTERVAL_HOURS,
+            max_instances=1,
+            replace_existing=True,
+            args=[]
+        )
+        print(f">>> [Scheduler] 分区维护任务已启动 (每 {PARTITION_MAINTENANCE_INTERVAL_HOURS} 小时)")
+
+    # 注册任务 6: 历史数据归档 (ARCHIVE_ENABLED=1 时生效，未开启时任务直接返回)
+    from app.modules.data_core.archive import run_periodic_archive, ARCHIVE_INTERVAL_HOURS
+    if not scheduler.get_job('periodic_archive'):
+        scheduler.add_job(
+            id='periodic_archive',
+            func=run_periodic_archive,
+            trigger='interval',
+            hours=ARCHIVE_INTERVAL_HOURS,
+            max_instances=1,
+            replace_existing=True,
+            args=[]
+        )
+        print(f">>> [Scheduler] 历史归档任务已启动 (每 {ARCHIVE_INTERVAL_HOURS} 小时)")
+
+    # 旧数据库首次升级：后台重建历史汇总表
+    from app.modules.data_core.rollups import start_rollup_rebuild_if_needed
+    if start_rollup_rebuild_if_needed(app):
+        print(">>> [Rollup] 汇总表为空，已在后台重建历史汇总数据")
+
+    # 注册任务 7: 历史补采 (执行页面提交的补采任务；补采只在活跃采集器中运行)
+    from app.modules.data_core.backfill import start_backfill, run_periodic_backfill, BACKFILL_INTERVAL_MINUTES
+    if not scheduler.get_job('periodic_backfill'):
+        scheduler.add_job(
+            id='periodic_backfill',
+            func=run_periodic_backfill,
+            trigger='interval',
+            minutes=BACKFILL_INTERVAL_MINUTES,
+            max_instances=1,
+            replace_existing=True,
+            args=[]
+        )
+        print(f">>> [Scheduler] 历史补采任务已启动 (每 {BACKFILL_INTERVAL_MINUTES} 分钟检查)")
+
+    # 续跑上次中断的历史补采任务 (若有)
+    with app.app_context():
+        job_id, started = start_backfill(app)
+        if started:
+            print(f">>> [Backfill] 续跑未完成的补采任务 #{job_id}")
+
+def remove_collector_jobs():
+    """[失去租约时] 移除周期任务，停止实时采集，并等待已在运行的任务结束"""
+    from app.modules.data_core.stream_ingest import stop_stream_ingest
+    from app.modules.data_core.backfill import wait_for_backfill
+    from app.modules.data_core.leader import LEASE_TTL_SECONDS
+    for job_id in ('periodic_snapshot_sync', 'periodic_static_sync', 'periodic_retention',
+                   'periodic_wal_checkpoint', 'periodic_partition_maintenance', 'periodic_archive',
+                   'periodic_backfill'):
+        if scheduler.get_job(job_id):
+            scheduler.remove_job(job_id)
+    # 停止并等待实时采集线程 (缓冲区剩余数据写库后退出)
+    stop_stream_ingest()
+    # 已在运行的清理/归档/补采任务在批次之间检查 should_stand_down() 后提前结束
+    if not (_wait_for_running_jobs(LEASE_TTL_SECONDS) and wait_for_backfill(LEASE_TTL_SECONDS)):
+        print(">>> [Scheduler] 等待运行中的采集任务结束超时")
+    print(">>> [Scheduler] 采集任务已停止")
 
 def register_blueprints(app):
     """
@@ -147,7 +320,24 @@ def init_default_settings():
         'KOMARI_BASE_URL': {'value': 'http://127.0.0.1:8888', 'desc': 'API 地址'},
         'RAW_DATA_RETENTION_DAYS': {'value': 30, 'desc': '数据库数据保留天数'},
         'ACQUISITION_INTERVAL_MINUTES': {'value': 5, 'desc': '节点流量同步间隔(分)'},
-        'STATIC_SYNC_INTERVAL_MINUTES': {'value': 60, 'desc': '节点列表同步间隔(分)'}
+        'STATIC_SYNC_INTERVAL_MINUTES': {'value': 60, 'desc': '节点列表同步间隔(分)'},
+        'SNAPSHOT_CONCURRENCY': {'value': 16, 'desc': '快照采集并发数'},
+        'SNAPSHOT_NODE_TIMEOUT_SECONDS': {'value': 15, 'desc': '单节点请求超时(秒)'},
+        'SNAPSHOT_CYCLE_DEADLINE_SECONDS': {'value': 240, 'desc': '单轮采集总时限(秒)'},
+        'INGEST_MODE': {'value': 'poll', 'desc': '采集模式(poll/stream)'},
+        'STREAM_SAMPLE_SECONDS': {'value': 10, 'desc': '实时流采样间隔(秒)'},
+        'STREAM_FLUSH_SECONDS': {'value': 60, 'desc': '实时流写库间隔(秒)'},
+        'BACKFILL_LOOKBACK_HOURS': {'value': 72, 'desc': '补采缺口回溯时长(小时)'},
+        'BACKFILL_CONCURRENCY': {'value': 4, 'desc': '补采并发数'},
+        'POLLING_MODE': {'value': 'fixed', 'desc': '轮询模式(fixed/adaptive)'},
+        'ADAPTIVE_MIN_INTERVAL_MINUTES': {'value': 1, 'desc': '自适应最小采集间隔(分)'},
+        'ADAPTIVE_MAX_INTERVAL_MINUTES': {'value': 30, 'desc': '自适应最大采集间隔(分)'},
+        'POLL_RATE_LIMIT_PER_SECOND': {'value': 20, 'desc': '全局请求速率上限(次/秒)'},
+        'COMPRESS_IDLE_SNAPSHOTS': {'value': 1, 'desc': '压缩未变化的快照(1开/0关)'},
+        'COLLECTOR_RUN_RETENTION_DAYS': {'value': 7, 'desc': '采集运行记录保留天数'},
+        'RETENTION_BATCH_SIZE': {'value': 2000, 'desc': '过期数据每批删除行数'},
+        'ARCHIVE_ENABLED': {'value': 0, 'desc': '归档较早的原始数据(1开/0关)'},
+        'ARCHIVE_AFTER_DAYS': {'value': 14, 'desc': '原始数据归档天数'}
     }
     
     for key, data in default_settings.items():
@@ -0,0 +1,38 @@
+"""
+独立采集进程
+
+    python -m app.collector
+
+在 Web 层之外运行快照/静态同步等采集任务。Web 进程设置 SCHEDULER_ENABLED=0 启动即可只提供页面和接口。
+可以在多台主机上同时启动多个采集进程：通过数据库租约选出唯一的活跃采集器，其余进程待命，
+活跃进程退出或宕机 (租约过期) 后由待命进程自动接管。
+"""
+import signal
+import threading
+
+from app import create_app, stop_collector
+
+
+def main():
+    app = create_app(with_scheduler=True)
+
+    stop_event = threading.Event()
+
+    def _handle_signal(signum, frame):
+        print(f">>> [Collector] 收到信号 {signum}，准备退出...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
+
+    print(">>> [Collector] 采集进程已启动，等待选主...")
+    while not stop_event.wait(1):
+        pass
+
+    # 释放租约，待命进程无需等待过期即可接管
+    stop_collector()
+    print(">>> [Collector] 已退出")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+"""
+数据库性能基准测试
+
+    python -m app.db_benchmark [--nodes 50] [--days 14] [--repeat 5] [--pg-url postgresql://...] [--output 文件]
+
+用合成数据 (N 个节点 × D 天，5 分钟一个采样点，含流量昼夜波动、长时间空闲、计数器重启归零与离线缺口)
+经由 bulk_add_history 填充临时数据库，然后对以下操作分别计时：
+    get_nodes_with_latest_traffic / get_total_consumed_traffic_summary / bulk_add_history /
+    单节点原始数据读取 (ORM 对象与 iter_history_points 只取所需列两种方式，附内存峰值) /
+    chart_data_api / ranking_api (历史图表与排名接口，当天与较早日期) / delete_node_by_uuid
+SQLite 使用临时文件；PostgreSQL 在 --pg-url (或环境变量 BENCH_PG_URL，默认尝试本机) 可连接时运行，
+所有表建在独立的临时 schema 中，结束后删除，不影响库中已有数据。
+结果以 JSON 输出到 stdout (进度信息输出到 stderr)，或用 --output 写入指定文件，便于不同版本之间对比。
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import sqlalchemy
+from sqlalchemy import create_engine, text
+
+from app import create_app
+from app.modules.history.routes import clear_history_caches
+from app.utils.db_manager import (
+    db,
+    HistoryData,
+    bulk_upsert_nodes,
+    bulk_add_history,
+    get_nodes_with_latest_traffic,
+    get_total_consumed_traffic_summary,
+    delete_node_by_uuid,
+    invalidate_config_cache,
+    iter_history_points,
+)
+
+DEFAULT_PG_URL = 'postgresql+psycopg2://postgres@localhost:5432/postgres'
+PG_SCHEMA = 'nodetool_bench'
+SAMPLE_MINUTES = 5
+SEED_BATCH_SIZE = 2000              # 填充数据时每次 bulk_add_history 的记录数
+
+# 合成数据的随机事件概率 (每个节点每个采样点)
+RESET_PROBABILITY = 0.0005          # 计数器重启归零
+GAP_PROBABILITY = 0.0003            # 进入离线 (产生数据缺口)
+GAP_MINUTES = (30, 720)             # 离线时长范围 (分)
+
+
+def generate_history(uuids, days, seed=0, end=None):
+    """
+    生成合成历史数据，按采样时刻依次产出 (timestamp, [record, ...])。
+    每个节点有各自的平均速率与空闲比例 (部分节点大部分时间空闲，用于覆盖游程压缩)，
+    流量按一天内的时段正弦波动；随机插入计数器归零与离线缺口。
+    """
+    rng = random.Random(seed)
+    end = end or datetime.now().replace(second=0, microsecond=0)
+    step = timedelta(minutes=SAMPLE_MINUTES)
+    state = {
+        uuid: {
+            'up': rng.randint(0, 10 ** 12),
+            'down': rng.randint(0, 10 ** 12),
+            'rate': rng.lognormvariate(17, 1.5),           # 每个采样周期的平均字节数
+            'idle_ratio': rng.choice((0.05, 0.2, 0.5, 0.95)),
+            'offline_until': None,
+        }
+        for uuid in uuids
+    }
+
+    t = end - timedelta(days=days)
+    while t < end:
+        diurnal = 0.6 + 0.4 * math.sin((t.hour + t.minute / 60) / 24 * 2 * math.pi)
+        batch = []
+        for uuid in uuids:
+            s = state[uuid]
+            if s['offline_until'] is not None:
+                if t < s['offline_until']:
+                    continue
+                s['offline_until'] = None
+            if rng.random() < GAP_PROBABILITY:
+                s['offline_until'] = t + timedelta(minutes=rng.randint(*GAP_MINUTES))
+                continue
+            if rng.random() < RESET_PROBABILITY:
+                s['up'] = s['down'] = 0
+            elif rng.random() >= s['idle_ratio']:
+                s['up'] += int(rng.expovariate(1 / (s['rate'] * diurnal * 0.3)))
+                s['down'] += int(rng.expovariate(1 / (s['rate'] * diurnal)))
+            batch.append({
+                'uuid': uuid, 'timestamp': t, 'total_up': s['up'], 'total_down': s['down'],
+                'cpu_usage': round(min(100.0, rng.gammavariate(2, 5) * diurnal), 2),
+            })
+        yield t, batch
+        t += step
+
+
+def _timed(func, repeat):
+    """执行 repeat 次，返回耗时统计 (毫秒)"""
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        func(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'runs': repeat,
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def _peak_kb(func):
+    """执行一次，返回期间 Python 堆内存的峰值增量 (KB)"""
+    tracemalloc.start()
+    try:
+        func(0)
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def run_backend(config_class, nodes, days, repeat, seed):
+    """在一个数据库上填充数据并执行所有计时项，返回结果 dict"""
+    invalidate_config_cache()
+    app = create_app(config_class, with_scheduler=False)
+    # 排名与图表缓存是进程级的，不清空会让后测试的数据库直接命中前一个数据库的缓存
+    clear_history_caches()
+    app.config['LOGIN_DISABLED'] = True
+    uuids = [f'bench-{i:04d}' for i in range(nodes)]
+    result = {'dialect': None, 'seed': {}, 'operations': {}}
+
+    with app.app_context():
+        result['dialect'] = db.engine.dialect.name
+        bulk_upsert_nodes([{'uuid': uuid, 'name': uuid, 'traffic_limit': 0} for uuid in uuids])
+
+        # 1. 填充数据 (同时覆盖写入路径：delta / 游程压缩 / node_latest / 汇总表)
+        started = time.perf_counter()
+        samples = 0
+        last_ts = None
+        pending = []
+        for last_ts, batch in generate_history(uuids, days, seed=seed):
+            samples += len(batch)
+            pending.extend(batch)
+            if len(pending) >= SEED_BATCH_SIZE:
+                bulk_add_history(pending)
+                pending = []
+        if pending:
+            bulk_add_history(pending)
+        seed_seconds = time.perf_counter() - started
+        rows = db.session.query(HistoryData.id).count()
+        result['seed'] = {
+            'samples': samples,
+            'rows': rows,
+            'seconds': round(seed_seconds, 3),
+            'samples_per_second': round(samples / seed_seconds, 1) if seed_seconds else None,
+        }
+
+        ops = result['operations']
+        ops['get_nodes_with_latest_traffic'] = _timed(lambda i: get_nodes_with_latest_traffic(), repeat)
+        ops['get_total_consumed_traffic_summary'] = _timed(lambda i: get_total_consumed_traffic_summary(), repeat)
+
+        # 一次采集周期：每个节点追加一个新采样点
+        base_totals = {uuid: 10 ** 13 for uuid in uuids}
+
+        def _ingest(i):
+            ts = last_ts + timedelta(minutes=SAMPLE_MINUTES * (i + 1))
+            bulk_add_history([
+                {'uuid': uuid, 'timestamp': ts, 'total_up': base_totals[uuid] + i * 1000,
+                 'total_down': base_totals[uuid] + i * 4000, 'cpu_usage': 5.0}
+                for uuid in uuids
+            ])
+        ops['bulk_add_history'] = dict(_timed(_ingest, repeat), records_per_run=len(uuids))
+
+        # 单个节点的全部原始采样点：完整 ORM 对象 vs 只查询需要的列 (iter_history_points)
+        history_start = last_ts - timedelta(days=days)
+
+        def _read_orm(i):
+            HistoryData.query.filter(
+                HistoryData.uuid == uuids[i % nodes], HistoryData.timestamp >= history_start
+            ).order_by(HistoryData.timestamp.asc()).all()
+            db.session.expunge_all()
+
+        def _read_projected(i):
+            list(iter_history_points(uuids[i % nodes], history_start))
+
+        for name, func in (('node_history_orm', _read_orm), ('node_history_projected', _read_projected)):
+            ops[name] = dict(_timed(func, repeat), peak_kb=_peak_kb(func))
+
+    # 历史图表接口 (完整请求：路由 + 查询 + 序列化)
+    client = app.test_client()
+    for label, day in (('today', datetime.now().date()), ('past', (datetime.now() - timedelta(days=max(1, days // 2))).date())):
+        def _chart(i, day=day):
+            response = client.get(f'/history/api/chart_data?uuid={uuids[i % nodes]}&date={day:%Y-%m-%d}')
+            if response.status_code != 200:
+                raise RuntimeError(f"chart_data_api 返回 {response.status_code}")
+        ops[f'chart_data_api_{label}'] = _timed(_chart, repeat)
+
+        # 排名接口有进程内缓存：第一次为实际查询 (max)，之后为缓存命中 (min)
+        def _ranking(i, day=day):
+            response = client.get(f'/history/api/ranking?date={day:%Y-%m-%d}')
+            if response.status_code != 200:
+                raise RuntimeError(f"ranking_api 返回 {response.status_code}")
+        ops[f'ranking_api_{label}'] = _timed(_ranking, repeat)
+
+    with app.app_context():
+        # 删除节点放在最后 (会删除数据)
+        ops['delete_node_by_uuid'] = _timed(lambda i: delete_node_by_uuid(uuids[-(i + 1)]), min(repeat, nodes))
+        db.session.remove()
+        db.engine.dispose()
+    return result
+
+
+def _pg_available(url):
+    try:
+        engine = create_engine(url, connect_args={'connect_timeout': 3})
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+        engine.dispose()
+        return True, None
+    except Exception as e:
+        return False, str(e).strip().splitlines()[0]
+
+
+def _pg_schema(url, create):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP SCHEMA IF EXISTS {PG_SCHEMA} CASCADE'))
+        if create:
+            conn.execute(text(f'CREATE SCHEMA {PG_SCHEMA}'))
+    engine.dispose()
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库性能基准测试')
+    parser.add_argument('--nodes', type=int, default=50, help='模拟节点数')
+    parser.add_argument('--days', type=int, default=14, help='模拟历史天数')
+    parser.add_argument('--repeat', type=int, default=5, help='每项操作的执行次数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--pg-url', default=os.environ.get('BENCH_PG_URL', DEFAULT_PG_URL),
+                        help='PostgreSQL 连接串 (不可连接时跳过)')
+    parser.add_argument('--skip-pg', action='store_true', help='只测试 SQLite')
+    parser.add_argument('--output', default='-', help='结果写入该文件 (默认 "-" 输出到 stdout)')
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform(),
+            'nodes': args.nodes,
+            'days': args.days,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'backends': {},
+    }
+
+    # config 在导入时打印配置文件与数据库模式等信息：与创建应用一样重定向到 stderr，stdout 只输出 JSON 结果
+    with contextlib.redirect_stdout(sys.stderr):
+        from config import Config
+
+    # SQLite: 临时目录中的数据库与归档目录
+    workdir = tempfile.mkdtemp(prefix='nodetool-bench-')
+
+    class SqliteBenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        ARCHIVE_DIR = os.path.join(workdir, 'archive')
+
+    with contextlib.redirect_stdout(sys.stderr):
+        print(f">>> [SQLite] 填充 {args.nodes} 个节点 × {args.days} 天...")
+        try:
+            report['backends']['sqlite'] = run_backend(SqliteBenchConfig, args.nodes, args.days, args.repeat, args.seed)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # PostgreSQL: 可连接时在临时 schema 中运行
+    if args.skip_pg:
+        report['backends']['postgresql'] = {'skipped': '--skip-pg'}
+    else:
+        available, reason = _pg_available(args.pg_url)
+        if not available:
+            print(f">>> [PostgreSQL] 不可用，跳过: {reason}", file=sys.stderr)
+            report['backends']['postgresql'] = {'skipped': reason}
+        else:
+            class PgBenchConfig(Config):
+                SQLALCHEMY_DATABASE_URI = args.pg_url
+                SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'options': f'-csearch_path={PG_SCHEMA}'}}
+                HISTORY_PARTITIONING = 'none'
+                ARCHIVE_DIR = tempfile.mkdtemp(prefix='nodetool-bench-archive-')
+
+            with contextlib.redirect_stdout(sys.stderr):
+                print(f">>> [PostgreSQL] 填充 {args.nodes} 个节点 × {args.days} 天...")
+                _pg_schema(args.pg_url, create=True)
+                try:
+                    report['backends']['postgresql'] = run_backend(PgBenchConfig, args.nodes, args.days, args.repeat, args.seed)
+                finally:
+                    _pg_schema(args.pg_url, create=False)
+                    shutil.rmtree(PgBenchConfig.ARCHIVE_DIR, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output != '-':
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f">>> 结果已写入 {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
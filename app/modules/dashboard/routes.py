@@ -10,6 +10,7 @@ from app.utils.db_manager import (
     delete_node_by_uuid, 
     get_config
 )
+from app.modules.data_core.archive import delete_node_archive
 
 bp = Blueprint('dashboard', __name__, url_prefix='/dashboard', template_folder='templates')
 
@@ -60,6 +61,7 @@ def delete_node_api():
         success = delete_node_by_uuid(uuid)
         
         if success:
+            delete_node_archive(uuid)
             return jsonify({'status': 'success', 'message': '节点及历史数据已删除'})
         else:
             return jsonify({'status': 'error', 'message': '删除失败或节点不存在'}), 500
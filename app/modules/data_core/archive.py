@@ -0,0 +1,401 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta, date
+
+import numpy as np
+from flask import current_app
+
+from app.utils.db_manager import (
+    get_config,
+    get_history_uuids,
+    get_archivable_history,
+    delete_history_by_ids,
+)
+from app.utils.scheduler import scheduler
+from app.modules.data_core.leader import should_stand_down
+from app.modules.data_core.retention import get_retention_days
+
+# ----------------------------------------------------
+# 历史数据归档 (ARCHIVE_ENABLED=1)
+# 早于 ARCHIVE_AFTER_DAYS 天的原始记录移出 history_data，按 节点/月份 写入压缩文件：
+#     <ARCHIVE_DIR>/<uuid>/<YYYYMM>.kma
+# 文件结构: 魔数 'KMA2' + 4 字节索引长度 + JSON 索引 {日期: [偏移, 长度, 行数]} + 每日一个数据块。
+# 每个数据块独立 zlib 压缩，内部按列存放小端 int64/uint16 数组：
+#     时间戳 / 上行 / 下行 做差分编码 (相邻采样的差值很小，压缩率高)，
+#     valid_until 存为相对 timestamp 的偏移 (0 表示未压缩)，delta_up / delta_down 原样保存，
+#     cpu 存为 0.01% 精度的整数。
+# 读取时 mmap 文件，只解压查询日期对应的数据块，不会把整个文件读入内存；
+# 解压后的数据块直接作为 NumPy 数组读取 (np.frombuffer)，按时间二分查找后只转换查询范围内的行。
+# 先写文件 (临时文件 + 原子替换) 再删除数据库记录；中途失败时两边可能短暂重复，读取时按时间戳去重。
+# ----------------------------------------------------
+
+ARCHIVE_MAGIC = b'KMA2'
+# 数据块的列类型 (时间戳, valid_until 偏移, 上行, 下行, 上行增量, 下行增量, cpu)，均为小端序
+BLOCK_DTYPES = ('<i8', '<i8', '<i8', '<i8', '<i8', '<i8', '<u2')
+ARCHIVE_SUFFIX = '.kma'
+DEFAULT_ARCHIVE_AFTER_DAYS = 14
+MIN_ARCHIVE_AFTER_DAYS = 4              # 必须早于补采回溯范围 (默认 72 小时)
+ARCHIVE_FETCH_LIMIT = 50000             # 单次从数据库读取的行数
+ARCHIVE_TIME_BUDGET_SECONDS = 120       # 单轮归档的时间预算 (秒)
+ARCHIVE_INTERVAL_HOURS = 6              # 调度间隔 (时)
+
+CPU_SCALE = 100
+CPU_NONE = 0xFFFF
+EPOCH = datetime(1970, 1, 1)
+
+ArchivedRow = namedtuple('ArchivedRow', 'timestamp valid_until total_up total_down cpu_usage delta_up delta_down')
+
+
+def _log(message):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [Archive] {message}")
+
+
+def is_archive_enabled():
+    return str(get_config('ARCHIVE_ENABLED', 0)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _archive_after_days():
+    """
+    归档天数。必须小于原始数据保留天数，否则过期清理会先于归档删除原始数据：
+    配置不小于保留天数时按 保留天数 - 1 处理；保留天数本身不足以留出归档窗口时返回 None (不归档)。
+    """
+    try:
+        days = int(get_config('ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS))
+    except (ValueError, TypeError):
+        days = DEFAULT_ARCHIVE_AFTER_DAYS
+    days = max(days, MIN_ARCHIVE_AFTER_DAYS)
+
+    retention_days = get_retention_days()
+    if days >= retention_days:
+        if retention_days - 1 < MIN_ARCHIVE_AFTER_DAYS:
+            _log(f"原始数据保留天数 ({retention_days}) 过短，无法在清理之前归档，跳过归档")
+            return None
+        _log(f"归档天数 ({days}) 不小于原始数据保留天数 ({retention_days})，按 {retention_days - 1} 天归档")
+        days = retention_days - 1
+    return days
+
+
+def _archive_root():
+    return current_app.config['ARCHIVE_DIR']
+
+
+def _month_path(uuid, month):
+    return os.path.join(_archive_root(), str(uuid), f"{month.year:04d}{month.month:02d}{ARCHIVE_SUFFIX}")
+
+
+def _to_micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value):
+    return EPOCH + timedelta(microseconds=value)
+
+
+# ---------------- 数据块编解码 ----------------
+
+def _encode_block(rows):
+    """rows: 按时间升序的 ArchivedRow 列表 -> 压缩后的字节串"""
+    micros = np.array([_to_micros(r.timestamp) for r in rows], dtype=np.int64)
+    valid = np.array([_to_micros(r.valid_until) if r.valid_until else 0 for r in rows], dtype=np.int64)
+    total_up = np.array([r.total_up or 0 for r in rows], dtype=np.int64)
+    total_down = np.array([r.total_down or 0 for r in rows], dtype=np.int64)
+    cpu = np.array([
+        CPU_NONE if r.cpu_usage is None else min(CPU_NONE - 1, max(0, int(round(r.cpu_usage * CPU_SCALE))))
+        for r in rows
+    ], dtype=np.int64)
+    columns = (
+        np.diff(micros, prepend=0),
+        np.where(valid != 0, valid - micros, 0),
+        np.diff(total_up, prepend=0),
+        np.diff(total_down, prepend=0),
+        np.array([r.delta_up or 0 for r in rows], dtype=np.int64),
+        np.array([r.delta_down or 0 for r in rows], dtype=np.int64),
+        cpu,
+    )
+    payload = struct.pack('<I', len(rows)) + b''.join(
+        column.astype(dtype).tobytes() for column, dtype in zip(columns, BLOCK_DTYPES)
+    )
+    return zlib.compress(payload, 9)
+
+
+class _Block:
+    """
+    解压后的数据块：各列为 NumPy 数组 (np.frombuffer 直接引用解压后的缓冲区，不逐行解析)，
+    时间戳与累计值在解码时一次性还原。按时间范围查找用二分 (searchsorted)，
+    只有落在查询范围内的行才会转换为 ArchivedRow。
+    """
+
+    def __init__(self, data):
+        payload = zlib.decompress(data)
+        count = struct.unpack_from('<I', payload)[0]
+        columns = []
+        offset = 4
+        for dtype in BLOCK_DTYPES:
+            column = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+            columns.append(column)
+            offset += column.nbytes
+        ts, self.valid, up, down, self.delta_up, self.delta_down, self.cpu = columns
+        self.micros = np.cumsum(ts)
+        self.total_up = np.cumsum(up)
+        self.total_down = np.cumsum(down)
+
+    def search(self, value, side='left'):
+        """时间 value 在块内的插入位置 (side 同 np.searchsorted)"""
+        return int(np.searchsorted(self.micros, _to_micros(value), side))
+
+    def rows(self, lo=0, hi=None):
+        """[lo, hi) 范围内的行 (ArchivedRow 列表)"""
+        micros = self.micros[lo:hi]
+        valid = self.valid[lo:hi]
+        timestamps = micros.astype('datetime64[us]').astype(object)
+        valid_untils = (micros + valid).astype('datetime64[us]').astype(object)
+        cpu = self.cpu[lo:hi]
+        return [
+            ArchivedRow(ts, until if v else None, up, down, None if c == CPU_NONE else c / CPU_SCALE, du, dd)
+            for ts, until, v, up, down, c, du, dd in zip(
+                timestamps, valid_untils, valid.tolist(), self.total_up[lo:hi].tolist(),
+                self.total_down[lo:hi].tolist(), cpu.tolist(),
+                self.delta_up[lo:hi].tolist(), self.delta_down[lo:hi].tolist(),
+            )
+        ]
+
+
+# ---------------- 月文件读写 ----------------
+
+class _MonthFile:
+    """以 mmap 方式打开的月归档文件，按需解压某一天的数据块"""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        if self._map[:4] != ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的归档文件: {path}")
+        index_len = struct.unpack_from('<I', self._map, 4)[0]
+        self.index = json.loads(self._map[8:8 + index_len].decode('utf-8'))
+
+    def days(self):
+        return sorted(self.index)
+
+    def read_day(self, day_key):
+        """解压某一天的数据块 (_Block)"""
+        offset, length, _ = self.index[day_key]
+        return _Block(memoryview(self._map)[offset:offset + length])
+
+    def raw_blocks(self):
+        return {key: self._map[offset:offset + length] for key, (offset, length, _) in self.index.items()}
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_month(uuid, month):
+    path = _month_path(uuid, month)
+    if not os.path.exists(path):
+        return None
+    return _MonthFile(path)
+
+
+def _write_month(path, blocks):
+    """blocks: {日期: (压缩块, 行数)}，写入临时文件后原子替换"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    keys = sorted(blocks)
+    # 索引长度依赖偏移量本身，先按占位偏移估算长度，再按真实偏移重算直到稳定
+    index = {key: [0, len(blocks[key][0]), blocks[key][1]] for key in keys}
+    while True:
+        header = json.dumps(index, separators=(',', ':')).encode('utf-8')
+        offset = 8 + len(header)
+        changed = False
+        for key in keys:
+            if index[key][0] != offset:
+                index[key][0] = offset
+                changed = True
+            offset += index[key][1]
+        if not changed:
+            break
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(ARCHIVE_MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for key in keys:
+            f.write(blocks[key][0])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _merge_into_month(uuid, month, rows_by_day):
+    """
+    把新归档的行并入月文件：未涉及的日期原样保留压缩块，涉及的日期解压后按时间戳合并。
+    """
+    path = _month_path(uuid, month)
+    blocks = {}
+    existing = _open_month(uuid, month)
+    try:
+        if existing:
+            for key, data in existing.raw_blocks().items():
+                if key in rows_by_day:
+                    merged = {r.timestamp: r for r in _Block(data).rows()}
+                    merged.update({r.timestamp: r for r in rows_by_day.get(key, [])})
+                    rows_by_day[key] = [merged[ts] for ts in sorted(merged)]
+                else:
+                    blocks[key] = (bytes(data), existing.index[key][2])
+    finally:
+        if existing:
+            existing.close()
+
+    for key, rows in rows_by_day.items():
+        blocks[key] = (_encode_block(rows), len(rows))
+    _write_month(path, blocks)
+
+
+# ---------------- 查询接口 ----------------
+
+def _months_between(start, end):
+    month = date(start.year, start.month, 1)
+    while month <= end.date():
+        yield month
+        month = date(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+
+def read_archived_rows(uuid, start, end):
+    """[读] 归档中 start <= timestamp <= end 的记录，按时间升序"""
+    rows = []
+    first_day, last_day = start.date().isoformat(), end.date().isoformat()
+    for month in _months_between(start, end):
+        month_file = _open_month(uuid, month)
+        if month_file is None:
+            continue
+        with month_file:
+            for key in month_file.days():
+                if first_day <= key <= last_day:
+                    block = month_file.read_day(key)
+                    rows.extend(block.rows(block.search(start, 'left'), block.search(end, 'right')))
+    return rows
+
+
+def last_archived_before(uuid, before, months_back=1):
+    """[读] 归档中 timestamp < before 的最后一条记录 (最多向前查找 months_back 个月)"""
+    month = date(before.year, before.month, 1)
+    before_key = before.date().isoformat()
+    for _ in range(months_back + 1):
+        month_file = _open_month(uuid, month)
+        if month_file is not None:
+            with month_file:
+                for key in reversed(month_file.days()):
+                    if key > before_key:
+                        continue
+                    block = month_file.read_day(key)
+                    position = block.search(before, 'left')
+                    if position:
+                        return block.rows(position - 1, position)[0]
+        month = date(month.year - (month.month == 1), (month.month - 2) % 12 + 1, 1)
+    return None
+
+
+def has_archived_day(uuid, day):
+    """[读] 某节点某天是否有归档数据"""
+    month_file = _open_month(uuid, date(day.year, day.month, 1))
+    if month_file is None:
+        return False
+    with month_file:
+        return day.isoformat() in month_file.index
+
+
+def delete_node_archive(uuid):
+    """[写] 删除节点时一并删除其归档文件"""
+    shutil.rmtree(os.path.join(_archive_root(), str(uuid)), ignore_errors=True)
+
+
+# ---------------- 归档任务 ----------------
+
+def _archive_node(uuid, before, deadline):
+    """
+    归档一个节点早于 before 的记录，返回 (归档的行数, 是否已全部归档)；删除数据库记录失败时行数为 None。
+    每个数据块 (ARCHIVE_FETCH_LIMIT 行) 之前检查时间预算 deadline (time.monotonic())，超时的部分留给下一轮。
+    """
+    archived = 0
+    while time.monotonic() < deadline and not should_stand_down():
+        rows = get_archivable_history(uuid, before, ARCHIVE_FETCH_LIMIT)
+        if not rows:
+            return archived, True
+
+        grouped = {}
+        for r in rows:
+            month = date(r.timestamp.year, r.timestamp.month, 1)
+            grouped.setdefault(month, {}).setdefault(r.timestamp.date().isoformat(), []).append(
+                ArchivedRow(r.timestamp, r.valid_until, r.total_up, r.total_down, r.cpu_usage,
+                            r.delta_up, r.delta_down)
+            )
+        for month, rows_by_day in grouped.items():
+            _merge_into_month(uuid, month, rows_by_day)
+
+        deleted = delete_history_by_ids([r.id for r in rows])
+        if deleted is None:
+            return None, False
+        archived += deleted
+        if len(rows) < ARCHIVE_FETCH_LIMIT:
+            return archived, True
+    return archived, False
+
+
+def archive_old_history(time_budget=ARCHIVE_TIME_BUDGET_SECONDS):
+    """执行一轮归档 (需要 app 上下文)，返回 {'nodes': 节点数, 'rows': 行数, 'completed': 是否全部完成}"""
+    result = {'nodes': 0, 'rows': 0, 'completed': True}
+    archive_after_days = _archive_after_days()
+    if archive_after_days is None:
+        return result
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    before = today - timedelta(days=archive_after_days)
+    deadline = time.monotonic() + time_budget
+
+    for uuid in get_history_uuids():
+        if time.monotonic() >= deadline or should_stand_down():
+            result['completed'] = False
+            break
+        try:
+            archived, finished = _archive_node(uuid, before, deadline)
+        except Exception as e:
+            _log(f"节点 {uuid} 归档失败: {e}")
+            continue
+        if not finished:
+            result['completed'] = False
+        if archived:
+            result['nodes'] += 1
+            result['rows'] += archived
+
+    if result['rows']:
+        _log(f"已归档 {result['nodes']} 个节点的 {result['rows']} 条记录 (早于 {before.date()})"
+             + ("" if result['completed'] else "，剩余部分下一轮继续"))
+    return result
+
+
+def run_periodic_archive():
+    """[定时任务] 任务入口 (APScheduler 调用)，未开启归档时直接返回"""
+    if hasattr(scheduler, 'app') and scheduler.app:
+        with scheduler.app.app_context():
+            if is_archive_enabled():
+                archive_old_history()
+    else:
+        print(">>> [Error] Scheduler 未绑定 app 实例，无法运行归档任务。")
@@ -0,0 +1,243 @@
+import math
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from app.utils.db_manager import (
+    get_config,
+    find_history_gaps,
+    bulk_add_history,
+    create_backfill_job,
+    get_unfinished_backfill_job,
+    get_pending_backfill_tasks,
+    update_backfill_tasks,
+    finish_backfill_job,
+)
+from app.modules.data_core.komari_client import parse_komari_timestamp
+from app.modules.data_core.leader import should_stand_down
+
+# ----------------------------------------------------
+# 历史数据补采 (Backfill)
+# 程序停机 (升级/崩溃/容器重启) 期间 history_data 会出现空洞。
+# 补采任务找出每个节点的缺口，从 Komari 的历史记录接口
+# /api/records/load?uuid=<uuid>&hours=<n> 拉取数据补齐。
+# 每个缺口是一条 BackfillTask，完成后立即落库作为断点，中断后可以续跑。
+# ----------------------------------------------------
+
+DEFAULT_BACKFILL_LOOKBACK_HOURS = 72    # 向前检查缺口的时间范围 (小时)
+DEFAULT_BACKFILL_CONCURRENCY = 4        # 同时请求 Komari 的节点数
+BACKFILL_REQUEST_TIMEOUT = 60           # 单次历史记录请求超时 (秒)
+GAP_INTERVAL_MULTIPLIER = 3             # 相邻记录间隔超过 N 倍采集间隔视为缺口
+BACKFILL_INTERVAL_MINUTES = 1           # 活跃采集器检查待执行补采任务的间隔 (分)
+
+# 同一进程内只允许一个补采线程；补采只在持有采集器租约的进程中执行
+_backfill_lock = threading.Lock()
+_backfill_thread = None
+
+
+def _log(message):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [Backfill] {message}")
+
+
+def _get_int_config(key, default):
+    try:
+        value = int(get_config(key, default))
+        return value if value > 0 else default
+    except (ValueError, TypeError):
+        return default
+
+
+def _record_value(record, flat_key, nested_key, default=0):
+    """Komari 历史记录字段兼容：优先取扁平字段 (net_total_up)，其次取嵌套字段 (network.totalUp)"""
+    if flat_key in record and record[flat_key] is not None:
+        return record[flat_key]
+    data = record
+    try:
+        for key in nested_key.split('.'):
+            data = data[key]
+        return data
+    except (KeyError, TypeError):
+        return default
+
+
+def _parse_records_payload(payload):
+    """从 /api/records/load 的响应中取出记录列表"""
+    data = payload.get('data') if isinstance(payload, dict) else None
+    if isinstance(data, dict):
+        data = data.get('records', [])
+    return data if isinstance(data, list) else []
+
+
+def _fetch_node_records(client, uuid, hours):
+    """[工作线程] 拉取单个节点最近 hours 小时的历史记录 (不访问数据库)"""
+    payload = client.get_json(
+        f'/api/records/load?uuid={uuid}&hours={hours}',
+        timeout=BACKFILL_REQUEST_TIMEOUT,
+    )
+    points = []
+    for record in _parse_records_payload(payload):
+        ts = parse_komari_timestamp(record.get('time') or record.get('updated_at'))
+        if ts is None:
+            continue
+        points.append({
+            'uuid': uuid,
+            'timestamp': ts,
+            'total_up': _record_value(record, 'net_total_up', 'network.totalUp'),
+            'total_down': _record_value(record, 'net_total_down', 'network.totalDown'),
+            'cpu_usage': _record_value(record, 'cpu', 'cpu.usage', 0.0),
+        })
+    return points
+
+
+def detect_gaps():
+    """按当前采集间隔和回溯范围查找缺口"""
+    lookback_hours = _get_int_config('BACKFILL_LOOKBACK_HOURS', DEFAULT_BACKFILL_LOOKBACK_HOURS)
+    interval_minutes = _get_int_config('ACQUISITION_INTERVAL_MINUTES', 5)
+    since = datetime.now() - timedelta(hours=lookback_hours)
+    min_gap_seconds = interval_minutes * 60 * GAP_INTERVAL_MULTIPLIER
+    return find_history_gaps(since, min_gap_seconds)
+
+
+def run_backfill_job(job_id):
+    """
+    执行 (或续跑) 指定的补采任务。需要在 app 上下文中调用。
+    同一节点的多个缺口合并为一次请求，HTTP 请求在线程池中并发，数据库写入留在当前线程。
+    """
+    # 延迟导入，避免与 komari_api 循环引用
+    from app.modules.data_core.komari_api import get_komari_client
+
+    client = get_komari_client()
+    concurrency = _get_int_config('BACKFILL_CONCURRENCY', DEFAULT_BACKFILL_CONCURRENCY)
+    lookback_hours = _get_int_config('BACKFILL_LOOKBACK_HOURS', DEFAULT_BACKFILL_LOOKBACK_HOURS)
+
+    tasks_by_node = defaultdict(list)
+    for task in get_pending_backfill_tasks(job_id):
+        tasks_by_node[task.uuid].append((task.id, task.gap_start, task.gap_end))
+
+    if not tasks_by_node:
+        finish_backfill_job(job_id, 'completed', '没有待补采的缺口')
+        return
+
+    _log(f"任务 #{job_id}: {sum(len(t) for t in tasks_by_node.values())} 个缺口 / {len(tasks_by_node)} 个节点")
+
+    now = datetime.now()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='komari-backfill') as executor:
+        futures = {}
+        for uuid, tasks in tasks_by_node.items():
+            earliest = min(start for _, start, _ in tasks)
+            hours = min(lookback_hours, math.ceil((now - earliest).total_seconds() / 3600) + 1)
+            futures[executor.submit(_fetch_node_records, client, uuid, hours)] = uuid
+
+        for future in as_completed(futures):
+            if should_stand_down():
+                # 失去采集器租约：未完成的缺口保持待补采状态，由接管的采集器续跑
+                executor.shutdown(wait=False, cancel_futures=True)
+                _log(f"任务 #{job_id} 已暂停 (失去采集器租约)")
+                return
+            uuid = futures[future]
+            tasks = tasks_by_node[uuid]
+            task_ids = [task_id for task_id, _, _ in tasks]
+            try:
+                points = future.result()
+            except Exception as e:
+                _log(f"节点 {uuid} 拉取历史记录失败: {e}")
+                update_backfill_tasks(job_id, task_ids, 'failed', error=str(e))
+                continue
+
+            # 只保留落在缺口内部的点 (两端是已存在的记录)
+            recovered = [
+                p for p in points
+                if any(start < p['timestamp'] < end for _, start, end in tasks)
+            ]
+            if recovered and not bulk_add_history(recovered):
+                update_backfill_tasks(job_id, task_ids, 'failed', error='写入数据库失败')
+                continue
+            update_backfill_tasks(job_id, task_ids, 'done', inserted=len(recovered))
+
+    finish_backfill_job(job_id, 'completed')
+    _log(f"任务 #{job_id} 完成")
+
+
+def _backfill_worker(app, job_id):
+    global _backfill_thread
+    try:
+        with app.app_context():
+            try:
+                run_backfill_job(job_id)
+            except Exception as e:
+                _log(f"任务 #{job_id} 异常终止: {e}")
+                finish_backfill_job(job_id, 'failed', str(e)[:255])
+    finally:
+        with _backfill_lock:
+            _backfill_thread = None
+
+
+def is_backfill_running():
+    with _backfill_lock:
+        return _backfill_thread is not None
+
+
+def wait_for_backfill(timeout=None):
+    """等待正在运行的补采线程结束，返回是否已结束。"""
+    with _backfill_lock:
+        thread = _backfill_thread
+    if thread is not None:
+        thread.join(timeout)
+        return not thread.is_alive()
+    return True
+
+
+def enqueue_backfill():
+    """
+    提交补采任务 (页面/接口调用)：存在未完成的任务时直接返回它，否则检测缺口并创建新任务。
+    只写入任务记录，不在当前进程执行，由持有采集器租约的进程 (run_periodic_backfill) 执行，
+    避免 Web 进程与活跃采集器同时处理同一批缺口。需要在 app 上下文中调用。
+    返回 (job_id, created)；没有缺口时返回 (None, False)。
+    """
+    with _backfill_lock:
+        job = get_unfinished_backfill_job()
+        if job is not None:
+            return job.id, False
+        gaps = detect_gaps()
+        if not gaps:
+            return None, False
+        job = create_backfill_job(gaps)
+        if job is None:
+            return None, False
+        return job.id, True
+
+
+def start_backfill(app):
+    """
+    [仅活跃采集器] 在后台线程中执行未完成的补采任务。需要在 app 上下文中调用。
+    返回 (job_id, started)；没有未完成的任务或已有补采线程在运行时 started 为 False。
+    """
+    global _backfill_thread
+    with _backfill_lock:
+        job = get_unfinished_backfill_job()
+        if _backfill_thread is not None or job is None:
+            return (job.id if job else None), False
+
+        _backfill_thread = threading.Thread(
+            target=_backfill_worker, args=(app, job.id),
+            name='komari-backfill', daemon=True,
+        )
+        _backfill_thread.start()
+        return job.id, True
+
+
+def run_periodic_backfill():
+    """
+    [调度任务] 任务入口：执行已提交、尚未完成的补采任务 (APScheduler 调用)。
+    只在活跃采集器中注册，页面提交的任务最迟在一个周期后开始执行。
+    """
+    from app.utils.scheduler import scheduler
+
+    if hasattr(scheduler, 'app') and scheduler.app:
+        with scheduler.app.app_context():
+            job_id, started = start_backfill(scheduler.app)
+            if started:
+                _log(f"开始执行补采任务 #{job_id}")
+    else:
+        print(">>> [Error] Scheduler 未绑定 app 实例，无法运行补采任务。")
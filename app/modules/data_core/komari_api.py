@@ -1,25 +1,50 @@
 import requests
 import json
-from datetime import datetime
-from flask import Blueprint, jsonify, current_app
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from datetime import datetime, timedelta
+from flask import Blueprint, jsonify, current_app, request
+from flask_login import login_required
 
 # ----------------------------------------------------
 # 从 db_manager 导入所有需要的数据库操作接口
 # ----------------------------------------------------
 from app.utils.db_manager import (
     get_config,          # 用于读取 Komari URL/Token
-    upsert_node,         # 用于同步节点列表
+    bulk_upsert_nodes,   # 用于同步节点列表 (单事务批量写入)
+    get_total_nodes,     # 用于校验节点表是否被本地修改 (如删除节点)
+    get_node,            # 用于运行报告中显示节点名称
     get_all_nodes,       # 用于获取需要监控的节点UUID
-    bulk_add_history     # 用于批量写入历史数据 (性能优化)
+    bulk_add_history,    # 用于批量写入历史数据 (性能优化)
+    get_latest_history_timestamps, # 用于跳过已入库的采样点
+    get_backfill_job,              # 用于查询补采任务进度
+    get_latest_backfill_job,
+    add_collector_run,             # 用于记录每次采集的运行报告
+    get_collector_runs
 )
 
 # [新增] 导入全局 scheduler 对象，用于获取绑定的 app 实例
 from app.utils.scheduler import scheduler
 
+# 复用连接池的 Komari 客户端 (重试 + 节点熔断)
+from app.modules.data_core.komari_client import KomariClient, CircuitOpenError, parse_komari_timestamp
+# 自适应轮询计划与全局限速
+from app.modules.data_core.poll_planner import AdaptivePollPlanner, RateLimiter
+
 # ----------------------------------------------------
 # 基础配置和辅助函数
 # ----------------------------------------------------
 
+# 并发采集参数的默认值 (可在系统设置中覆盖)
+DEFAULT_SNAPSHOT_CONCURRENCY = 16        # 同时请求的节点数上限
+DEFAULT_SNAPSHOT_NODE_TIMEOUT = 15       # 单个节点请求超时 (秒)
+DEFAULT_SNAPSHOT_CYCLE_DEADLINE = 240    # 单轮采集总时限 (秒)，需小于采集间隔
+DEFAULT_POLL_RATE_LIMIT = 20             # 全局每秒请求数上限 (0 表示不限速)
+DEFAULT_ADAPTIVE_MIN_INTERVAL = 1        # 自适应模式最小采集间隔 (分)，同时也是调度 tick
+DEFAULT_ADAPTIVE_MAX_INTERVAL = 30       # 自适应模式最大采集间隔 (分)
+DEFAULT_COLLECTOR_RUN_RETENTION_DAYS = 7 # 采集运行记录保留天数
+
 def _get_komari_base_url():
     """
     读取 Komari API 的基础 URL。（内部调用 get_config）
@@ -43,6 +68,58 @@ def _get_komari_headers():
     }
     return headers
 
+# 进程内共享的客户端实例：连接池与熔断状态需要跨采集周期保留
+_komari_client = None
+# 自适应轮询计划 (各节点的下次采集时间) 与全局限速器
+_poll_planner = AdaptivePollPlanner()
+_rate_limiter = None
+# 上一次成功同步的 /api/nodes 数据指纹 (payload hash, 节点数)，未变化时跳过整个同步
+_node_sync_fingerprint = None
+
+def get_komari_client():
+    """
+    获取 (并按需创建) 共享的 KomariClient。
+    每次调用只读取一次配置，刷新客户端缓存的 base_url / headers / 连接池大小，
+    采集循环内部不再逐节点访问数据库。
+    """
+    global _komari_client
+    base_url = _get_komari_base_url()
+    headers = _get_komari_headers()
+    pool_size = _get_int_config('SNAPSHOT_CONCURRENCY', DEFAULT_SNAPSHOT_CONCURRENCY)
+
+    if _komari_client is None:
+        _komari_client = KomariClient(base_url, headers, pool_size=pool_size)
+    else:
+        _komari_client.configure(base_url, headers, pool_size)
+    return _komari_client
+
+def _get_rate_limiter():
+    """按 POLL_RATE_LIMIT_PER_SECOND 获取全局限速器 (配置变化时重建)"""
+    global _rate_limiter
+    rate = _get_int_config('POLL_RATE_LIMIT_PER_SECOND', DEFAULT_POLL_RATE_LIMIT, minimum=0)
+    if _rate_limiter is None or _rate_limiter.rate != rate:
+        _rate_limiter = RateLimiter(rate)
+    return _rate_limiter
+
+def is_adaptive_polling():
+    return str(get_config('POLLING_MODE', 'fixed')).strip().lower() == 'adaptive'
+
+def get_snapshot_tick_minutes():
+    """快照任务的调度间隔：固定模式为采集间隔，自适应模式为最小间隔 (tick)"""
+    if is_adaptive_polling():
+        return _get_int_config('ADAPTIVE_MIN_INTERVAL_MINUTES', DEFAULT_ADAPTIVE_MIN_INTERVAL)
+    return _get_int_config('ACQUISITION_INTERVAL_MINUTES', 5)
+
+def _get_int_config(key, default, minimum=1):
+    """
+    读取整数型配置项，格式错误或小于下限时回退到默认值。
+    """
+    try:
+        value = int(get_config(key, default))
+        return value if value >= minimum else default
+    except (ValueError, TypeError):
+        return default
+
 def _extract_nested_value(data, keys, default=0.0):
     """
     辅助函数：安全地从嵌套字典中提取值 (例如 'cpu.usage')
@@ -59,29 +136,53 @@ def _extract_nested_value(data, keys, default=0.0):
 # 核心功能实现
 # =========================================================
 
-def sync_node_list():
+def sync_node_list(stats=None):
     """
     [功能一：同步节点列表]
     从远程 API 获取节点列表并更新到本地数据库。
+    /api/nodes 返回内容与上次相同且本地节点数未变时，整个同步为空操作；
+    否则单事务批量写入新增/变化的节点。
+    stats: 可选的字典，用于回传本次同步的运行统计。
     """
-    base_url = _get_komari_base_url()
-    url = f"{base_url}/api/nodes"
-    headers = _get_komari_headers()
+    global _node_sync_fingerprint
+    stats = stats if stats is not None else {}
+    client = get_komari_client()
 
     print(f"[{datetime.now().strftime('%H:%M:%S')}] 尝试同步 Komari 节点列表...")
     
     try:
-        response = requests.get(url, headers=headers, timeout=60)
-        response.raise_for_status() 
-        data = response.json()
+        request_started = time.monotonic()
+        try:
+            data = client.get_nodes(timeout=60)
+        finally:
+            stats['node_latencies'] = {'/api/nodes': int((time.monotonic() - request_started) * 1000)}
 
         if data.get('status') == 'success':
-            node_count = 0
-            for node_info in data.get('data', []):
-                upsert_node(node_info) # 数据库写操作
-                node_count += 1
+            node_infos = data.get('data', [])
+            payload_hash = hashlib.sha256(
+                json.dumps(node_infos, sort_keys=True, ensure_ascii=False).encode('utf-8')
+            ).hexdigest()
+            node_count = len({info.get('uuid') for info in node_infos if info.get('uuid')})
+            stats['node_count'] = node_count
+
+            # 本地节点数不一致 (例如在仪表盘删除了节点) 时仍需同步，恢复被删除的节点
+            fingerprint = (payload_hash, node_count)
+            if fingerprint == _node_sync_fingerprint and get_total_nodes() == node_count:
+                stats['skipped_count'] = node_count
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] 节点列表未变化，跳过同步。")
+                return True
+
+            write_started = time.monotonic()
+            written = bulk_upsert_nodes(node_infos) # 数据库写操作
+            stats['db_write_ms'] = int((time.monotonic() - write_started) * 1000)
+            if written is None:
+                stats['failure_count'] = node_count
+                return False
+            _node_sync_fingerprint = fingerprint
+            stats['success_count'] = node_count
+            stats['records_written'] = written
             
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] 成功同步 {node_count} 个节点信息。")
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 成功同步 {node_count} 个节点信息 (写入 {written} 个)。")
             return True
         else:
             print(f"[{datetime.now().strftime('%H:%M:%S')}] Komari API 返回错误: {data.get('message')}")
@@ -97,60 +198,222 @@ def sync_node_list():
         print(f"[{datetime.now().strftime('%H:%M:%S')}] 同步节点列表发生未知错误: {e}")
         return False
 
-def fetch_and_save_snapshots():
+def _build_snapshot_record(uuid, snapshot):
+    """
+    将 Komari 返回的单个快照点转换为 HistoryData 写入字典。
+    timestamp 使用 Komari 提供的采样时间 (updated_at)，无法解析时为 None (写库时补当前时间)。
+    """
+    return {
+        'uuid': uuid,
+        'timestamp': parse_komari_timestamp(snapshot.get('updated_at')),
+        'total_up': _extract_nested_value(snapshot, 'network.totalUp'),
+        'total_down': _extract_nested_value(snapshot, 'network.totalDown'),
+        'cpu_usage': _extract_nested_value(snapshot, 'cpu.usage'),
+    }
+
+def _fetch_node_snapshot(client, uuid, timeout, since=None, limiter=None, latencies=None):
+    """
+    [工作线程] 请求单个节点的最近快照窗口，返回窗口内所有待写入的记录。
+    - since: 该节点已入库的最新时间，早于等于它的采样点直接跳过。
+    - 采样点都缺少时间戳时无法去重，只保留最新一个点 (与旧逻辑一致)。
+    - limiter: 全局限速器，请求前先取令牌。
+    - latencies: 用于记录该节点 HTTP 耗时 (毫秒) 的共享字典，失败的请求同样记录。
+    注意：此函数在线程池中运行，不能访问数据库 (无 app 上下文)。
+    """
+    if limiter is not None:
+        limiter.acquire()
+    request_started = time.monotonic()
+    try:
+        data = client.get_recent(uuid, timeout=timeout)
+    finally:
+        if latencies is not None:
+            latencies[uuid] = int((time.monotonic() - request_started) * 1000)
+
+    snapshot_data = data.get('data', [])
+    if not snapshot_data:
+        return []
+
+    records = [_build_snapshot_record(uuid, snapshot) for snapshot in snapshot_data]
+    records = [r for r in records if r['timestamp'] is not None]
+    if not records:
+        return [_build_snapshot_record(uuid, snapshot_data[-1])]
+
+    if since is not None:
+        records = [r for r in records if r['timestamp'] > since]
+    return records
+
+def fetch_and_save_snapshots(stats=None, only_uuids=None, force=False):
     """
     [功能二：获取节点快照]
-    遍历所有节点，获取实时状态并存入历史记录表。
+    并发请求所有节点的最近快照窗口，窗口内的每个采样点按 (uuid, 源时间戳) 去重后
+    一次性存入历史记录表，因此较长的采集间隔也能保留分钟级的历史。
+    - SNAPSHOT_CONCURRENCY: 并发上限 (设为 1 即退化为逐个请求)
+    - SNAPSHOT_NODE_TIMEOUT_SECONDS: 单个节点的请求超时
+    - SNAPSHOT_CYCLE_DEADLINE_SECONDS: 整轮时限，超时未返回的节点本轮直接放弃
+    - POLL_RATE_LIMIT_PER_SECOND: 全局请求速率上限
+    - POLLING_MODE=adaptive: 每个 tick 只采集到期的节点，采集后按流量活跃度重新计算间隔
+    处于熔断冷却期的节点会被直接跳过。
+    stats: 可选的字典，用于回传本轮的运行统计 (节点数、成功/失败数、各节点耗时、写库耗时)。
+    only_uuids: 只刷新指定节点 (手动刷新使用)，此时忽略自适应计划，立即采集。
+    force: 忽略自适应计划，立即采集全部节点 (手动全量刷新使用)。
     """
-    base_url = _get_komari_base_url()
+    stats = stats if stats is not None else {}
+    client = get_komari_client()
+    concurrency = _get_int_config('SNAPSHOT_CONCURRENCY', DEFAULT_SNAPSHOT_CONCURRENCY)
+    node_timeout = _get_int_config('SNAPSHOT_NODE_TIMEOUT_SECONDS', DEFAULT_SNAPSHOT_NODE_TIMEOUT)
+    cycle_deadline = _get_int_config('SNAPSHOT_CYCLE_DEADLINE_SECONDS', DEFAULT_SNAPSHOT_CYCLE_DEADLINE)
+    limiter = _get_rate_limiter()
+    adaptive = is_adaptive_polling() and not force
     
-    # 1. 从数据库获取所有活动的节点 UUID
+    # 1. 从数据库获取所有活动的节点 UUID (在主线程中完成，工作线程不碰数据库)
     nodes = get_all_nodes() 
+    if only_uuids is not None:
+        wanted = set(only_uuids)
+        nodes = [node for node in nodes if node.uuid in wanted]
+        adaptive = False
     if not nodes:
+        stats['idle'] = True
         return
 
+    open_circuits = set(client.open_circuits())
+    candidates = [node for node in nodes if node.uuid not in open_circuits]
+    skipped = len(nodes) - len(candidates)
+    stats['skipped_count'] = skipped
+    if skipped:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {skipped} 个节点处于熔断冷却期，本轮跳过。")
+
+    if adaptive:
+        tick_seconds = _get_int_config('ADAPTIVE_MIN_INTERVAL_MINUTES', DEFAULT_ADAPTIVE_MIN_INTERVAL) * 60
+        # 本 tick 的请求预算：速率上限 × tick 时长 (留 20% 余量)，超出的节点顺延到下个 tick
+        budget = int(limiter.rate * tick_seconds * 0.8) if limiter.rate > 0 else None
+        cycle_deadline = min(cycle_deadline, tick_seconds)
+        _poll_planner.forget_missing({node.uuid for node in nodes})
+        candidates = _poll_planner.due_nodes(candidates, datetime.now(), limit=budget)
+
+    nodes_by_uuid = {node.uuid: node for node in candidates}
+    uuids = list(nodes_by_uuid)
+    stats['node_count'] = len(uuids)
+    if not uuids:
+        # 本 tick 没有到期 (或未熔断) 的节点，没有发出任何请求
+        stats['idle'] = True
+        return
+
+    # 各节点已入库的最新时间 (一次查询)，工作线程据此只返回新的采样点
+    latest_timestamps = get_latest_history_timestamps()
+
     records_to_save = []
+    records_by_uuid = {}
+    latencies = {}
+    failures = 0
+    started_at = time.monotonic()
     
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] 开始获取 {len(nodes)} 个节点的快照数据...")
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 开始获取 {len(uuids)} 个节点的快照数据 (并发 {concurrency})...")
 
-    for node in nodes:
-        uuid = node.uuid
-        url = f"{base_url}/api/recent/{uuid}"
-        headers = _get_komari_headers()
-
-        try:
-            response = requests.get(url, headers=headers, timeout=60)
-            response.raise_for_status()
-            data = response.json()
-            
-            snapshot_data = data.get('data', [])
-            if not snapshot_data:
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(uuids)), thread_name_prefix='komari-snapshot')
+    futures = {
+        executor.submit(
+            _fetch_node_snapshot, client, uuid, node_timeout,
+            latest_timestamps.get(uuid), limiter, latencies
+        ): uuid
+        for uuid in uuids
+    }
+    try:
+        for future in as_completed(futures, timeout=cycle_deadline):
+            uuid = futures[future]
+            try:
+                records = future.result()
+                records_by_uuid[uuid] = records
+                records_to_save.extend(records)
+            except CircuitOpenError:
                 continue
+            except Exception as e:
+                # 单个节点失败不影响其他节点
+                failures += 1
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] 获取节点 {uuid} 快照失败: {e}")
+    except FuturesTimeoutError:
+        pending = sum(1 for f in futures if not f.done())
+        failures += pending
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 本轮采集超过时限 {cycle_deadline}s，放弃 {pending} 个未完成节点。")
+    finally:
+        # 不等待仍在进行的请求，未开始的任务直接取消
+        executor.shutdown(wait=False, cancel_futures=True)
 
-            # 取最新的一个快照点
-            latest_snapshot = snapshot_data[-1] 
+    # 自适应模式：根据本轮结果安排每个节点的下次采集时间
+    if adaptive:
+        _reschedule_nodes(nodes_by_uuid, records_by_uuid)
 
-            record_info = {
-                'uuid': uuid,
-                'total_up': _extract_nested_value(latest_snapshot, 'network.totalUp'),
-                'total_down': _extract_nested_value(latest_snapshot, 'network.totalDown'),
-                'cpu_usage': _extract_nested_value(latest_snapshot, 'cpu.usage'),
-            }
-            records_to_save.append(record_info)
-
-        except Exception as e:
-            # 单个节点失败不影响其他节点
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] 获取节点 {uuid} 快照失败: {e}")
+    stats['success_count'] = len(records_by_uuid)
+    stats['failure_count'] = failures
+    stats['node_latencies'] = dict(latencies)
 
     # 2. 批量写入数据库
     if records_to_save:
-        bulk_add_history(records_to_save) 
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 成功批量写入 {len(records_to_save)} 条历史快照数据。")
+        write_started = time.monotonic()
+        written = bulk_add_history(records_to_save)
+        stats['db_write_ms'] = int((time.monotonic() - write_started) * 1000)
+        if not written:
+            # 写入失败已回滚：本轮没有任何数据入库
+            stats['records_written'] = 0
+            stats['error'] = f'写入 {len(records_to_save)} 条历史快照失败 (已回滚)，详见日志'
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 批量写入 {len(records_to_save)} 条历史快照失败，本轮数据未入库。")
+            return False
+        stats['records_written'] = len(records_to_save)
+        elapsed = time.monotonic() - started_at
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 成功批量写入 {len(records_to_save)} 条历史快照数据 (耗时 {elapsed:.1f}s)。")
+
+def _reschedule_nodes(nodes_by_uuid, records_by_uuid):
+    """[自适应模式] 为本轮涉及的节点计算下一次采集时间"""
+    now = datetime.now()
+    base_interval = _get_int_config('ACQUISITION_INTERVAL_MINUTES', 5) * 60
+    min_interval = _get_int_config('ADAPTIVE_MIN_INTERVAL_MINUTES', DEFAULT_ADAPTIVE_MIN_INTERVAL) * 60
+    max_interval = _get_int_config('ADAPTIVE_MAX_INTERVAL_MINUTES', DEFAULT_ADAPTIVE_MAX_INTERVAL) * 60
+    max_interval = max(max_interval, min_interval)
+
+    for uuid, node in nodes_by_uuid.items():
+        _poll_planner.reschedule(
+            uuid, records_by_uuid.get(uuid, []), now,
+            base_interval, min_interval, max_interval,
+            traffic_limit=node.traffic_limit,
+        )
 
 # ----------------------------------------------------
 # 定时/手动任务入口 (核心修改部分)
 # ----------------------------------------------------
 
+def _run_and_record(job, func):
+    """执行一次采集任务，并把运行报告写入 collector_runs (需要 app 上下文)"""
+    stats = {}
+    error = None
+    started_at = datetime.now()
+    started = time.monotonic()
+    try:
+        result = func(stats)
+        if result is False:
+            error = stats.get('error') or '同步失败，详见日志'
+    except Exception as e:
+        error = str(e)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {job} 任务异常: {e}")
+
+    # 自适应模式下大部分 tick 没有到期的节点：没有发出任何请求且没有出错时不记录，避免运行记录被空 tick 淹没
+    if error is None and stats.get('idle'):
+        return
+
+    retention_days = _get_int_config('COLLECTOR_RUN_RETENTION_DAYS', DEFAULT_COLLECTOR_RUN_RETENTION_DAYS)
+    add_collector_run({
+        'job': job,
+        'started_at': started_at,
+        'finished_at': datetime.now(),
+        'duration_ms': int((time.monotonic() - started) * 1000),
+        'node_count': stats.get('node_count', 0),
+        'success_count': stats.get('success_count', 0),
+        'failure_count': stats.get('failure_count', 0),
+        'skipped_count': stats.get('skipped_count', 0),
+        'records_written': stats.get('records_written', 0),
+        'db_write_ms': stats.get('db_write_ms', 0),
+        'node_latencies': stats.get('node_latencies', {}),
+        'error': error,
+    }, retention_days=retention_days)
+
 def run_periodic_static_sync():
     """
     [低频任务] 任务入口：仅执行节点静态信息同步 (APScheduler 调用)。
@@ -159,7 +422,7 @@ def run_periodic_static_sync():
     # 检查 scheduler 是否绑定了 app
     if hasattr(scheduler, 'app') and scheduler.app:
         with scheduler.app.app_context():
-            sync_node_list()
+            _run_and_record('static', sync_node_list)
     else:
         print(">>> [Error] Scheduler 未绑定 app 实例，无法运行静态同步任务。")
 
@@ -170,7 +433,7 @@ def run_periodic_snapshot_sync():
     """
     if hasattr(scheduler, 'app') and scheduler.app:
         with scheduler.app.app_context():
-            fetch_and_save_snapshots()
+            _run_and_record('snapshot', fetch_and_save_snapshots)
     else:
         print(">>> [Error] Scheduler 未绑定 app 实例，无法运行快照同步任务。")
 
@@ -191,20 +454,30 @@ def run_manual_trigger_task():
 bp = Blueprint('komari_api_bp', __name__, url_prefix='/api/komari')
 
 @bp.route('/manual-refresh', methods=['POST'])
+@login_required
 def manual_refresh_api():
     """
-    API 接口：触发手动数据同步和快照获取任务。
+    API 接口：触发手动刷新，立即返回任务句柄 (202)，前端通过 /refresh/<job_id> 轮询结果。
+    请求体可选 {"uuids": [...]}：只刷新指定节点的快照；不传则执行全量刷新 (静态同步 + 全部快照)。
+    针对相同节点的并发请求会合并到同一个进行中的任务。
     """
+    from app.modules.data_core.refresh_jobs import submit_refresh
+
     print(f"[{datetime.now().strftime('%H:%M:%S')}] 接收到手动刷新 API 请求...")
     try:
-        # 调用核心任务函数 (无需传递 app 实例)
-        run_manual_trigger_task()
+        payload = request.get_json(silent=True) or {}
+        uuids = payload.get('uuids') or None
+        if uuids is not None and (not isinstance(uuids, list) or not all(isinstance(u, str) for u in uuids)):
+            return jsonify({'status': 'error', 'message': 'uuids 必须是字符串数组'}), 400
+
+        job, created = submit_refresh(current_app._get_current_object(), uuids)
         
-        # 返回成功响应
+        # 返回任务句柄
         return jsonify({
             'status': 'success',
-            'message': '手动刷新任务已成功触发。'
-        }), 200
+            'message': '手动刷新任务已提交。' if created else '已有相同的刷新任务在进行中。',
+            'job': job.to_dict()
+        }), 202
             
     except Exception as e:
         # 捕获异常，返回错误信息
@@ -212,4 +485,127 @@ def manual_refresh_api():
         return jsonify({
             'status': 'error',
             'message': f'手动刷新任务出错: {str(e)}'
-        }), 500
\ No newline at end of file
+        }), 500
+
+@bp.route('/refresh/<job_id>', methods=['GET'])
+@login_required
+def refresh_job_status_api(job_id):
+    """
+    API 接口：查询手动刷新任务的状态。
+    """
+    from app.modules.data_core.refresh_jobs import get_refresh_job
+
+    job = get_refresh_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': '任务不存在或已过期'}), 404
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+def _backfill_job_to_dict(job):
+    if job is None:
+        return None
+    total = job.total_tasks or 0
+    finished = (job.done_tasks or 0) + (job.failed_tasks or 0)
+    return {
+        'id': job.id,
+        'status': job.status,
+        'total_tasks': total,
+        'done_tasks': job.done_tasks or 0,
+        'failed_tasks': job.failed_tasks or 0,
+        'inserted_records': job.inserted_records or 0,
+        'progress': round(finished * 100 / total, 1) if total else 100.0,
+        'message': job.message,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None,
+    }
+
+@bp.route('/backfill', methods=['POST'])
+@login_required
+def start_backfill_api():
+    """
+    API 接口：提交历史数据补采任务 (存在未完成的任务时返回该任务)，立即返回任务信息。
+    补采由持有采集器租约的进程执行，当前进程是活跃采集器时立即开始。
+    """
+    from app.modules.data_core.backfill import enqueue_backfill
+    try:
+        job_id, created = enqueue_backfill()
+        if job_id is None:
+            return jsonify({'status': 'success', 'message': '未发现数据缺口，无需补采。', 'job': None})
+
+        # 只有活跃采集器注册了补采任务：提前触发一次，不必等待下一个周期
+        backfill_job = scheduler.get_job('periodic_backfill') if scheduler.running else None
+        if backfill_job is not None:
+            backfill_job.modify(next_run_time=datetime.now())
+
+        job = get_backfill_job(job_id)
+        message = '补采任务已提交，由活跃采集器执行。' if created else '已有未完成的补采任务。'
+        return jsonify({'status': 'success', 'message': message, 'job': _backfill_job_to_dict(job)})
+    except Exception as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 提交补采任务出错: {e}")
+        return jsonify({'status': 'error', 'message': f'提交补采任务出错: {str(e)}'}), 500
+
+@bp.route('/backfill/status', methods=['GET'])
+@login_required
+def backfill_status_api():
+    """
+    API 接口：查询最近一次补采任务的进度。
+    补采可能在其他进程 (活跃采集器) 中执行，running 以任务状态为准 (已提交或执行中)。
+    """
+    job = get_latest_backfill_job()
+    return jsonify({
+        'status': 'success',
+        'running': job is not None and job.status == 'running',
+        'job': _backfill_job_to_dict(job)
+    })
+
+@bp.route('/collector_runs', methods=['GET'])
+@login_required
+def collector_runs_api():
+    """
+    API 接口：返回最近 N 小时的采集运行记录 (耗时趋势) 以及 HTTP 耗时最高的节点。
+    """
+    try:
+        hours = min(max(int(request.args.get('hours', 24)), 1), 24 * 31)
+    except (TypeError, ValueError):
+        hours = 24
+    since = datetime.now() - timedelta(hours=hours)
+    runs = get_collector_runs(since)
+
+    # 汇总快照任务中各节点的 HTTP 耗时
+    latency_stats = {}
+    for run in runs:
+        if run.job != 'snapshot':
+            continue
+        for uuid, ms in run.get_latencies_dict().items():
+            item = latency_stats.setdefault(uuid, {'total': 0, 'max': 0, 'count': 0})
+            item['total'] += ms
+            item['max'] = max(item['max'], ms)
+            item['count'] += 1
+
+    slowest = sorted(latency_stats.items(), key=lambda kv: kv[1]['total'] / kv[1]['count'], reverse=True)[:10]
+    slowest_nodes = []
+    for uuid, item in slowest:
+        node = get_node(uuid)
+        slowest_nodes.append({
+            'uuid': uuid,
+            'name': (node.custom_name or node.name) if node else uuid,
+            'avg_ms': int(item['total'] / item['count']),
+            'max_ms': item['max'],
+            'samples': item['count'],
+        })
+
+    return jsonify({
+        'status': 'success',
+        'runs': [{
+            'job': run.job,
+            'started_at': run.started_at.strftime('%m-%d %H:%M'),
+            'duration_ms': run.duration_ms,
+            'node_count': run.node_count,
+            'success_count': run.success_count,
+            'failure_count': run.failure_count,
+            'skipped_count': run.skipped_count,
+            'records_written': run.records_written,
+            'db_write_ms': run.db_write_ms,
+            'error': run.error,
+        } for run in runs],
+        'slowest_nodes': slowest_nodes,
+    })
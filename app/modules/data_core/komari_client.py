@@ -0,0 +1,209 @@
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ----------------------------------------------------
+# Komari HTTP 客户端
+# 复用连接池 (Keep-Alive)，缓存 base_url / headers，
+# 对瞬时错误做抖动退避重试，并为持续失败的节点开启熔断。
+# ----------------------------------------------------
+
+# 重试参数
+DEFAULT_MAX_RETRIES = 2          # 失败后额外重试的次数
+DEFAULT_BACKOFF_BASE = 0.5       # 退避基数 (秒)，第 n 次重试等待 base * 2^n 内的随机值
+DEFAULT_BACKOFF_MAX = 5.0        # 单次退避等待上限 (秒)
+
+# 熔断参数
+DEFAULT_BREAKER_THRESHOLD = 3    # 连续失败多少次后熔断
+DEFAULT_BREAKER_COOLDOWN = 900   # 熔断冷却时间 (秒)，期间直接跳过该节点
+
+# 值得重试的 HTTP 状态码 (网关错误 / 限流)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# Komari 返回的时间可能带纳秒 (Go 的 RFC3339Nano)，Python 只支持到微秒
+_FRACTION_RE = re.compile(r'(\.\d{6})\d+')
+
+
+def parse_komari_timestamp(value):
+    """
+    将 Komari 的时间字符串 (如 2025-01-01T08:00:00.123456789Z) 转换为本地时区的
+    naive datetime (与 history_data 中 datetime.now() 写入的格式一致)，精确到秒。
+    无法解析时返回 None。
+    """
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        text = _FRACTION_RE.sub(r'\1', value.strip())
+        if text.endswith('Z'):
+            text = text[:-1] + '+00:00'
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.replace(microsecond=0)
+
+
+class CircuitOpenError(Exception):
+    """节点处于熔断冷却期，本次请求被直接跳过。"""
+    pass
+
+
+class _CircuitBreaker:
+    """
+    单个节点的熔断状态。
+    连续失败达到阈值后进入 open 状态；冷却结束后放行一次试探请求 (half-open)，
+    成功则恢复，失败则重新计时。
+    """
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self, threshold, cooldown, now):
+        if self.failures < threshold or self.opened_at is None:
+            return True
+        if now - self.opened_at >= cooldown:
+            # half-open：放行一次，并重置计时，避免并发请求同时试探
+            self.opened_at = now
+            return True
+        return False
+
+
+class KomariClient:
+    """
+    可复用的 Komari API 客户端。
+    同一个实例在多个采集周期 (以及线程池中的多个线程) 之间共享。
+    """
+
+    def __init__(self, base_url, headers=None, pool_size=16,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE,
+                 backoff_max=DEFAULT_BACKOFF_MAX,
+                 breaker_threshold=DEFAULT_BREAKER_THRESHOLD,
+                 breaker_cooldown=DEFAULT_BREAKER_COOLDOWN):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.pool_size = 0
+        self.session = None
+        self.configure(base_url, headers, pool_size)
+
+    # --- 配置 ---
+
+    def configure(self, base_url, headers=None, pool_size=None):
+        """更新缓存的地址与请求头；连接池大小变化时重建 Session。"""
+        self.base_url = (base_url or '').rstrip('/')
+        self.headers = dict(headers or {})
+        if pool_size and pool_size != self.pool_size:
+            self._build_session(pool_size)
+
+    def _build_session(self, pool_size):
+        if self.session is not None:
+            self.session.close()
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        self.session = session
+        self.pool_size = pool_size
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+            self.pool_size = 0
+
+    # --- 熔断 ---
+
+    def is_available(self, node_uuid):
+        """节点当前是否允许请求 (未熔断或冷却已结束)。"""
+        with self._lock:
+            breaker = self._breakers.get(node_uuid)
+            if breaker is None:
+                return True
+            return breaker.allow(self.breaker_threshold, self.breaker_cooldown, time.monotonic())
+
+    def open_circuits(self):
+        """返回当前处于熔断冷却期的节点 UUID 列表。"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                uuid for uuid, b in self._breakers.items()
+                if b.failures >= self.breaker_threshold and b.opened_at is not None
+                and now - b.opened_at < self.breaker_cooldown
+            ]
+
+    def _record_success(self, node_uuid):
+        with self._lock:
+            self._breakers.pop(node_uuid, None)
+
+    def _record_failure(self, node_uuid):
+        with self._lock:
+            breaker = self._breakers.setdefault(node_uuid, _CircuitBreaker())
+            breaker.failures += 1
+            if breaker.failures >= self.breaker_threshold:
+                breaker.opened_at = time.monotonic()
+
+    # --- 请求 ---
+
+    def _backoff(self, attempt):
+        # Full jitter：在 [0, base * 2^attempt] 内随机等待，避免大量节点同时重试
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        time.sleep(random.uniform(0, ceiling))
+
+    def get_json(self, path, timeout=15, node_uuid=None):
+        """
+        GET 请求并解析 JSON。
+        - 连接错误 / 超时 / 5xx / 429 会按抖动退避重试。
+        - 传入 node_uuid 时参与该节点的熔断统计；熔断中直接抛出 CircuitOpenError。
+        """
+        if node_uuid and not self.is_available(node_uuid):
+            raise CircuitOpenError(f"节点 {node_uuid} 处于熔断冷却期")
+
+        url = f"{self.base_url}{path}"
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._backoff(attempt - 1)
+            try:
+                response = self.session.get(url, headers=self.headers, timeout=timeout)
+                if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                    last_error = requests.exceptions.HTTPError(
+                        f"{response.status_code} Server Error for url: {url}", response=response)
+                    continue
+                response.raise_for_status()
+                data = response.json()
+                if node_uuid:
+                    self._record_success(node_uuid)
+                return data
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = e
+            except Exception as e:
+                # 4xx / JSON 解析错误等不重试
+                last_error = e
+                break
+
+        if node_uuid:
+            self._record_failure(node_uuid)
+        raise last_error
+
+    def get_nodes(self, timeout=60):
+        """GET /api/nodes"""
+        return self.get_json('/api/nodes', timeout=timeout)
+
+    def get_recent(self, node_uuid, timeout=15):
+        """GET /api/recent/<uuid>，参与节点熔断。"""
+        return self.get_json(f'/api/recent/{node_uuid}', timeout=timeout, node_uuid=node_uuid)
@@ -0,0 +1,115 @@
+import os
+import socket
+import threading
+import time
+import uuid as uuid_lib
+from datetime import datetime
+
+from app.utils.db_manager import try_acquire_lease, release_lease
+
+# ----------------------------------------------------
+# 采集器选主 (数据库租约)
+# 多个 Web Worker / 多台主机上的采集进程共享同一个数据库，
+# 通过 collector_leases 表中的一行租约选出唯一的活跃采集器：
+#   - 持有者每 LEASE_RENEW_SECONDS 续期一次，租约有效期 LEASE_TTL_SECONDS；
+#   - 持有者宕机后租约过期，备用进程在下一次尝试时接管；
+#   - 正常退出时主动释放租约，备用进程立即接管。
+# ----------------------------------------------------
+
+LEASE_NAME = 'collector'
+LEASE_TTL_SECONDS = 60
+LEASE_RENEW_SECONDS = 15
+
+
+# 本进程失去租约后置位：已在运行的长任务 (清理/归档/补采) 在批次之间检查并提前结束，
+# 避免与接管的采集器同时写库。未参与选主 (命令行工具、手动刷新) 时始终为未置位。
+_stand_down = threading.Event()
+
+
+def should_stand_down():
+    return _stand_down.is_set()
+
+
+def _log(message):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [Leader] {message}")
+
+
+def make_holder_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid_lib.uuid4().hex[:8]}"
+
+
+class CollectorLeader:
+    """
+    后台线程：循环获取/续期租约。
+    成为主节点时调用 on_elected()，失去租约时调用 on_demoted()，回调在选主线程中执行。
+    on_demoted() 返回后本进程不应再有采集任务在写库 (需要等待已在运行的任务结束)。
+    """
+
+    def __init__(self, app, on_elected, on_demoted,
+                 ttl_seconds=LEASE_TTL_SECONDS, renew_seconds=LEASE_RENEW_SECONDS):
+        self.app = app
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.ttl_seconds = ttl_seconds
+        self.renew_seconds = renew_seconds
+        self.holder = make_holder_id()
+        self.is_leader = False
+        self._lease_deadline = 0.0      # 本进程视角下租约的到期时间 (monotonic)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='collector-leader', daemon=True)
+        self._thread.start()
+        _log(f"参与采集器选主: {self.holder}")
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.is_leader:
+            self._demote('进程退出')
+            with self.app.app_context():
+                release_lease(LEASE_NAME, self.holder)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                _log(f"选主异常: {e}")
+            self._stop_event.wait(self.renew_seconds)
+
+    def tick(self):
+        """执行一次获取/续期。"""
+        attempt_at = time.monotonic()
+        with self.app.app_context():
+            held = try_acquire_lease(LEASE_NAME, self.holder, self.ttl_seconds)
+
+        if held is None:
+            # 数据库暂时不可用：租约仍在有效期内则继续工作，否则主动让出，避免出现双主
+            if self.is_leader and time.monotonic() >= self._lease_deadline:
+                self._demote('无法续期，租约已过期')
+            return
+
+        if held:
+            self._lease_deadline = attempt_at + self.ttl_seconds
+            if not self.is_leader:
+                self.is_leader = True
+                _stand_down.clear()
+                _log("成为活跃采集器")
+                self.on_elected()
+        elif self.is_leader:
+            self._demote('租约已被其他进程接管')
+
+    def _demote(self, reason):
+        self.is_leader = False
+        _stand_down.set()
+        _log(f"停止采集: {reason}")
+        try:
+            self.on_demoted()
+        except Exception as e:
+            _log(f"停止采集任务出错: {e}")
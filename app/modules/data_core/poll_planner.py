@@ -0,0 +1,113 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+# ----------------------------------------------------
+# 自适应轮询计划 (POLLING_MODE = adaptive)
+# 每个节点拥有独立的下次采集时间：
+#   - 接近流量上限的节点：按最小间隔采集
+#   - 流量变化大的节点：间隔减半
+#   - 流量几乎不变的节点：间隔翻倍，直至最大间隔
+# 调度任务每个 tick 只采集到期的节点，并受全局请求速率限制。
+# ----------------------------------------------------
+
+IDLE_BYTES_PER_SECOND = 1024              # 低于此速率视为空闲 (约 1 KB/s)
+BUSY_BYTES_PER_SECOND = 1024 * 1024       # 高于此速率视为繁忙 (约 1 MB/s)
+NEAR_LIMIT_RATIO = 0.9                    # 已用流量达到上限的 90% 视为接近上限
+
+
+class RateLimiter:
+    """简单的令牌桶，限制全局每秒请求数 (线程安全)。rate <= 0 表示不限速。"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class AdaptivePollPlanner:
+    """
+    维护每个节点的采集间隔与下次采集时间 (进程内存，重启后所有节点立即到期)。
+    """
+
+    def __init__(self):
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def due_nodes(self, nodes, now, limit=None):
+        """返回当前到期的节点，最久未采集的优先；limit 为本轮最多采集的节点数。"""
+        with self._lock:
+            due = []
+            for node in nodes:
+                state = self._state.get(node.uuid)
+                next_at = state['next_at'] if state else datetime.min
+                if next_at <= now:
+                    due.append((next_at, node))
+        due.sort(key=lambda item: item[0])
+        if limit is not None:
+            due = due[:limit]
+        return [node for _, node in due]
+
+    def reschedule(self, uuid, records, now, base_interval, min_interval, max_interval, traffic_limit=None):
+        """
+        根据本次采集到的数据计算节点的下一次采集间隔 (秒)。
+        records 为空 (采集失败/无新数据) 时按基础间隔重试。
+        """
+        with self._lock:
+            state = self._state.setdefault(uuid, {
+                'interval': base_interval, 'next_at': now, 'last_ts': None, 'last_total': None,
+            })
+            interval = state['interval']
+
+            latest = max(records, key=lambda r: r['timestamp'] or now) if records else None
+            if latest is None:
+                interval = base_interval
+            else:
+                total = (latest['total_up'] or 0) + (latest['total_down'] or 0)
+                latest_ts = latest['timestamp'] or now
+                rate = None
+                if state['last_ts'] is not None and latest_ts > state['last_ts']:
+                    delta = total - state['last_total']
+                    if delta >= 0:  # 计数器归零时无法判断速率
+                        rate = delta / (latest_ts - state['last_ts']).total_seconds()
+                state['last_ts'] = latest_ts
+                state['last_total'] = total
+
+                if traffic_limit and total >= traffic_limit * NEAR_LIMIT_RATIO:
+                    interval = min_interval
+                elif rate is None:
+                    interval = base_interval
+                elif rate >= BUSY_BYTES_PER_SECOND:
+                    interval = interval / 2
+                elif rate <= IDLE_BYTES_PER_SECOND:
+                    interval = interval * 2
+                else:
+                    interval = base_interval
+
+            interval = max(min_interval, min(max_interval, interval))
+            state['interval'] = interval
+            state['next_at'] = now + timedelta(seconds=interval)
+            return interval
+
+    def forget_missing(self, uuids):
+        """清理已被删除的节点"""
+        with self._lock:
+            for uuid in list(self._state):
+                if uuid not in uuids:
+                    del self._state[uuid]
+
+    def snapshot(self):
+        """返回 {uuid: (interval 秒, 下次采集时间)}，用于展示或调试"""
+        with self._lock:
+            return {uuid: (s['interval'], s['next_at']) for uuid, s in self._state.items()}
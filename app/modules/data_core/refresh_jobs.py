@@ -0,0 +1,151 @@
+import threading
+import uuid as uuid_lib
+from datetime import datetime, timedelta
+
+from app.utils.db_manager import (
+    create_refresh_job,
+    get_refresh_job as get_refresh_job_record,
+    get_active_refresh_jobs,
+    update_refresh_job,
+    delete_refresh_jobs_before,
+)
+
+# ----------------------------------------------------
+# 手动刷新任务 (异步 + 请求合并)
+# 手动刷新不再在 HTTP 请求中同步执行：接口立即返回任务句柄，由后台线程执行，
+# 前端轮询任务状态。针对相同节点的并发请求会合并到同一个进行中的任务。
+# 任务状态保存在数据库 (refresh_jobs) 中：多个 Web Worker 部署时，
+# 轮询请求落到任意 Worker 都能查到任务，合并请求也跨 Worker 生效。
+# ----------------------------------------------------
+
+FINISHED_JOB_TTL = 600          # 已结束任务的保留时间 (秒)，供前端查询结果
+ACTIVE_JOB_TIMEOUT = 600        # 超过该时间仍未结束的任务视为已失效 (执行它的 Worker 已退出)，不再合并
+
+
+class RefreshJob:
+    def __init__(self, node_uuids, job_id=None):
+        self.id = job_id or uuid_lib.uuid4().hex
+        # None 表示全量刷新
+        self.node_uuids = sorted(node_uuids) if node_uuids else None
+        self.status = 'queued'          # queued / running / done / partial / failed
+        self.message = None
+        self.stats = {}
+        self.created_at = datetime.now()
+        self.finished_at = None
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record.get_node_uuids(), job_id=record.id)
+        job.status = record.status
+        job.message = record.message
+        job.stats = record.get_stats_dict()
+        job.created_at = record.created_at
+        job.finished_at = record.finished_at
+        return job
+
+    @property
+    def is_active(self):
+        return self.status in ('queued', 'running')
+
+    def covers(self, node_uuids):
+        """当前任务是否已覆盖请求的节点 (全量任务覆盖一切)"""
+        if self.node_uuids is None:
+            return True
+        if node_uuids is None:
+            return False
+        return set(node_uuids) <= set(self.node_uuids)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'nodes': self.node_uuids,
+            'message': self.message,
+            'node_count': self.stats.get('node_count', 0),
+            'success_count': self.stats.get('success_count', 0),
+            'failure_count': self.stats.get('failure_count', 0),
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None,
+        }
+
+
+# 同一 Worker 内的提交串行化 (跨 Worker 仍可能各自创建任务，只是多请求一次 Komari)
+_submit_lock = threading.Lock()
+
+
+def get_refresh_job(job_id):
+    """查询刷新任务 (需要 app 上下文)，不存在或已过期时返回 None"""
+    record = get_refresh_job_record(job_id)
+    return RefreshJob.from_record(record) if record is not None else None
+
+
+def submit_refresh(app, node_uuids=None):
+    """
+    提交刷新请求，返回 (job, created)。需要在 app 上下文中调用。
+    已有进行中的任务覆盖这些节点时直接返回该任务 (created=False)，不会重复请求 Komari。
+    """
+    node_uuids = list(dict.fromkeys(node_uuids)) if node_uuids else None
+    now = datetime.now()
+
+    with _submit_lock:
+        delete_refresh_jobs_before(now - timedelta(seconds=FINISHED_JOB_TTL + ACTIVE_JOB_TIMEOUT))
+        for record in get_active_refresh_jobs(now - timedelta(seconds=ACTIVE_JOB_TIMEOUT)):
+            job = RefreshJob.from_record(record)
+            if job.covers(node_uuids):
+                return job, False
+
+        job = RefreshJob(node_uuids)
+        if create_refresh_job(job.id, job.node_uuids) is None:
+            raise RuntimeError('无法创建刷新任务')
+
+    threading.Thread(
+        target=_run_refresh_job, args=(app, job),
+        name=f'komari-refresh-{job.id[:8]}', daemon=True,
+    ).start()
+    return job, True
+
+
+def _finish_status(job, synced, result):
+    """根据节点同步结果与快照统计得出任务的最终状态 (status, message)"""
+    stats = job.stats
+    failures = stats.get('failure_count', 0)
+    successes = stats.get('success_count', 0)
+    problems = []
+    if synced is False:
+        problems.append('节点列表同步失败')
+    if result is False:
+        problems.append(stats.get('error') or '快照写入失败')
+    if failures:
+        problems.append(f'{failures} 个节点获取失败')
+
+    if not problems:
+        return 'done', '刷新完成'
+    # 没有任何节点成功 (或数据未能入库)：整体失败；否则为部分成功
+    if result is False or not successes:
+        return 'failed', '，'.join(problems)
+    return 'partial', '部分完成: ' + '，'.join(problems)
+
+
+def _run_refresh_job(app, job):
+    # 延迟导入，避免与 komari_api 循环引用
+    from app.modules.data_core.komari_api import sync_node_list, fetch_and_save_snapshots
+
+    with app.app_context():
+        job.status = 'running'
+        update_refresh_job(job.id, job.status)
+        try:
+            synced = None
+            if job.node_uuids is None:
+                synced = sync_node_list()
+                # 全量刷新：立即采集所有节点，不受自适应轮询计划与 tick 预算限制
+                result = fetch_and_save_snapshots(stats=job.stats, force=True)
+            else:
+                result = fetch_and_save_snapshots(stats=job.stats, only_uuids=job.node_uuids)
+            job.status, job.message = _finish_status(job, synced, result)
+        except Exception as e:
+            job.status = 'failed'
+            job.message = str(e)
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 手动刷新任务 {job.id[:8]} 出错: {e}")
+        finally:
+            job.finished_at = datetime.now()
+            update_refresh_job(job.id, job.status, job.message, stats=job.stats, finished=True)
@@ -0,0 +1,113 @@
+import time
+from datetime import datetime, timedelta
+
+from app.utils.db_manager import (
+    get_config,
+    delete_expired_history_batch,
+    get_db_size_bytes,
+    sqlite_incremental_vacuum,
+    add_retention_run,
+)
+from app.utils.pg_partitioning import drop_expired_history_partitions
+from app.modules.data_core.leader import should_stand_down
+from app.utils.scheduler import scheduler
+
+# ----------------------------------------------------
+# 过期数据清理 (RAW_DATA_RETENTION_DAYS)
+# 按小批量删除超过保留天数的 history_data，每批单独提交并短暂让出，
+# 采集写入与页面查询不会被长事务阻塞；单轮超过时间预算即停止，剩余部分留给下一轮。
+# SQLite 删除后通过 PRAGMA incremental_vacuum 把空闲页归还给文件系统
+# (旧数据库需先运行一次 python -m app.sqlite_vacuum 切换为增量回收模式，清理任务本身不执行完整 VACUUM)。
+# PostgreSQL 按月分区时，整月过期的分区直接 DROP，剩余部分再逐行删除。
+# 本进程失去采集器租约时在批次之间停止。
+# ----------------------------------------------------
+
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_RETENTION_BATCH_SIZE = 2000     # 每批删除的行数
+RETENTION_TIME_BUDGET_SECONDS = 60      # 单轮清理的时间预算 (秒)
+RETENTION_BATCH_PAUSE_SECONDS = 0.1     # 批次之间的让出时间 (秒)
+VACUUM_PAGES_PER_STEP = 1000            # 每次增量 VACUUM 回收的页数
+RETENTION_INTERVAL_MINUTES = 60         # 调度间隔 (分)
+
+
+def _log(message):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [Retention] {message}")
+
+
+def _get_int_config(key, default):
+    try:
+        value = int(get_config(key, default))
+        return value if value > 0 else default
+    except (ValueError, TypeError):
+        return default
+
+
+def get_retention_days():
+    """原始数据保留天数 (RAW_DATA_RETENTION_DAYS)"""
+    return _get_int_config('RAW_DATA_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+
+
+def prune_expired_history(time_budget=RETENTION_TIME_BUDGET_SECONDS):
+    """执行一轮清理并记录结果 (需要 app 上下文)，返回本轮的运行信息。"""
+    retention_days = get_retention_days()
+    batch_size = _get_int_config('RETENTION_BATCH_SIZE', DEFAULT_RETENTION_BATCH_SIZE)
+    cutoff = datetime.now() - timedelta(days=retention_days)
+
+    started_at = datetime.now()
+    started = time.monotonic()
+    deadline = started + time_budget
+    size_before = get_db_size_bytes()
+
+    rows_deleted = 0
+    batches = 0
+    completed = False
+    error = None
+    try:
+        partition_rows, _ = drop_expired_history_partitions(cutoff)
+        rows_deleted += partition_rows
+
+        while time.monotonic() < deadline and not should_stand_down():
+            deleted = delete_expired_history_batch(cutoff, batch_size)
+            if deleted is None:
+                error = '删除失败，详见日志'
+                break
+            rows_deleted += deleted
+            batches += 1
+            if deleted < batch_size:
+                completed = True
+                break
+            time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+
+        # 回收空闲页 (同样受时间预算约束)
+        while rows_deleted and time.monotonic() < deadline and not should_stand_down():
+            if sqlite_incremental_vacuum(VACUUM_PAGES_PER_STEP) == 0:
+                break
+            time.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+    except Exception as e:
+        error = str(e)
+        _log(f"清理异常: {e}")
+
+    run_info = {
+        'started_at': started_at,
+        'duration_ms': int((time.monotonic() - started) * 1000),
+        'cutoff': cutoff,
+        'rows_deleted': rows_deleted,
+        'batches': batches,
+        'bytes_freed': max(0, size_before - get_db_size_bytes()),
+        'completed': completed,
+        'error': error,
+    }
+    add_retention_run(run_info)
+    if rows_deleted:
+        _log(f"删除 {rows_deleted} 条过期记录 ({batches} 批)，释放 {run_info['bytes_freed'] / 1024 / 1024:.2f} MB"
+             + ("" if completed else "，剩余部分下一轮继续"))
+    return run_info
+
+
+def run_periodic_retention():
+    """[定时任务] 任务入口 (APScheduler 调用)"""
+    if hasattr(scheduler, 'app') and scheduler.app:
+        with scheduler.app.app_context():
+            prune_expired_history()
+    else:
+        print(">>> [Error] Scheduler 未绑定 app 实例，无法运行数据清理任务。")
@@ -0,0 +1,46 @@
+import threading
+from datetime import datetime
+
+from app.utils.db_manager import db, HistoryData, rebuild_history_rollups, needs_rollup_rebuild
+
+# ----------------------------------------------------
+# 历史汇总表 (history_hourly / history_daily) 重建
+# 新写入的数据在 bulk_add_history 中增量汇总；升级前已有的历史数据需要重建一次。
+# 命令行: python -m app.rebuild_rollups
+# ----------------------------------------------------
+
+
+def _log(message):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [Rollup] {message}")
+
+
+def rebuild_all_rollups(since=None):
+    """逐个节点重建汇总表并提交 (需要 app 上下文)，返回重建的节点数。"""
+    uuids = [row[0] for row in db.session.query(HistoryData.uuid).distinct().all()]
+    _log(f"开始重建 {len(uuids)} 个节点的汇总数据" + (f" (自 {since:%Y-%m-%d} 起)" if since else ""))
+    for index, uuid in enumerate(uuids, 1):
+        try:
+            rebuild_history_rollups([uuid], since)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            _log(f"节点 {uuid} 重建失败: {e}")
+            continue
+        if index % 20 == 0:
+            _log(f"已完成 {index}/{len(uuids)}")
+    _log("汇总数据重建完成")
+    return len(uuids)
+
+
+def start_rollup_rebuild_if_needed(app):
+    """[活跃采集器启动时] 旧数据库的汇总表为空时在后台线程中重建一次"""
+    with app.app_context():
+        if not needs_rollup_rebuild():
+            return False
+
+    def _worker():
+        with app.app_context():
+            rebuild_all_rollups()
+
+    threading.Thread(target=_worker, name='rollup-rebuild', daemon=True).start()
+    return True
@@ -0,0 +1,242 @@
+import json
+import random
+import threading
+from datetime import datetime
+
+import websocket  # websocket-client
+
+from app.utils.db_manager import get_config, get_all_nodes, bulk_add_history
+from app.modules.data_core.komari_client import parse_komari_timestamp
+
+# ----------------------------------------------------
+# 实时流采集 (INGEST_MODE = stream)
+# 与 Komari 的 /api/clients WebSocket 保持一条长连接，
+# 周期性发送 "get" 拉取全部节点的实时状态，帧数据先缓存在内存中，
+# 再按 STREAM_FLUSH_SECONDS 批量写入 history_data。
+# ----------------------------------------------------
+
+DEFAULT_STREAM_SAMPLE_SECONDS = 10     # 向 Komari 请求实时数据的间隔 (秒)
+DEFAULT_STREAM_FLUSH_SECONDS = 60      # 缓冲区写库间隔 (秒)
+MAX_BUFFERED_RECORDS = 50000           # 缓冲区上限，数据库长时间不可用时丢弃最旧的数据
+RECONNECT_BACKOFF_MAX = 60             # 断线重连的最长等待 (秒)
+
+
+def _log(message):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [Stream] {message}")
+
+
+def _get_int_config(key, default):
+    try:
+        value = int(get_config(key, default))
+        return value if value > 0 else default
+    except (ValueError, TypeError):
+        return default
+
+
+def _to_ws_url(base_url):
+    """http(s)://host -> ws(s)://host/api/clients"""
+    base_url = base_url.rstrip('/')
+    if base_url.startswith('https://'):
+        base_url = 'wss://' + base_url[len('https://'):]
+    elif base_url.startswith('http://'):
+        base_url = 'ws://' + base_url[len('http://'):]
+    return f"{base_url}/api/clients"
+
+
+def parse_clients_frame(message):
+    """
+    解析 /api/clients 的响应帧，返回 {uuid: report} 字典。
+    帧格式: {"status": "success", "data": {"online": [...], "data": {uuid: report}}}
+    """
+    try:
+        payload = json.loads(message)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(payload, dict) or payload.get('status') != 'success':
+        return {}
+    data = payload.get('data') or {}
+    reports = data.get('data') if isinstance(data, dict) else None
+    return reports if isinstance(reports, dict) else {}
+
+
+class KomariStreamIngestor:
+    """
+    后台线程：维护 WebSocket 长连接，缓存状态帧并定期批量落库。
+    app 用于在写库时推入应用上下文 (线程中没有 Flask 上下文)。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._last_seen = {}          # uuid -> updated_at，相同的帧不重复缓存
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._flush_thread = None
+        self._ws = None
+        self._reconnect_attempt = 0
+
+        with app.app_context():
+            self.base_url = get_config('KOMARI_BASE_URL', 'http://127.0.0.1:8888').rstrip('/')
+            self.sample_seconds = _get_int_config('STREAM_SAMPLE_SECONDS', DEFAULT_STREAM_SAMPLE_SECONDS)
+            self.flush_seconds = _get_int_config('STREAM_FLUSH_SECONDS', DEFAULT_STREAM_FLUSH_SECONDS)
+
+    # --- 生命周期 ---
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='komari-stream', daemon=True)
+        self._flush_thread = threading.Thread(target=self._flush_loop, name='komari-stream-flush', daemon=True)
+        self._thread.start()
+        self._flush_thread.start()
+        _log(f"实时采集已启动: {_to_ws_url(self.base_url)} (采样 {self.sample_seconds}s / 写库 {self.flush_seconds}s)")
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+        for t in (self._thread, self._flush_thread):
+            if t is not None:
+                t.join(timeout)
+        # 停止前把缓冲区剩余的数据写掉
+        self.flush()
+
+    # --- 连接与接收 ---
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._stream_once()
+            except Exception as e:
+                _log(f"连接中断: {e}")
+            if self._stop_event.is_set():
+                break
+            # 抖动退避重连 (连接成功后计数清零)
+            delay = random.uniform(0, min(RECONNECT_BACKOFF_MAX, 2 ** self._reconnect_attempt))
+            self._reconnect_attempt = min(self._reconnect_attempt + 1, 10)
+            self._stop_event.wait(delay)
+
+    def _stream_once(self):
+        ws = websocket.create_connection(
+            _to_ws_url(self.base_url),
+            timeout=max(self.sample_seconds * 3, 10),
+        )
+        self._ws = ws
+        self._reconnect_attempt = 0
+        _log("WebSocket 已连接")
+        try:
+            while not self._stop_event.is_set():
+                ws.send('get')
+                message = ws.recv()
+                if not message:
+                    raise ConnectionError('服务端关闭了连接')
+                self.handle_frame(message)
+                self._stop_event.wait(self.sample_seconds)
+        finally:
+            self._ws = None
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def handle_frame(self, message, received_at=None):
+        """解析一帧数据并写入缓冲区；返回本帧新增的记录数。"""
+        reports = parse_clients_frame(message)
+        if not reports:
+            return 0
+
+        received_at = received_at or datetime.now()
+        new_records = []
+        for uuid, report in reports.items():
+            if not isinstance(report, dict):
+                continue
+            updated_at = report.get('updated_at')
+            if updated_at is not None and self._last_seen.get(uuid) == updated_at:
+                continue
+            self._last_seen[uuid] = updated_at
+            network = report.get('network') or {}
+            cpu = report.get('cpu') or {}
+            new_records.append({
+                'uuid': uuid,
+                'total_up': network.get('totalUp', 0),
+                'total_down': network.get('totalDown', 0),
+                'cpu_usage': cpu.get('usage', 0.0),
+                # 优先使用 Komari 的采样时间，与轮询模式的去重键保持一致
+                'timestamp': parse_komari_timestamp(updated_at) or received_at,
+            })
+
+        if new_records:
+            self._append_records(new_records)
+        return len(new_records)
+
+    # --- 批量写库 ---
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                _log(f"批量写入失败: {e}")
+
+    def _append_records(self, records, front=False):
+        """写入缓冲区 (front=True 时放回队首)，超出上限时丢弃最旧的数据。"""
+        with self._buffer_lock:
+            if front:
+                self._buffer[:0] = records
+            else:
+                self._buffer.extend(records)
+            overflow = len(self._buffer) - MAX_BUFFERED_RECORDS
+            if overflow > 0:
+                del self._buffer[:overflow]
+
+    def flush(self):
+        """
+        将缓冲区数据批量写入 history_data，仅保留已在 nodes 表中的节点。
+        写库失败时整批放回缓冲区，下次 flush 重试。
+        """
+        with self._buffer_lock:
+            if not self._buffer:
+                return 0
+            records, self._buffer = self._buffer, []
+
+        written = False
+        try:
+            with self.app.app_context():
+                # 节点列表由静态同步任务维护；未知节点的数据直接丢弃，避免外键冲突
+                known_uuids = {node.uuid for node in get_all_nodes()}
+                records = [r for r in records if r['uuid'] in known_uuids]
+                if not records:
+                    return 0
+                written = bulk_add_history(records)
+        finally:
+            if not written and records:
+                self._append_records(records, front=True)
+        if not written:
+            _log(f"批量写入失败，{len(records)} 条数据已放回缓冲区等待重试。")
+            return 0
+        _log(f"成功批量写入 {len(records)} 条实时数据。")
+        return len(records)
+
+
+# 进程内唯一的实时采集器
+_stream_ingestor = None
+
+def start_stream_ingest(app):
+    """启动 (或返回已存在的) 实时采集器。"""
+    global _stream_ingestor
+    if _stream_ingestor is None:
+        _stream_ingestor = KomariStreamIngestor(app)
+    _stream_ingestor.start()
+    return _stream_ingestor
+
+def stop_stream_ingest():
+    global _stream_ingestor
+    if _stream_ingestor is not None:
+        _stream_ingestor.stop()
+        _stream_ingestor = None
@@ -0,0 +1,49 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+# ----------------------------------------------------
+# 历史图表结果缓存 (进程内 LRU)
+# 键为 (uuid, 时间范围, 分辨率, 点数)，每个条目附带一个数据戳 (该节点范围内日汇总行的 samples / delta 等，
+# 以及节点最新数据时间)。新采样、补采会改变汇总行，游程压缩的延长会推进最新数据时间，数据戳随之变化，
+# 缓存条目即失效；独立采集进程写入时同样生效，不需要跨进程通知。
+# 更早的日期数据戳基本不再变化，条目常驻缓存，只受 LRU 容量限制。
+# ----------------------------------------------------
+
+CHART_CACHE_MAX_ENTRIES = 512
+
+
+class ChartCache:
+    def __init__(self, max_entries=CHART_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()     # {key: (stamp, payload)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, stamp):
+        """数据戳一致时返回缓存的结果，否则返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, stamp, payload):
+        with self._lock:
+            self._entries[key] = (stamp, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def make_etag(key, stamp):
+    """由缓存键与数据戳生成 ETag：数据不变时 ETag 不变，浏览器可凭 If-None-Match 得到 304"""
+    return hashlib.sha1(repr((key, stamp)).encode('utf-8')).hexdigest()[:20]
@@ -1,10 +1,38 @@
 from flask import Blueprint, render_template, jsonify, request, current_app
 from flask_login import login_required
 from datetime import datetime, timedelta
+import threading
+import time
 import traceback
 
 # 导入 db_manager 模型和数据库对象
-from app.utils.db_manager import db, HistoryData, get_all_nodes
+from app.utils.db_manager import (
+    get_all_nodes, get_config, get_rollup_series, get_daily_usage_ranking, get_daily_rollup_stamp,
+    iter_history_points, get_history_point_before
+)
+from app.modules.data_core.archive import read_archived_rows, last_archived_before, has_archived_day
+from app.modules.history.chart_cache import ChartCache, make_etag
+from app.modules.history import series
+
+GB = 1024 * 1024 * 1024
+
+# 排名缓存：当天的数据随采集变化，缓存时间较短；更早的日期基本不变
+RANKING_CACHE_SECONDS_TODAY = 30
+RANKING_CACHE_SECONDS_PAST = 600
+_ranking_cache = {}     # {(开始日期, 结束日期): (过期时间, ranking)}
+_ranking_cache_lock = threading.Lock()
+
+# 图表结果缓存 (见 chart_cache.py)；更早日期的图表允许浏览器直接复用的时间 (秒)
+CHART_PAST_MAX_AGE = 3600
+_chart_cache = ChartCache()
+
+# 时间范围图表：按跨度选择数据源
+RAW_MAX_SPAN = timedelta(days=2)        # 不超过 2 天：原始采样点
+HOURLY_MAX_SPAN = timedelta(days=14)    # 不超过 14 天：小时汇总；更长：日汇总
+MAX_RANGE_DAYS = 366
+MAX_POINTS = 120                        # 累计趋势默认最多返回的点数 (可用 max_points 参数调整)
+MAX_POINTS_RANGE = (10, 2000)
+_US = timedelta(microseconds=1)
 
 bp = Blueprint('history', __name__, url_prefix='/history', template_folder='templates')
 
@@ -16,193 +44,302 @@ def view_history():
     today = datetime.now().strftime('%Y-%m-%d')
     return render_template('history.html', nodes=nodes, default_date=today)
 
+def _raw_data_available(uuid, start_time):
+    """
+    原始数据只保留 RAW_DATA_RETENTION_DAYS 天，但已归档的日期仍可从归档文件读取；
+    两者都没有的日期只能使用小时汇总
+    """
+    try:
+        retention_days = int(get_config('RAW_DATA_RETENTION_DAYS', 30))
+    except (ValueError, TypeError):
+        retention_days = 30
+    if start_time >= datetime.now() - timedelta(days=retention_days):
+        return True
+    return has_archived_day(uuid, start_time.date())
+
+def _load_raw_records(uuid, start_time, end_time):
+    """合并 history_data 与归档文件中的原始记录 (按时间戳去重，数据库优先)，按时间升序"""
+    db_records = list(iter_history_points(uuid, start_time, end_time))
+
+    archived = read_archived_rows(uuid, start_time, end_time)
+    if not archived:
+        return db_records
+    merged = {r.timestamp: r for r in archived}
+    merged.update({r.timestamp: r for r in db_records})
+    return [merged[ts] for ts in sorted(merged)]
+
+def _raw_line_points(uuid, start_time, end_time):
+    """
+    基于原始采样点计算累计趋势，返回 (offsets, acc_up, acc_down)：
+    offsets 为相对 start_time 的微秒偏移，累计值单位为字节
+    """
+    chart_records = _load_raw_records(uuid, start_time, end_time)
+    # 开始前就已空闲的节点：把仍在有效期内的上一行作为起点
+    carried = _get_carried_record(uuid, start_time)
+    if not chart_records and not carried:
+        return [], [], []
+
+    # 累计趋势 = 逐点累加写入时计算好的增量 (已处理计数器重启归零)。
+    # 起点 (上一行，或 start_time 处的 0) 的增量属于之前的时间段，置 0；
+    # 范围内每一行的增量都计入，与柱状图 (汇总表) 及排名一致
+    acc_up = series.cumulative([0] + [r.delta_up or 0 for r in chart_records])
+    acc_down = series.cumulative([0] + [r.delta_down or 0 for r in chart_records])
+
+    # 被压缩的空闲区间 [timestamp, valid_until] 内数值不变，展开为起止两个点
+    prefix_valid = (carried.valid_until - start_time) // _US if carried else None
+    offsets = [(carried.timestamp - start_time) // _US if carried else 0] + \
+        [(r.timestamp - start_time) // _US for r in chart_records]
+    valid_offsets = [prefix_valid] + \
+        [(r.valid_until - start_time) // _US if r.valid_until else None for r in chart_records]
+    offsets, (acc_up, acc_down) = series.expand_intervals(
+        offsets, valid_offsets, acc_up, acc_down, end_offset=(end_time - start_time) // _US
+    )
+    return offsets, acc_up, acc_down
+
+def _rollup_line_points(rows, start_time, end_time, step):
+    """
+    原始数据不可用或跨度较大时：用汇总表的累计值画趋势，
+    起点为 0，之后每个时间桶结束时一个点 (rows 为 (bucket, delta_up, delta_down))
+    """
+    if not rows:
+        return [], [], []
+    offsets = [0] + [(min(bucket + step, end_time) - start_time) // _US for bucket, _, _ in rows]
+    acc_up = series.cumulative([0] + [delta_up or 0 for _, delta_up, _ in rows])
+    acc_down = series.cumulative([0] + [delta_down or 0 for _, _, delta_down in rows])
+    return offsets, acc_up, acc_down
+
+def _downsample_line(start_time, offsets, acc_up, acc_down, time_format, max_points):
+    """
+    用 LTTB 把累计趋势降到最多 max_points 个点 (首尾两点总会保留)，
+    只对保留下来的点生成时间标签并换算为 GB
+    """
+    # 在单点总增量上选点：单调的累计曲线上 LTTB 与等间隔抽样差别不大，
+    # 增量序列上突发流量是尖峰，会被保留下来，累计曲线在这些点处的跳变也就不会被抹平
+    indices = series.lttb_indices(offsets, series.steps(series.add(acc_up, acc_down)), max_points)
+    times, uploads, downloads, totals = [], [], [], []
+    for offset, up, down in zip(series.take(offsets, indices), series.take(acc_up, indices),
+                                series.take(acc_down, indices)):
+        val_up = up / GB
+        val_down = down / GB
+        times.append((start_time + timedelta(microseconds=offset)).strftime(time_format))
+        uploads.append(round(val_up, 4))
+        downloads.append(round(val_down, 4))
+        totals.append(round(val_up + val_down, 4))
+    return {'times': times, 'uploads': uploads, 'downloads': downloads, 'totals': totals}
+
+def _bar_series(rows, start_time, end_time, step, label_format):
+    """按时间桶补零后的每小时/每日用量 (GB)，返回 (labels, up, down)"""
+    first = _floor_bucket(start_time, step)
+    n_buckets = (end_time - first) // step + 1
+    offsets = [(bucket - first) // _US for bucket, _, _ in rows]
+    step_us = step // _US
+    sums_up = series.bucket_sums(offsets, [delta_up or 0 for _, delta_up, _ in rows], step_us, n_buckets)
+    sums_down = series.bucket_sums(offsets, [delta_down or 0 for _, _, delta_down in rows], step_us, n_buckets)
+    labels = [(first + step * i).strftime(label_format) for i in range(n_buckets)]
+    return labels, [round(v / GB, 4) for v in sums_up], [round(v / GB, 4) for v in sums_down]
+
+def _floor_bucket(value, step):
+    if step >= timedelta(days=1):
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def _get_carried_record(uuid, start_time):
+    """
+    游程压缩后，空闲节点在 start_time 之前写入的最后一行可能一直有效到 start_time 之后
+    (valid_until >= start_time)。返回这行记录作为当日的起始基准，否则返回 None。
+    """
+    carried = get_history_point_before(uuid, start_time)
+    # 更早的记录可能已被归档，取两者中时间较晚的一条
+    archived = last_archived_before(uuid, start_time)
+    if archived and (carried is None or archived.timestamp > carried.timestamp):
+        carried = archived
+    if carried and carried.valid_until and carried.valid_until >= start_time:
+        return carried
+    return None
+
+def _parse_bound(value, is_end):
+    """YYYY-MM-DDTHH:MM，或 YYYY-MM-DD (开始取 00:00，结束取当天最后时刻)"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M')
+    except ValueError:
+        pass
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('日期格式错误')
+    return datetime.combine(day, datetime.max.time() if is_end else datetime.min.time())
+
+def _parse_range(args):
+    """
+    解析时间范围：start/end (YYYY-MM-DD 或 YYYY-MM-DDTHH:MM)，或单个 date (等同于 start=end=date)。
+    返回 (start_time, end_time)，参数错误时抛出 ValueError。
+    """
+    start_str = args.get('start') or args.get('date')
+    end_str = args.get('end') or start_str
+    if not start_str:
+        raise ValueError('缺少参数')
+    start_time = _parse_bound(start_str, is_end=False)
+    end_time = _parse_bound(end_str, is_end=True)
+    if end_time < start_time:
+        raise ValueError('结束时间早于开始时间')
+    if end_time - start_time > timedelta(days=MAX_RANGE_DAYS):
+        raise ValueError(f'时间范围不能超过 {MAX_RANGE_DAYS} 天')
+    return start_time, end_time
+
+def _pick_resolution(uuid, start_time, end_time):
+    """按跨度选择数据源：数小时~2 天用原始采样点，数周用小时汇总，更长用日汇总"""
+    span = end_time - start_time
+    if span <= RAW_MAX_SPAN and _raw_data_available(uuid, start_time):
+        return 'raw'
+    return 'hourly' if span <= HOURLY_MAX_SPAN else 'daily'
+
+def _build_chart(uuid, start_time, end_time, resolution, max_points=MAX_POINTS):
+    """计算某节点在时间范围内的图表数据 (每小时/每日消耗 + 累计趋势)，resolution 为 raw / hourly / daily"""
+    single_day = start_time.date() == end_time.date()
+    if resolution == 'daily':
+        step, granularity = timedelta(days=1), 'day'
+        time_format = bar_format = '%m-%d'
+    else:
+        step, granularity = timedelta(hours=1), 'hour'
+        time_format = '%H:%M' if single_day else '%m-%d %H:%M'
+        bar_format = '%H:00' if single_day else '%m-%d %H:00'
+
+    # 柱状图直接读取汇总表 (只取需要的列)
+    rows = get_rollup_series(uuid, _floor_bucket(start_time, step), end_time, granularity)
+
+    if resolution == 'raw':
+        offsets, acc_up, acc_down = _raw_line_points(uuid, start_time, end_time)
+    else:
+        offsets, acc_up, acc_down = _rollup_line_points(rows, start_time, end_time, step)
+
+    # 降采样：点数过多时前端渲染会非常卡顿，用 LTTB 只返回约 max_points 个点 (不会丢掉尖峰)
+    line = _downsample_line(start_time, offsets, acc_up, acc_down, time_format, max_points)
+
+    bar_labels, bar_up, bar_down = _bar_series(rows, start_time, end_time, step, bar_format)
+
+    return {
+        'resolution': resolution,
+        'line': line,
+        'bar': {
+            'hours': bar_labels,
+            'up': bar_up,
+            'down': bar_down
+        }
+    }
+
 @bp.route('/api/chart_data')
 @login_required
 def chart_data_api():
     """
-    API: 获取图表数据 (包含每小时消耗 + 累计趋势) + 所有节点当日排名数据
+    API: 获取图表数据 (每小时/每日消耗 + 累计趋势)。所有节点的排名见 ranking_api
+    参数: uuid，以及 date 或 start/end；按跨度自动选择原始采样点 / 小时汇总 / 日汇总。
+    可选 max_points: 累计趋势最多返回的点数 (默认 120)。
+    结果按 (uuid, 范围, 分辨率, 点数) 缓存，并带 ETag：数据未变化时浏览器重新验证得到 304。
     """
     uuid = request.args.get('uuid')
-    date_str = request.args.get('date')
-    
-    if not uuid or not date_str:
+    if not uuid:
         return jsonify({'status': 'error', 'message': '缺少参数'}), 400
+    try:
+        start_time, end_time = _parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    max_points = request.args.get('max_points', MAX_POINTS, type=int)
+    max_points = min(max(max_points, MAX_POINTS_RANGE[0]), MAX_POINTS_RANGE[1])
 
     try:
-        # 解析日期范围
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        start_time = datetime.combine(target_date, datetime.min.time())
-        end_time = datetime.combine(target_date, datetime.max.time())
-
-        # =================================================
-        # 1. 查询选中节点的历史记录
-        # =================================================
         # 确保 UUID 是字符串进行比较
         uuid = str(uuid)
-        
-        chart_records = HistoryData.query.filter(
-            HistoryData.uuid == uuid,
-            HistoryData.timestamp >= start_time,
-            HistoryData.timestamp <= end_time
-        ).order_by(HistoryData.timestamp.asc()).all()
-        
-        # 临时存储全量数据的列表
-        raw_times = []
-        raw_uploads = []
-        raw_downloads = []
-        raw_totals = [] 
-        
-        # 初始化24小时的数据桶
-        hourly_stats = {h: {'up': 0.0, 'down': 0.0} for h in range(24)}
-        
-        if chart_records:
-            # A. 计算累计趋势 (基于全量数据计算，保证准确性)
-            base_up = chart_records[0].total_up
-            base_down = chart_records[0].total_down
-            
-            prev_record = chart_records[0]
-
-            for r in chart_records:
-                # --- 1. 累计数据计算 ---
-                raw_times.append(r.timestamp.strftime('%H:%M'))
-                
-                curr_up = r.total_up - base_up
-                curr_down = r.total_down - base_down
-                
-                # 处理重启归零 (如果当前总流量小于基准，说明重启过，直接取当前值作为新基准的偏移)
-                # 这种简单的处理方式在重启瞬间会有跳变，但能保证后续增量正确
-                if curr_up < 0: curr_up = r.total_up
-                if curr_down < 0: curr_down = r.total_down
-                
-                # 转换为 GB
-                val_up = curr_up / 1024 / 1024 / 1024
-                val_down = curr_down / 1024 / 1024 / 1024
-                
-                raw_uploads.append(val_up)
-                raw_downloads.append(val_down)
-                raw_totals.append(val_up + val_down)
-
-                # --- 2. 每小时增量计算 ---
-                if r != prev_record:
-                    delta_up = r.total_up - prev_record.total_up
-                    delta_down = r.total_down - prev_record.total_down
-                    
-                    if delta_up < 0: delta_up = r.total_up
-                    if delta_down < 0: delta_down = r.total_down
-                    
-                    hour = r.timestamp.hour
-                    hourly_stats[hour]['up'] += delta_up
-                    hourly_stats[hour]['down'] += delta_down
-                
-                prev_record = r
-
-        # 数据抽样 (Downsampling)
-        # 如果数据点过多(例如超过200个)，前端渲染会非常卡顿甚至不显示
-        # 我们在这里进行均匀抽样，只返回约 120 个点给前端
-        MAX_POINTS = 120
-        total_points = len(raw_times)
-        
-        if total_points > MAX_POINTS:
-            step = total_points // MAX_POINTS
-            # 使用切片进行抽样
-            final_times = raw_times[::step]
-            final_uploads = [round(x, 4) for x in raw_uploads[::step]]
-            final_downloads = [round(x, 4) for x in raw_downloads[::step]]
-            final_totals = [round(x, 4) for x in raw_totals[::step]]
-            
-            # 确保最后一个点总是包含在内，显示最新状态
-            if total_points > 0 and (total_points - 1) % step != 0:
-                final_times.append(raw_times[-1])
-                final_uploads.append(round(raw_uploads[-1], 4))
-                final_downloads.append(round(raw_downloads[-1], 4))
-                final_totals.append(round(raw_totals[-1], 4))
+        resolution = _pick_resolution(uuid, start_time, end_time)
+
+        # 范围内日汇总行与最新数据时间构成的数据戳：采集写入或延长采样后变化，据此判断缓存/ETag 是否仍然有效
+        key = (uuid, start_time, end_time, resolution, max_points)
+        stamp = get_daily_rollup_stamp(uuid, _floor_bucket(start_time, timedelta(days=1)), end_time)
+        etag = make_etag(key, stamp)
+        # 包含今天的范围随时变化，每次都需要重新验证；更早的范围允许浏览器直接复用一段时间
+        cache_control = 'private, no-cache' if end_time.date() >= datetime.now().date() \
+            else f'private, max-age={CHART_PAST_MAX_AGE}'
+
+        if etag in request.if_none_match:
+            resp = current_app.response_class(status=304)
         else:
-            # 数据量不大，直接保留并取整
-            final_times = raw_times
-            final_uploads = [round(x, 4) for x in raw_uploads]
-            final_downloads = [round(x, 4) for x in raw_downloads]
-            final_totals = [round(x, 4) for x in raw_totals]
-
-        # 格式化每小时数据
-        bar_hours = [f"{h:02d}:00" for h in range(24)]
-        bar_up = [round(hourly_stats[h]['up'] / 1024 / 1024 / 1024, 4) for h in range(24)]
-        bar_down = [round(hourly_stats[h]['down'] / 1024 / 1024 / 1024, 4) for h in range(24)]
-
-        # =================================================
-        # 2. 生成所有节点的当日用量排名
-        # =================================================
-        all_nodes = get_all_nodes()
-        ranking_data = []
-        
-        # 预先获取当前选择的节点 ID (确保是字符串)
-        current_uuid_str = str(uuid)
-
-        for node in all_nodes:
-            node_uuid_str = str(node.uuid)
-            try:
-                # 优化查询：只查头尾，避免全表扫描
-                # 注意：在 PG 中这里的查询如果数据量巨大可能会慢，但通常有索引 idx_node_timestamp 会很快
-                first = HistoryData.query.filter(
-                    HistoryData.uuid == node_uuid_str, 
-                    HistoryData.timestamp >= start_time
-                ).order_by(HistoryData.timestamp.asc()).first()
-                
-                last = HistoryData.query.filter(
-                    HistoryData.uuid == node_uuid_str, 
-                    HistoryData.timestamp <= end_time
-                ).order_by(HistoryData.timestamp.desc()).first()
-                
-                usage_total = 0
-                usage_up = 0
-                usage_down = 0
-                
-                if first and last:
-                    d_up = last.total_up - first.total_up
-                    d_down = last.total_down - first.total_down
-                    
-                    if d_up < 0: d_up = last.total_up
-                    if d_down < 0: d_down = last.total_down
-                    
-                    usage_up = round(d_up / 1024 / 1024 / 1024, 3)
-                    usage_down = round(d_down / 1024 / 1024 / 1024, 3)
-                    usage_total = round(usage_up + usage_down, 3)
-                
-                ranking_data.append({
-                    'name': node.custom_name or node.name,
-                    'uuid': node_uuid_str, 
-                    'region': node.region,
-                    'usage': usage_total,
-                    'up': usage_up,
-                    'down': usage_down,
-                    'is_current': (node_uuid_str == current_uuid_str)
-                })
-            except Exception as e:
-                # 捕获单个节点查询错误，防止整个接口崩溃
-                print(f"Error processing node {node.name}: {e}")
-                continue
-            
-        # 降序排列
-        ranking_data.sort(key=lambda x: x['usage'], reverse=True)
-
-        return jsonify({
-            'status': 'success',
-            'data': {
-                'line': {
-                    'times': final_times,
-                    'uploads': final_uploads,
-                    'downloads': final_downloads,
-                    'totals': final_totals
-                },
-                'bar': {
-                    'hours': bar_hours,
-                    'up': bar_up,
-                    'down': bar_down
-                },
-                'ranking': ranking_data
-            }
-        })
+            data = _chart_cache.get(key, stamp)
+            if data is None:
+                data = _build_chart(uuid, start_time, end_time, resolution, max_points)
+                _chart_cache.put(key, stamp, data)
+            resp = jsonify({'status': 'success', 'data': data})
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = cache_control
+        return resp
 
     except Exception as e:
         print(f"API Error: {e}")
         traceback.print_exc() # 打印完整堆栈信息到控制台，方便调试
         return jsonify({'status': 'error', 'message': str(e)}), 500
+
+def _build_ranking(start_day, end_day):
+    """所有节点在 [start_day, end_day] 内的用量排名 (日汇总表求和，一次查询)，按用量降序"""
+    ranking = []
+    for node, delta_up, delta_down in get_daily_usage_ranking(start_day, end_day):
+        usage_up = round((delta_up or 0) / GB, 3)
+        usage_down = round((delta_down or 0) / GB, 3)
+        ranking.append({
+            'name': node.custom_name or node.name,
+            'uuid': str(node.uuid),
+            'region': node.region,
+            'usage': round(usage_up + usage_down, 3),
+            'up': usage_up,
+            'down': usage_down
+        })
+    ranking.sort(key=lambda x: x['usage'], reverse=True)
+    return ranking
+
+def _get_cached_ranking(start_date, end_date):
+    """返回 (ranking, 剩余缓存秒数)；缓存过期时重新查询"""
+    now = time.monotonic()
+    cache_key = (start_date, end_date)
+    with _ranking_cache_lock:
+        cached = _ranking_cache.get(cache_key)
+    if cached and cached[0] > now:
+        return cached[1], int(cached[0] - now)
+
+    ttl = RANKING_CACHE_SECONDS_TODAY if end_date >= datetime.now().date() else RANKING_CACHE_SECONDS_PAST
+    ranking = _build_ranking(
+        datetime.combine(start_date, datetime.min.time()), datetime.combine(end_date, datetime.min.time())
+    )
+    with _ranking_cache_lock:
+        # 顺带清理已过期的条目
+        for key in [k for k, (expires, _) in _ranking_cache.items() if expires <= now]:
+            del _ranking_cache[key]
+        _ranking_cache[cache_key] = (now + ttl, ranking)
+    return ranking, ttl
+
+def clear_history_caches():
+    """清空进程内的排名与图表缓存 (切换数据库后使用，如基准测试依次测试多个数据库)"""
+    with _ranking_cache_lock:
+        _ranking_cache.clear()
+    _chart_cache.clear()
+
+@bp.route('/api/ranking')
+@login_required
+def ranking_api():
+    """
+    API: 所有节点在某天 (date) 或某个日期范围 (start/end) 内的用量排名。
+    与节点无关，切换节点时前端不必重新请求；结果在进程内缓存，并允许浏览器在缓存时间内直接复用。
+    """
+    try:
+        start_time, end_time = _parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    try:
+        ranking, max_age = _get_cached_ranking(start_time.date(), end_time.date())
+    except Exception as e:
+        print(f"API Error: {e}")
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+    resp = jsonify({'status': 'success', 'data': {
+        'start': start_time.strftime('%Y-%m-%d'), 'end': end_time.strftime('%Y-%m-%d'), 'ranking': ranking
+    }})
+    resp.headers['Cache-Control'] = f'private, max-age={max_age}'
+    return resp
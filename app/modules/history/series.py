@@ -0,0 +1,91 @@
+import numpy as np
+
+# ----------------------------------------------------
+# 历史图表的序列计算
+# 增量 → 累计曲线、累计曲线 → 单点增量、游程压缩区间展开、按时间桶求和，
+# 以及 LTTB (Largest-Triangle-Three-Buckets) 降采样。
+# 时间轴统一用相对起点的整数微秒偏移，避免逐点处理 datetime；全部为 NumPy 数组运算。
+# ----------------------------------------------------
+
+def cumulative(deltas):
+    """逐点累加增量得到累计曲线 (不属于本时间段的起点由调用方把增量置 0)"""
+    if not len(deltas):
+        return []
+    return np.cumsum(np.asarray(deltas, dtype=np.int64))
+
+
+def steps(values):
+    """累计曲线相邻两点之差 (第一个点为 0)，即每个点的单点增量"""
+    if not len(values):
+        return []
+    values = np.asarray(values, dtype=np.int64)
+    return np.diff(values, prepend=values[:1])
+
+
+def expand_intervals(offsets, valid_offsets, *columns, end_offset):
+    """
+    游程压缩的记录在 [offset, valid_offset] 内数值不变：valid_offset 大于 offset 的点展开为起止两个点
+    (终点不超过 end_offset)。起点之前的 offset (< 0，如开始前写入、仍在有效期内的一行) 截到 0；
+    valid_offsets 为 None 表示未压缩。返回 (新的 offsets, 各列)。
+    """
+    offsets = np.maximum(np.asarray(offsets, dtype=np.int64), 0)
+    valid = np.asarray([-1 if v is None else v for v in valid_offsets], dtype=np.int64)
+    extra = valid > offsets
+    repeats = 1 + extra
+    # 每个展开的第二个点紧跟在原点之后
+    second = np.cumsum(repeats)[extra] - 1
+    out_offsets = np.repeat(offsets, repeats)
+    out_offsets[second] = np.minimum(valid[extra], end_offset)
+    return out_offsets, [np.repeat(np.asarray(c), repeats) for c in columns]
+
+
+def bucket_sums(offsets, values, step, n_buckets):
+    """按 offset // step 把 values 累加到 n_buckets 个时间桶 (超出范围的丢弃)，返回整数列表"""
+    index = np.asarray(offsets, dtype=np.int64) // step
+    weights = np.asarray(values, dtype=np.int64)
+    keep = (index >= 0) & (index < n_buckets)
+    sums = np.zeros(n_buckets, dtype=np.int64)
+    np.add.at(sums, index[keep], weights[keep])
+    return sums.tolist()
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标 (升序，始终包含首尾两点)。
+    与等间隔抽样不同，每个桶保留与前一个已选点、下一桶均值构成三角形面积最大的点，峰谷不会被跳过。
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return list(range(n))
+
+    xs = np.asarray(x, dtype=np.float64)
+    ys = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (max_points - 2)
+    selected = [0]
+    a = 0
+    for i in range(max_points - 2):
+        start = int(i * every) + 1
+        stop = int((i + 1) * every) + 1
+        next_start = stop
+        next_stop = min(int((i + 2) * every) + 1, n)
+        if next_start >= next_stop:     # 最后一个桶：下一"桶"只有最后一个点
+            next_start, next_stop = n - 1, n
+        avg_x = xs[next_start:next_stop].mean()
+        avg_y = ys[next_start:next_stop].mean()
+        area = np.abs(
+            (xs[a] - avg_x) * (ys[start:stop] - ys[a]) - (xs[a] - xs[start:stop]) * (avg_y - ys[a])
+        )
+        a = start + int(area.argmax())
+        selected.append(a)
+    selected.append(n - 1)
+    return selected
+
+
+def add(a, b):
+    """两列逐点相加"""
+    return np.asarray(a) + np.asarray(b)
+
+
+def take(values, indices):
+    """按下标取值，返回普通 Python 列表 (便于 JSON 序列化)"""
+    return np.asarray(values)[np.asarray(indices, dtype=np.int64)].tolist()
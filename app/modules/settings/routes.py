@@ -3,7 +3,7 @@
 from flask import render_template, request, flash, redirect, url_for, current_app, jsonify
 from flask_login import login_required, logout_user, current_user
 from app.modules.settings import settings_bp
-from app.utils.db_manager import get_all_configs, set_config, update_user_password, get_total_nodes, get_db_file_size 
+from app.utils.db_manager import get_all_configs, set_config, update_user_password, get_total_nodes, get_db_file_size, get_recent_retention_runs
 import os
 import json
 import requests
@@ -195,11 +195,15 @@ def general_settings():
     # 3. 读取当前的数据库文件配置，传递给前端
     current_db_config = load_db_config_file()
 
-    # 4. 渲染模板
+    # 4. 最近的过期数据清理记录
+    retention_runs = get_recent_retention_runs(limit=10)
+
+    # 5. 渲染模板
     return render_template('settings.html', 
                            config_items=config_items,
                            storage_stats=storage_stats,
-                           db_config=current_db_config)
+                           db_config=current_db_config,
+                           retention_runs=retention_runs)
 
 # 测试数据库连接的 API
 @settings_bp.route('/test_db_connection', methods=['POST'])
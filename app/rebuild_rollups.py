@@ -0,0 +1,26 @@
+"""
+重建历史汇总表 (history_hourly / history_daily)
+
+    python -m app.rebuild_rollups                   # 全量重建 (原始数据只剩部分的最早一天保留已有汇总)
+    python -m app.rebuild_rollups --since 2025-01-01  # 从指定日期起重建
+"""
+import argparse
+from datetime import datetime
+
+from app import create_app
+from app.modules.data_core.rollups import rebuild_all_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description='从 history_data 重建小时/日汇总表')
+    parser.add_argument('--since', help='从该日期 (YYYY-MM-DD) 起重建，默认全量')
+    args = parser.parse_args()
+    since = datetime.strptime(args.since, '%Y-%m-%d') if args.since else None
+
+    app = create_app(with_scheduler=False)
+    with app.app_context():
+        rebuild_all_rollups(since)
+
+
+if __name__ == '__main__':
+    main()
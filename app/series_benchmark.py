@@ -0,0 +1,293 @@
+"""
+历史图表序列计算的基准测试
+
+    python -m app.series_benchmark [--points 100000] [--max-points 120] [--repeat 5] [--output 文件]
+
+在内存中生成一条 N 点的合成序列 (5 分钟一个采样点，含流量波动、突发尖峰、长时间空闲的游程压缩记录与计数器重启归零)，
+分别用原来的逐行实现与 app.modules.history.series (NumPy) 完成同样的工作：
+    累计值 → 增量 (处理重启归零) → 累计曲线 → 展开空闲区间 → 每小时柱状图 → 降采样到 max_points 个点并生成时间标签
+对耗时计时，并比较等间隔抽样与 LTTB (与图表接口相同，在单点增量序列上选点) 两种降采样的保真度：
+    cumulative_line     累计曲线降采样后按直线插值，与完整曲线的平均/最大偏差 (GB)
+    per_sample_usage    选中点的单点增量：保留下来的最大值 / 全序列最大值，以及最大的 20 个尖峰中被保留的个数
+结果以 JSON 输出到 stdout (进度信息输出到 stderr)，或用 --output 写入指定文件。
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.modules.history import series
+
+GB = 1024 * 1024 * 1024
+SAMPLE_MINUTES = 5
+TIME_FORMAT = '%m-%d %H:%M'
+BAR_FORMAT = '%m-%d %H:00'
+
+# 合成数据的随机事件概率 (每个采样点)
+RESET_PROBABILITY = 0.0005          # 计数器重启归零
+SPIKE_PROBABILITY = 0.002           # 突发流量 (单点增量放大)
+IDLE_PROBABILITY = 0.01             # 进入空闲，写入一条游程压缩记录
+IDLE_SAMPLES = (3, 60)              # 空闲持续的采样点数
+TOP_SPIKES = 20
+
+
+def generate_series(points, seed=0):
+    """生成 [(timestamp, valid_until, total_up, total_down), ...]，valid_until 为 None 表示未压缩"""
+    rng = random.Random(seed)
+    step = timedelta(minutes=SAMPLE_MINUTES)
+    t = datetime(2026, 1, 1)
+    up, down = rng.randint(0, 10 ** 12), rng.randint(0, 10 ** 12)
+    rate = 50 * 1024 * 1024
+    rows = []
+    while len(rows) < points:
+        if rng.random() < IDLE_PROBABILITY:
+            idle = rng.randint(*IDLE_SAMPLES)
+            rows.append((t, t + step * idle, up, down))
+            t += step * (idle + 1)
+            continue
+        if rng.random() < RESET_PROBABILITY:
+            up = down = 0
+        else:
+            burst = rng.uniform(20, 80) if rng.random() < SPIKE_PROBABILITY else 1
+            up += int(rng.expovariate(1 / (rate * 0.3)) * burst)
+            down += int(rng.expovariate(1 / rate) * burst)
+        rows.append((t, None, up, down))
+        t += step
+    return rows
+
+
+def legacy_pipeline(rows, start, end, max_points):
+    """原来的实现：逐行计算并格式化每个点，最后等间隔抽样；每小时用量用 dict 累加"""
+    times, uploads, downloads, totals = [], [], [], []
+    hourly = {}
+    prev = None
+    acc_up = acc_down = 0
+    for ts, valid_until, total_up, total_down in rows:
+        if prev is not None:
+            delta_up = total_up - prev[0]
+            delta_up = delta_up if delta_up >= 0 else total_up
+            delta_down = total_down - prev[1]
+            delta_down = delta_down if delta_down >= 0 else total_down
+            acc_up += delta_up
+            acc_down += delta_down
+            bucket = hourly.setdefault(ts.replace(minute=0, second=0, microsecond=0), [0, 0])
+            bucket[0] += delta_up
+            bucket[1] += delta_down
+        prev = (total_up, total_down)
+        val_up = acc_up / GB
+        val_down = acc_down / GB
+
+        point_times = [max(ts, start)]
+        if valid_until and valid_until > point_times[0]:
+            point_times.append(min(valid_until, end))
+        for point_time in point_times:
+            times.append(point_time.strftime(TIME_FORMAT))
+            uploads.append(val_up)
+            downloads.append(val_down)
+            totals.append(val_up + val_down)
+
+    total_points = len(times)
+    indices = list(range(total_points))
+    if total_points > max_points:
+        step = total_points // max_points
+        indices = indices[::step]
+        if (total_points - 1) % step != 0:
+            indices.append(total_points - 1)
+    line = {
+        'times': [times[i] for i in indices],
+        'uploads': [round(uploads[i], 4) for i in indices],
+        'downloads': [round(downloads[i], 4) for i in indices],
+        'totals': [round(totals[i], 4) for i in indices],
+    }
+
+    labels, bar_up, bar_down = [], [], []
+    bucket = start.replace(minute=0, second=0, microsecond=0)
+    while bucket <= end:
+        delta_up, delta_down = hourly.get(bucket, (0, 0))
+        labels.append(bucket.strftime(BAR_FORMAT))
+        bar_up.append(round(delta_up / GB, 4))
+        bar_down.append(round(delta_down / GB, 4))
+        bucket += timedelta(hours=1)
+    return line, (labels, bar_up, bar_down), indices
+
+
+def _counter_deltas(totals):
+    """相邻累计值之差，计数器变小时取当前值；第一个点为 0 (与写入 history_data 的 delta 列规则相同)"""
+    values = np.asarray(totals, dtype=np.int64)
+    diff = np.diff(values, prepend=values[:1])
+    return np.where(diff >= 0, diff, values)
+
+
+def engine_pipeline(rows, start, end, max_points):
+    """series 模块：整列计算，只对 LTTB 保留下来的点生成标签"""
+    us = timedelta(microseconds=1)
+    timestamps, valid_untils, total_up, total_down = zip(*rows)
+    delta_up = _counter_deltas(total_up)
+    delta_down = _counter_deltas(total_down)
+    acc_up = series.cumulative(delta_up)
+    acc_down = series.cumulative(delta_down)
+
+    first_hour = start.replace(minute=0, second=0, microsecond=0)
+    hour_us = timedelta(hours=1) // us
+    n_buckets = (end - first_hour) // timedelta(hours=1) + 1
+    hour_offsets = [(ts - first_hour) // us for ts in timestamps]
+    sums_up = series.bucket_sums(hour_offsets, delta_up, hour_us, n_buckets)
+    sums_down = series.bucket_sums(hour_offsets, delta_down, hour_us, n_buckets)
+
+    offsets = [(ts - start) // us for ts in timestamps]
+    valid_offsets = [(v - start) // us if v else None for v in valid_untils]
+    offsets, (acc_up, acc_down) = series.expand_intervals(
+        offsets, valid_offsets, acc_up, acc_down, end_offset=(end - start) // us
+    )
+    indices = series.lttb_indices(offsets, series.steps(series.add(acc_up, acc_down)), max_points)
+    times, uploads, downloads, totals = [], [], [], []
+    for offset, up, down in zip(series.take(offsets, indices), series.take(acc_up, indices),
+                                series.take(acc_down, indices)):
+        times.append((start + timedelta(microseconds=offset)).strftime(TIME_FORMAT))
+        uploads.append(round(up / GB, 4))
+        downloads.append(round(down / GB, 4))
+        totals.append(round(up / GB + down / GB, 4))
+    line = {'times': times, 'uploads': uploads, 'downloads': downloads, 'totals': totals}
+
+    labels = [(first_hour + timedelta(hours=i)).strftime(BAR_FORMAT) for i in range(n_buckets)]
+    bars = (labels, [round(v / GB, 4) for v in sums_up], [round(v / GB, 4) for v in sums_down])
+    return line, bars, indices
+
+
+def _full_line(rows, start, end):
+    """完整分辨率的 (x 微秒偏移, 总累计字节, 单点增量) 列表，与两种实现展开后的点一一对应"""
+    us = timedelta(microseconds=1)
+    timestamps, valid_untils, total_up, total_down = zip(*rows)
+    deltas = series.add(_counter_deltas(total_up), _counter_deltas(total_down))
+    offsets = [(ts - start) // us for ts in timestamps]
+    valid_offsets = [(v - start) // us if v else None for v in valid_untils]
+    x, (y,) = series.expand_intervals(
+        offsets, valid_offsets, series.cumulative(deltas), end_offset=(end - start) // us
+    )
+    # 空闲区间展开出的终点数值不变，单点增量为 0
+    return [int(v) for v in x], [int(v) for v in y], [int(v) for v in series.steps(y)]
+
+
+def _stride_indices(n, max_points):
+    """原实现的等间隔抽样下标 (包含最后一个点)"""
+    if n <= max_points:
+        return list(range(n))
+    step = n // max_points
+    indices = list(range(0, n, step))
+    if indices[-1] != n - 1:
+        indices.append(n - 1)
+    return indices
+
+
+def _line_error(x, y, indices):
+    """降采样点按直线插值与完整曲线的偏差 (GB)：平均值与最大值"""
+    total = count = 0
+    max_error = 0.0
+    for left, right in zip(indices, indices[1:]):
+        x0, y0, x1, y1 = x[left], y[left], x[right], y[right]
+        for j in range(left + 1, right):
+            estimate = y0 if x1 == x0 else y0 + (y1 - y0) * (x[j] - x0) / (x1 - x0)
+            error = abs(y[j] - estimate)
+            total += error
+            count += 1
+            max_error = max(max_error, error)
+    return {
+        'points': len(indices),
+        'mean_error_gb': round(total / max(count, 1) / GB, 4),
+        'max_error_gb': round(max_error / GB, 4),
+    }
+
+
+def _peak_retention(d, indices):
+    """保留下来的最大单点增量占全序列最大值的比例，以及全序列最大的 TOP_SPIKES 个尖峰中被保留的个数"""
+    top = set(sorted(range(len(d)), key=d.__getitem__)[-TOP_SPIKES:])
+    return {
+        'points': len(indices),
+        'peak_retained': round(max(d[i] for i in indices) / (max(d) or 1), 4),
+        f'top{TOP_SPIKES}_spikes_retained': len(top.intersection(indices)),
+    }
+
+
+def _timed(func, repeat):
+    """执行 repeat 次，返回耗时统计 (毫秒)"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'runs': repeat,
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='历史图表序列计算基准测试')
+    parser.add_argument('--points', type=int, default=100000, help='序列点数')
+    parser.add_argument('--max-points', type=int, default=120, help='降采样后的点数')
+    parser.add_argument('--repeat', type=int, default=5, help='每种实现的执行次数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--output', default='-', help='结果写入该文件 (默认 "-" 输出到 stdout)')
+    args = parser.parse_args()
+
+    rows = generate_series(args.points, args.seed)
+    start = rows[0][0].replace(hour=0, minute=0)
+    end = max(r[1] or r[0] for r in rows)
+
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'points': args.points,
+            'max_points': args.max_points,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'timings': {},
+        'fidelity': {},
+    }
+
+    print(f">>> 序列: {args.points} 点，{start} ~ {end}", file=sys.stderr)
+    report['timings']['legacy'] = _timed(lambda: legacy_pipeline(rows, start, end, args.max_points), args.repeat)
+    _, legacy_bars, _ = legacy_pipeline(rows, start, end, args.max_points)
+
+    engine = _timed(lambda: engine_pipeline(rows, start, end, args.max_points), args.repeat)
+    _, engine_bars, _ = engine_pipeline(rows, start, end, args.max_points)
+    # 两种实现的柱状图应完全一致
+    engine['bars_match_legacy'] = engine_bars == legacy_bars
+    engine['speedup'] = round(report['timings']['legacy']['median_ms'] / max(engine['median_ms'], 1e-6), 2)
+    report['timings']['engine'] = engine
+
+    x, y, d = _full_line(rows, start, end)
+    stride = _stride_indices(len(x), args.max_points)
+    lttb = series.lttb_indices(x, d, args.max_points)
+    report['fidelity']['cumulative_line'] = {
+        'stride': _line_error(x, y, stride),
+        'lttb': _line_error(x, y, lttb),
+    }
+    report['fidelity']['per_sample_usage'] = {
+        'stride': _peak_retention(d, stride),
+        'lttb': _peak_retention(d, lttb),
+    }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output != '-':
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f">>> 结果已写入 {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+SQLite 数据库维护：切换为增量回收模式
+
+    python -m app.sqlite_vacuum
+
+旧数据库的 auto_vacuum 为 NONE，过期数据删除后空闲页不会归还给文件系统，数据库文件不会缩小。
+本命令把 auto_vacuum 切换为 INCREMENTAL 并执行一次完整 VACUUM，之后定时清理任务
+通过 PRAGMA incremental_vacuum 逐步回收空闲页。
+VACUUM 会重写整个数据库文件 (需要与数据库同等大小的空闲磁盘空间)，期间阻塞采集写入，
+请在维护窗口内执行 (可先停止采集进程)。新建的数据库默认已是 INCREMENTAL，无需执行。
+"""
+import time
+
+from app import create_app
+from app.utils.db_manager import (
+    get_sqlite_auto_vacuum,
+    sqlite_enable_incremental_vacuum,
+    get_db_size_bytes,
+    SQLITE_AUTO_VACUUM_INCREMENTAL,
+)
+
+
+def main():
+    app = create_app(with_scheduler=False)
+    with app.app_context():
+        mode = get_sqlite_auto_vacuum()
+        if mode is None:
+            print(">>> [Vacuum] 当前不是 SQLite 数据库，无需转换。")
+            return
+        if mode == SQLITE_AUTO_VACUUM_INCREMENTAL:
+            print(">>> [Vacuum] auto_vacuum 已是 INCREMENTAL，无需转换。")
+            return
+
+        size_before = get_db_size_bytes()
+        print(f">>> [Vacuum] 切换 auto_vacuum 为 INCREMENTAL 并执行完整 VACUUM "
+              f"(数据库 {size_before / 1024 / 1024:.1f} MB)...")
+        started = time.monotonic()
+        sqlite_enable_incremental_vacuum()
+        size_after = get_db_size_bytes()
+        print(f">>> [Vacuum] 完成，耗时 {time.monotonic() - started:.1f}s，"
+              f"数据库 {size_before / 1024 / 1024:.1f} MB -> {size_after / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-from sqlalchemy import desc, func, case, BigInteger, literal_column, text
+from datetime import datetime, timedelta
+from sqlalchemy import desc, func, case, BigInteger, literal_column, text, update, or_, select, lambda_stmt, false
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_login import UserMixin
 import json
 import os
+import threading
+import time
 
 # =========================================================
 #  第一部分：基础初始化
@@ -37,6 +41,12 @@ class AppSetting(db.Model):
     description = db.Column(db.String(255))
 
 
+class SettingsVersion(db.Model):
+    """配置版本号 (单行)：每次 set_config 递增，其他进程据此判断本地配置缓存是否过期"""
+    __tablename__ = 'settings_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
 class Node(db.Model):
     __tablename__ = 'nodes'
     uuid = db.Column(db.String(36), primary_key=True)
@@ -66,25 +76,330 @@ class Node(db.Model):
 
 class HistoryData(db.Model):
     __tablename__ = 'history_data'
-    __table_args__ = (db.Index('idx_node_timestamp', 'uuid', 'timestamp'),)
+    # (uuid, timestamp) 唯一：同一节点同一采样时刻只保留一条，重复写入会被忽略
+    __table_args__ = (db.Index('uq_history_uuid_timestamp', 'uuid', 'timestamp', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     uuid = db.Column(db.String(36), db.ForeignKey('nodes.uuid'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.now, index=True)
     total_up = db.Column(db.BigInteger)
     total_down = db.Column(db.BigInteger)
     cpu_usage = db.Column(db.Float)
+    # 游程压缩：计数器不变的后续采样不再写入新行，而是把本行的有效期延长到最后一次相同采样的时间
+    valid_until = db.Column(db.DateTime)
+    # 与该节点上一采样点相比的流量增量 (字节)，写入时计算一次；计数器变小 (节点重启归零) 时取当前值。
+    # 任意时间窗口的用量 = SUM(delta)，不必再从累计值推算
+    delta_up = db.Column(db.BigInteger)
+    delta_down = db.Column(db.BigInteger)
+
+    @property
+    def last_seen(self):
+        """该行计数器值最后一次被确认的时间"""
+        return self.valid_until or self.timestamp
+
+
+class NodeLatest(db.Model):
+    """每个节点的最新一次采样 (写入 history_data 时同步更新)，仪表盘只需读取 O(节点数) 行"""
+    __tablename__ = 'node_latest'
+    uuid = db.Column(db.String(36), primary_key=True)
+    # 最新一次采样时间 (游程压缩时为最后一次相同采样的时间)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    total_up = db.Column(db.BigInteger)
+    total_down = db.Column(db.BigInteger)
+    cpu_usage = db.Column(db.Float)
+
+
+class HistoryHourly(db.Model):
+    """按小时汇总的历史数据 (写入 history_data 时增量维护)"""
+    __tablename__ = 'history_hourly'
+    __table_args__ = (db.Index('uq_history_hourly_uuid_bucket', 'uuid', 'bucket', unique=True),)
+    id = db.Column(db.Integer, primary_key=True)
+    uuid = db.Column(db.String(36), nullable=False)
+    # 小时起点 (整点)
+    bucket = db.Column(db.DateTime, nullable=False)
+    # 该小时内的流量增量 (字节)：每个采样点与上一采样点的差值计入采样点所在的小时
+    delta_up = db.Column(db.BigInteger, default=0)
+    delta_down = db.Column(db.BigInteger, default=0)
+    # 落在该时间桶内的 history_data 行数 (游程压缩的一行只在其 timestamp 计一次)，
+    # cpu_sum / cpu_max 取这些行的 cpu_usage
+    samples = db.Column(db.Integer, default=0)
+    cpu_sum = db.Column(db.Float, default=0.0)
+    cpu_max = db.Column(db.Float, default=0.0)
+
+    @property
+    def cpu_avg(self):
+        return self.cpu_sum / self.samples if self.samples else 0.0
+
+
+class HistoryDaily(db.Model):
+    """按天汇总的历史数据 (写入 history_data 时增量维护，不受原始数据保留天数影响)"""
+    __tablename__ = 'history_daily'
+    __table_args__ = (db.Index('uq_history_daily_uuid_bucket', 'uuid', 'bucket', unique=True),)
+    id = db.Column(db.Integer, primary_key=True)
+    uuid = db.Column(db.String(36), nullable=False)
+    # 当日 00:00
+    bucket = db.Column(db.DateTime, nullable=False)
+    delta_up = db.Column(db.BigInteger, default=0)
+    delta_down = db.Column(db.BigInteger, default=0)
+    # 采样行数，定义同 history_hourly
+    samples = db.Column(db.Integer, default=0)
+    cpu_sum = db.Column(db.Float, default=0.0)
+    cpu_max = db.Column(db.Float, default=0.0)
+
+    @property
+    def cpu_avg(self):
+        return self.cpu_sum / self.samples if self.samples else 0.0
+
+
+class CollectorRun(db.Model):
+    """采集任务的运行记录 (每次快照/静态同步执行一条)"""
+    __tablename__ = 'collector_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    # 任务类型: snapshot / static
+    job = db.Column(db.String(16), nullable=False)
+    started_at = db.Column(db.DateTime, default=datetime.now, index=True)
+    finished_at = db.Column(db.DateTime)
+    duration_ms = db.Column(db.Integer, default=0)
+    node_count = db.Column(db.Integer, default=0)
+    success_count = db.Column(db.Integer, default=0)
+    failure_count = db.Column(db.Integer, default=0)
+    skipped_count = db.Column(db.Integer, default=0)
+    records_written = db.Column(db.Integer, default=0)
+    db_write_ms = db.Column(db.Integer, default=0)
+    # 各节点 HTTP 耗时 (JSON: {uuid: 毫秒})
+    node_latencies = db.Column(db.Text, default='{}')
+    error = db.Column(db.String(255))
+
+    def get_latencies_dict(self):
+        try:
+            return json.loads(self.node_latencies) if self.node_latencies else {}
+        except:
+            return {}
+
+
+class RefreshJob(db.Model):
+    """手动刷新任务 (保存在数据库中，多个 Web Worker 都能查询到任务状态并合并重复请求)"""
+    __tablename__ = 'refresh_jobs'
+    id = db.Column(db.String(32), primary_key=True)
+    # 需要刷新的节点 (JSON 数组)，为空表示全量刷新
+    node_uuids = db.Column(db.Text)
+    # 状态: queued / running / done / partial / failed
+    status = db.Column(db.String(16), default='queued', index=True)
+    message = db.Column(db.String(255))
+    # 运行统计 (JSON: node_count / success_count / failure_count ...)
+    stats = db.Column(db.Text, default='{}')
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+    finished_at = db.Column(db.DateTime)
+
+    def get_node_uuids(self):
+        return json.loads(self.node_uuids) if self.node_uuids else None
+
+    def get_stats_dict(self):
+        try:
+            return json.loads(self.stats) if self.stats else {}
+        except:
+            return {}
+
+
+class BackfillJob(db.Model):
+    """历史数据补采任务 (一次补采 = 一个 Job，包含若干个缺口 Task)"""
+    __tablename__ = 'backfill_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    # 状态: running / completed / failed
+    status = db.Column(db.String(16), default='running', index=True)
+    total_tasks = db.Column(db.Integer, default=0)
+    done_tasks = db.Column(db.Integer, default=0)
+    failed_tasks = db.Column(db.Integer, default=0)
+    inserted_records = db.Column(db.Integer, default=0)
+    message = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = db.Column(db.DateTime)
+
+
+class BackfillTask(db.Model):
+    """单个节点的一段数据缺口 (gap_start, gap_end)，完成后即作为断点保存"""
+    __tablename__ = 'backfill_tasks'
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('backfill_jobs.id', ondelete='CASCADE'), nullable=False, index=True)
+    uuid = db.Column(db.String(36), nullable=False)
+    gap_start = db.Column(db.DateTime, nullable=False)
+    gap_end = db.Column(db.DateTime, nullable=False)
+    # 状态: pending / done / failed
+    status = db.Column(db.String(16), default='pending')
+    inserted = db.Column(db.Integer, default=0)
+    error = db.Column(db.String(255))
+
+
+class RetentionRun(db.Model):
+    """过期历史数据清理的运行记录 (每次清理一条)"""
+    __tablename__ = 'retention_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, default=datetime.now, index=True)
+    duration_ms = db.Column(db.Integer, default=0)
+    # 早于 cutoff 的记录被视为过期
+    cutoff = db.Column(db.DateTime)
+    rows_deleted = db.Column(db.Integer, default=0)
+    batches = db.Column(db.Integer, default=0)
+    # 数据库文件实际缩小的字节数 (SQLite 增量 VACUUM 后)
+    bytes_freed = db.Column(BigInteger, default=0)
+    # 本轮时间预算内是否清理完毕 (未完成的部分留给下一轮)
+    completed = db.Column(db.Boolean, default=True)
+    error = db.Column(db.String(255))
+
+
+class CollectorLease(db.Model):
+    """采集器租约：多个采集进程 (可跨主机) 通过同一行记录选主，只有持有者执行采集任务"""
+    __tablename__ = 'collector_leases'
+    name = db.Column(db.String(32), primary_key=True)
+    # 持有者标识: 主机名:进程号:随机后缀
+    holder = db.Column(db.String(128), nullable=False)
+    acquired_at = db.Column(db.DateTime, default=datetime.now)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
 
 
 # =========================================================
 #  第三部分：全局操作接口 (Operations / DAO)
 # =========================================================
 
+# --- 0. 结构升级 ---
+
+def _add_column_if_missing(table, column, sqlite_type, pg_type):
+    """ALTER TABLE ADD COLUMN (列已存在时跳过)，返回是否新增了该列"""
+    columns = {col['name'] for col in db.inspect(db.engine).get_columns(table)}
+    if column in columns:
+        return False
+    ddl_type = pg_type if 'postgresql' in db.engine.url.drivername else sqlite_type
+    print(f">>> [DB Upgrade] 为 {table} 新增字段 {column}...")
+    db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+    db.session.commit()
+    return True
+
+def _backfill_history_deltas():
+    """
+    [升级时调用一次] 用窗口函数 LAG 为已有的 history_data 计算 delta_up / delta_down，
+    规则与 _counter_delta 一致：节点的第一条记录为 0，计数器变小时取当前值。
+    """
+    print(">>> [DB Upgrade] 计算 history_data 的 delta_up / delta_down...")
+    db.session.execute(text("""
+        UPDATE history_data SET
+            delta_up = CASE
+                WHEN d.prev_up IS NULL THEN 0
+                WHEN COALESCE(history_data.total_up, 0) >= d.prev_up THEN COALESCE(history_data.total_up, 0) - d.prev_up
+                ELSE COALESCE(history_data.total_up, 0) END,
+            delta_down = CASE
+                WHEN d.prev_down IS NULL THEN 0
+                WHEN COALESCE(history_data.total_down, 0) >= d.prev_down THEN COALESCE(history_data.total_down, 0) - d.prev_down
+                ELSE COALESCE(history_data.total_down, 0) END
+        FROM (
+            SELECT id,
+                   LAG(COALESCE(total_up, 0)) OVER (PARTITION BY uuid ORDER BY timestamp) AS prev_up,
+                   LAG(COALESCE(total_down, 0)) OVER (PARTITION BY uuid ORDER BY timestamp) AS prev_down
+            FROM history_data
+        ) AS d
+        WHERE history_data.id = d.id
+    """))
+    db.session.commit()
+
+def ensure_schema():
+    """
+    [启动时调用] 对已存在的旧数据库做幂等的结构升级。
+    db.create_all() 只会创建缺失的表，不会修改已有表，因此新增的索引/约束/字段在这里补齐。
+    """
+    try:
+        existing_indexes = {ix['name'] for ix in db.inspect(db.engine).get_indexes('history_data')}
+        if 'uq_history_uuid_timestamp' not in existing_indexes:
+            print(">>> [DB Upgrade] 为 history_data 创建 (uuid, timestamp) 唯一索引...")
+            # 先清理历史上可能存在的重复记录 (保留 id 最小的一条)
+            db.session.execute(text(
+                "DELETE FROM history_data WHERE id NOT IN "
+                "(SELECT MIN(id) FROM history_data GROUP BY uuid, timestamp)"
+            ))
+            db.session.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_history_uuid_timestamp "
+                "ON history_data (uuid, timestamp)"
+            ))
+            # 旧的普通复合索引与唯一索引重复，删除以减少写入开销
+            db.session.execute(text("DROP INDEX IF EXISTS idx_node_timestamp"))
+            db.session.commit()
+
+        _add_column_if_missing('history_data', 'valid_until', 'DATETIME', 'TIMESTAMP')
+        added_up = _add_column_if_missing('history_data', 'delta_up', 'BIGINT', 'BIGINT')
+        added_down = _add_column_if_missing('history_data', 'delta_down', 'BIGINT', 'BIGINT')
+        if (added_up or added_down) and db.session.query(HistoryData.id).first() is not None:
+            _backfill_history_deltas()
+
+        # 旧数据库：用 history_data 中各节点的最新一行初始化 node_latest (仅执行一次)
+        if db.session.query(NodeLatest.uuid).first() is None and db.session.query(HistoryData.id).first() is not None:
+            print(">>> [DB Upgrade] 初始化 node_latest...")
+            latest = db.session.query(
+                HistoryData.uuid, func.max(HistoryData.timestamp).label('max_timestamp')
+            ).group_by(HistoryData.uuid).subquery()
+            db.session.execute(NodeLatest.__table__.insert().from_select(
+                ['uuid', 'timestamp', 'total_up', 'total_down', 'cpu_usage'],
+                db.session.query(
+                    HistoryData.uuid, func.coalesce(HistoryData.valid_until, HistoryData.timestamp),
+                    HistoryData.total_up, HistoryData.total_down, HistoryData.cpu_usage
+                ).join(latest, db.and_(
+                    HistoryData.uuid == latest.c.uuid, HistoryData.timestamp == latest.c.max_timestamp
+                ))
+            ))
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f">>> [DB Upgrade] 结构升级失败: {e}")
+
+    # PostgreSQL: 按配置把 history_data 转换为按月分区表，并提前创建后续月份的分区
+    from flask import current_app
+    if 'postgresql' in db.engine.url.drivername and current_app.config.get('HISTORY_PARTITIONING') == 'monthly':
+        from app.utils.pg_partitioning import is_history_partitioned, convert_history_to_partitioned, ensure_history_partitions
+        if not is_history_partitioned():
+            convert_history_to_partitioned()
+        ensure_history_partitions()
+
+def _dialect_insert(model):
+    """返回当前数据库方言的 INSERT 构造器 (支持 ON CONFLICT)。"""
+    if 'postgresql' in db.engine.url.drivername:
+        return pg_insert(model)
+    return sqlite_insert(model)
+
 # --- 1. 配置相关操作 ---
 
+# 进程内配置缓存：一次性加载全部配置，每隔 SETTINGS_CACHE_TTL 秒检查一次数据库中的版本号，
+# 版本变化 (其他进程修改了配置) 时整体重新加载；本进程 set_config 后立即失效。
+SETTINGS_CACHE_TTL = 5
+_settings_cache = {'values': None, 'version': None, 'checked_at': 0.0}
+_settings_cache_lock = threading.Lock()
+
+def _read_settings_version():
+    return db.session.query(SettingsVersion.version).filter(SettingsVersion.id == 1).scalar() or 0
+
+def _get_cached_settings():
+    """返回 {key: value}，必要时从数据库重新加载"""
+    now = time.monotonic()
+    with _settings_cache_lock:
+        values = _settings_cache['values']
+        if values is not None and now - _settings_cache['checked_at'] < SETTINGS_CACHE_TTL:
+            return values
+
+    version = _read_settings_version()
+    with _settings_cache_lock:
+        if _settings_cache['values'] is not None and _settings_cache['version'] == version:
+            _settings_cache['checked_at'] = now
+            return _settings_cache['values']
+
+    values = {key: value for key, value in db.session.query(AppSetting.key, AppSetting.value).all()}
+    with _settings_cache_lock:
+        _settings_cache.update(values=values, version=version, checked_at=now)
+    return values
+
+def invalidate_config_cache():
+    with _settings_cache_lock:
+        _settings_cache.update(values=None, version=None, checked_at=0.0)
+
 def get_config(key, default=None):
     try:
-        setting = AppSetting.query.get(key)
-        return setting.value if setting else default
+        value = _get_cached_settings().get(key)
+        return value if value is not None else default
     except Exception as e:
         print(f"Error reading config {key}: {e}")
         return default
@@ -98,7 +413,13 @@ def set_config(key, value, description=None):
         setting.value = str(value)
         if description:
             setting.description = description
+        # 递增版本号 (与配置写入同一事务)，其他进程的缓存在 SETTINGS_CACHE_TTL 内失效
+        stmt = _dialect_insert(SettingsVersion).values(id=1, version=1)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['id'], set_={'version': SettingsVersion.version + 1}
+        ))
         db.session.commit()
+        invalidate_config_cache()
         return True
     except Exception as e:
         db.session.rollback()
@@ -154,8 +475,21 @@ def get_db_file_size():
 
 # --- 2. 节点相关操作 ---
 
+def _parse_expired_at(expired_at_str):
+    """解析 Komari 返回的到期时间 (ISO 格式)，失败返回 None"""
+    if not expired_at_str:
+        return None
+    try:
+        # 兼容 ISO 格式的时间字符串
+        if expired_at_str.endswith('Z'):
+            expired_at_str = expired_at_str[:-1]
+        return datetime.fromisoformat(expired_at_str)
+    except ValueError as ve:
+        print(f"Warning: Failed to parse datetime string '{expired_at_str}': {ve}")
+        return None
+
 def upsert_node(node_info):
-    """[写] 更新或插入节点信息 (通常由 Komari 同步任务调用)"""
+    """[写] 更新或插入节点信息 (单个节点)"""
     try:
         uuid = node_info.get('uuid')
         node = Node.query.get(uuid)
@@ -172,20 +506,7 @@ def upsert_node(node_info):
             
         node.region = node_info.get('region')
         node.traffic_limit = node_info.get('traffic_limit', 0)
-        
-        expired_at_str = node_info.get('expired_at')
-        if expired_at_str:
-            try:
-                # 兼容 ISO 格式的时间字符串
-                if expired_at_str.endswith('Z'):
-                    expired_at_str = expired_at_str[:-1]
-                node.expired_at = datetime.fromisoformat(expired_at_str)
-            except ValueError as ve:
-                print(f"Warning: Failed to parse datetime string '{expired_at_str}': {ve}")
-                node.expired_at = None
-        else:
-            node.expired_at = None
-        
+        node.expired_at = _parse_expired_at(node_info.get('expired_at'))
         node.weight = node_info.get('weight')
         
         db.session.commit()
@@ -195,6 +516,66 @@ def upsert_node(node_info):
         print(f"Error upserting node: {e}")
         return False
 
+# 由 Komari 同步维护的字段 (links / routing_type 等本地字段不受同步影响)
+_SYNCED_NODE_FIELDS = ('name', 'custom_name', 'region', 'traffic_limit', 'expired_at', 'weight')
+
+def bulk_upsert_nodes(node_infos):
+    """
+    [写] 批量同步节点信息 (单事务)。
+    一次查询载入现有节点，与 Komari 数据逐字段比对，只对新增/变化的节点执行
+    INSERT ... ON CONFLICT (uuid) DO UPDATE (SQLite / PostgreSQL 通用)。
+    返回写入 (新增+更新) 的节点数，失败返回 None。
+    """
+    try:
+        existing = {
+            row.uuid: row for row in db.session.query(
+                Node.uuid, *[getattr(Node, f) for f in _SYNCED_NODE_FIELDS]
+            ).all()
+        }
+
+        now = datetime.now()
+        changed = {}
+        for node_info in node_infos:
+            uuid = node_info.get('uuid')
+            if not uuid:
+                continue
+            current = existing.get(uuid)
+
+            if 'custom_name' in node_info:
+                custom_name = node_info.get('custom_name')
+            elif current is not None and current.custom_name:
+                custom_name = current.custom_name
+            else:
+                custom_name = node_info.get('name')
+
+            target = {
+                'uuid': uuid,
+                'name': node_info.get('name'),
+                'custom_name': custom_name,
+                'region': node_info.get('region'),
+                'traffic_limit': node_info.get('traffic_limit', 0),
+                'expired_at': _parse_expired_at(node_info.get('expired_at')),
+                'weight': node_info.get('weight'),
+            }
+            if current is not None and all(getattr(current, f) == target[f] for f in _SYNCED_NODE_FIELDS):
+                continue
+            target['updated_at'] = now
+            changed[uuid] = target
+
+        if changed:
+            stmt = _dialect_insert(Node)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['uuid'],
+                set_={f: stmt.excluded[f] for f in _SYNCED_NODE_FIELDS + ('updated_at',)}
+            )
+            db.session.execute(stmt, list(changed.values()))
+        db.session.commit()
+        return len(changed)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error bulk upserting nodes: {e}")
+        return None
+
 def get_total_nodes():
     try:
         return Node.query.count()
@@ -225,6 +606,8 @@ def delete_node_by_uuid(uuid):
     try:
         node = Node.query.get(uuid)
         if node:
+            for model in (NodeLatest, HistoryHourly, HistoryDaily):
+                model.query.filter_by(uuid=uuid).delete(synchronize_session=False)
             db.session.delete(node)
             db.session.commit()
             return True
@@ -235,23 +618,11 @@ def delete_node_by_uuid(uuid):
         return False
 
 def get_nodes_with_latest_traffic():
+    """[读] [(Node, NodeLatest 或 None), ...]：直接读取 node_latest，不再扫描 history_data"""
     try:
-        subquery = db.session.query(
-            HistoryData.uuid,
-            func.max(HistoryData.timestamp).label('max_timestamp')
-        ).group_by(HistoryData.uuid).subquery()
-        
-        query = db.session.query(Node, HistoryData).outerjoin(
-            subquery, Node.uuid == subquery.c.uuid
-        ).outerjoin(
-            HistoryData, 
-            db.and_(
-                HistoryData.uuid == subquery.c.uuid, 
-                HistoryData.timestamp == subquery.c.max_timestamp
-            )
-        ).order_by(Node.weight.asc())
-        
-        return query.all()
+        return db.session.query(Node, NodeLatest).outerjoin(
+            NodeLatest, Node.uuid == NodeLatest.uuid
+        ).order_by(Node.weight.asc()).all()
     except Exception as e:
         print(f"Error fetching nodes with latest traffic: {e}")
         return []
@@ -276,20 +647,9 @@ def get_total_consumed_traffic_summary(top_limit=5):
     try:
         total_nodes = Node.query.count()
 
-        max_time_per_node = db.session.query(
-            HistoryData.uuid,
-            func.max(HistoryData.timestamp).label('max_timestamp')
-        ).group_by(HistoryData.uuid).subquery()
-
         latest_history = db.session.query(
-            HistoryData.uuid,
-            (HistoryData.total_up + HistoryData.total_down).label('total_usage')
-        ).join(
-            max_time_per_node,
-            db.and_(
-                HistoryData.uuid == max_time_per_node.c.uuid,
-                HistoryData.timestamp == max_time_per_node.c.max_timestamp
-            )
+            NodeLatest.uuid,
+            (NodeLatest.total_up + NodeLatest.total_down).label('total_usage')
         ).subquery()
         
         total_consumed_traffic = db.session.query(
@@ -330,15 +690,33 @@ def get_total_consumed_traffic_summary(top_limit=5):
 
 # --- 3. 历史数据相关操作 ---
 
-def get_node_history_by_time_range(uuid, start_time):
-    try:
-        return HistoryData.query.filter(
-            HistoryData.uuid == uuid,
-            HistoryData.timestamp >= start_time
-        ).order_by(HistoryData.timestamp.asc()).all()
-    except Exception as e:
-        print(f"Error fetching history for node {uuid}: {e}")
-        return []
+# 原始采样点的轻量读取：只查询需要的列，返回 Row 元组 (可按属性访问，如 r.timestamp)，
+# 不构造 HistoryData 对象 (没有 identity map / 变更跟踪)；语句用 lambda_stmt 构建，
+# 编译结果由 SQLAlchemy 缓存，重复调用只替换绑定参数。大范围读取用 yield_per 分批拉取。
+HISTORY_STREAM_BATCH = 2000
+
+def iter_history_points(uuid, start_time, end_time=None, batch_size=HISTORY_STREAM_BATCH):
+    """
+    [读] 流式读取节点在 [start_time, end_time] 内的原始采样点，按时间升序逐行产出
+    (timestamp, valid_until, total_up, total_down, delta_up, delta_down)。
+    """
+    stmt = lambda_stmt(lambda: select(
+        HistoryData.timestamp, HistoryData.valid_until, HistoryData.total_up, HistoryData.total_down,
+        HistoryData.delta_up, HistoryData.delta_down
+    ).where(HistoryData.uuid == uuid, HistoryData.timestamp >= start_time))
+    if end_time is not None:
+        stmt += lambda s: s.where(HistoryData.timestamp <= end_time)
+    stmt += lambda s: s.order_by(HistoryData.timestamp.asc())
+    yield from db.session.execute(stmt, execution_options={'yield_per': batch_size})
+
+def get_history_point_before(uuid, before):
+    """[读] 节点在 before 之前的最后一个原始采样点 (列同 iter_history_points)，没有时返回 None"""
+    stmt = lambda_stmt(lambda: select(
+        HistoryData.timestamp, HistoryData.valid_until, HistoryData.total_up, HistoryData.total_down,
+        HistoryData.delta_up, HistoryData.delta_down
+    ).where(HistoryData.uuid == uuid, HistoryData.timestamp < before)
+        .order_by(HistoryData.timestamp.desc()).limit(1))
+    return db.session.execute(stmt).first()
 
 def get_history_by_date(target_date):
     try:
@@ -361,37 +739,350 @@ def get_history_by_date(target_date):
         return []
 
 def add_history_snapshot(uuid, total_up, total_down, cpu):
-    try:
-        record = HistoryData(
-            uuid=uuid,
-            total_up=total_up,
-            total_down=total_down,
-            cpu_usage=cpu,
-            timestamp=datetime.now()
+    # 经由 bulk_add_history 写入，保证 delta / node_latest / 汇总表同步更新
+    bulk_add_history([{
+        'uuid': uuid,
+        'total_up': total_up,
+        'total_down': total_down,
+        'cpu_usage': cpu,
+        'timestamp': datetime.now()
+    }])
+
+def _get_latest_history_rows(uuids):
+    """[读] 批量获取指定节点的最新一条记录 {uuid: row}"""
+    if not uuids:
+        return {}
+    latest = db.session.query(
+        HistoryData.uuid,
+        func.max(HistoryData.timestamp).label('max_timestamp')
+    ).filter(HistoryData.uuid.in_(uuids)).group_by(HistoryData.uuid).subquery()
+
+    rows = db.session.query(
+        HistoryData.id, HistoryData.uuid, HistoryData.timestamp, HistoryData.valid_until,
+        HistoryData.total_up, HistoryData.total_down
+    ).join(
+        latest,
+        db.and_(HistoryData.uuid == latest.c.uuid, HistoryData.timestamp == latest.c.max_timestamp)
+    ).all()
+    return {row.uuid: row for row in rows}
+
+def _collapse_unchanged_records(records_list, latest_rows):
+    """
+    游程压缩：与节点上一条记录相比 total_up / total_down 都未变化的采样不再插入新行，
+    改为延长上一条记录的 valid_until。
+    返回 (需要插入的记录, {已有行 id: 新的 valid_until})。
+    早于节点最新记录的乱序数据 (如补采) 原样插入。
+    latest_rows 为写入前各节点的最新一行 (_get_latest_history_rows)。
+    """
+    records_list = sorted(records_list, key=lambda r: (r['uuid'], r['timestamp']))
+    tails = {}
+    for uuid, row in latest_rows.items():
+        tails[uuid] = {
+            'id': row.id, 'timestamp': row.timestamp, 'valid_until': row.valid_until,
+            'total_up': row.total_up, 'total_down': row.total_down,
+        }
+
+    inserts = []
+    extends = {}
+    for record in records_list:
+        record.setdefault('valid_until', None)
+        tail = tails.get(record['uuid'])
+        if tail is not None:
+            tail_seen = tail['valid_until'] or tail['timestamp']
+            if record['timestamp'] <= tail_seen:
+                # 乱序/重复数据：直接插入 (重复的会被唯一索引忽略)
+                inserts.append(record)
+                continue
+            if record['total_up'] == tail['total_up'] and record['total_down'] == tail['total_down']:
+                tail['valid_until'] = record['timestamp']
+                if 'id' in tail:
+                    extends[tail['id']] = record['timestamp']
+                continue
+        inserts.append(record)
+        # 本批次新插入的记录成为该节点新的尾部 (直接引用，后续延长时修改其 valid_until)
+        tails[record['uuid']] = record
+    return inserts, extends
+
+def _floor_hour(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+def _floor_day(ts):
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+# (汇总表, 时间桶取整函数)
+ROLLUP_MODELS = ((HistoryHourly, _floor_hour), (HistoryDaily, _floor_day))
+
+def _counter_delta(curr, prev):
+    """计数器增量；计数器变小 (节点重启归零) 时取当前值"""
+    delta = (curr or 0) - (prev or 0)
+    return delta if delta >= 0 else (curr or 0)
+
+def _accumulate_rollups(buckets, uuid, samples):
+    """
+    把一个节点的采样点 [(timestamp, delta_up, delta_down, cpu), ...] 累加到 buckets。
+    buckets: {(model, uuid, bucket): {'delta_up', 'delta_down', 'samples', 'cpu_sum', 'cpu_max'}}
+    """
+    for ts, delta_up, delta_down, cpu in samples:
+        cpu = cpu or 0.0
+        for model, floor in ROLLUP_MODELS:
+            agg = buckets.setdefault((model, uuid, floor(ts)), {
+                'delta_up': 0, 'delta_down': 0, 'samples': 0, 'cpu_sum': 0.0, 'cpu_max': 0.0,
+            })
+            agg['delta_up'] += delta_up
+            agg['delta_down'] += delta_down
+            agg['samples'] += 1
+            agg['cpu_sum'] += cpu
+            agg['cpu_max'] = max(agg['cpu_max'], cpu)
+
+def _assign_sample_deltas(records_list, latest_rows):
+    """
+    为每条记录计算与该节点上一采样点相比的 delta_up / delta_down (写入 history_data)。
+    上一采样点为本批次中更早的记录或写入前的最新一行；节点的第一条记录增量为 0。
+    乱序数据 (如补采) 会改变相邻行的增量，这些节点先记为 0，返回 {uuid: 最早的乱序时间}，
+    写入后由 rebuild_history_rollups 从该日起重算。
+    """
+    by_uuid = {}
+    for record in records_list:
+        by_uuid.setdefault(record['uuid'], []).append(record)
+
+    dirty = {}
+    for uuid, records in by_uuid.items():
+        records.sort(key=lambda r: r['timestamp'])
+        tail = latest_rows.get(uuid)
+        if tail is not None and records[0]['timestamp'] <= (tail.valid_until or tail.timestamp):
+            dirty[uuid] = records[0]['timestamp']
+            prev = None
+        else:
+            prev = (tail.total_up, tail.total_down) if tail is not None else None
+        for record in records:
+            if prev is None or uuid in dirty:
+                record['delta_up'] = record['delta_down'] = 0
+            else:
+                record['delta_up'] = _counter_delta(record['total_up'], prev[0])
+                record['delta_down'] = _counter_delta(record['total_down'], prev[1])
+            prev = (record['total_up'], record['total_down'])
+    return dirty
+
+def _compute_rollup_increments(records_list, dirty):
+    """
+    按记录上的 delta_up / delta_down 计算本批次对汇总表的增量。
+    records_list 为实际插入的记录 (游程压缩后)：被合并的采样增量为 0，也不计入 samples，
+    与 rebuild_history_rollups 按 history_data 行重算的结果一致。
+    乱序节点 (dirty) 整体跳过，写入后从乱序日期起重建。
+    """
+    by_uuid = {}
+    for record in records_list:
+        if record['uuid'] not in dirty:
+            by_uuid.setdefault(record['uuid'], []).append(record)
+
+    buckets = {}
+    for uuid, records in by_uuid.items():
+        _accumulate_rollups(buckets, uuid, [
+            (r['timestamp'], r['delta_up'], r['delta_down'], r.get('cpu_usage')) for r in records
+        ])
+    return buckets
+
+def _apply_rollup_increments(buckets):
+    """INSERT ... ON CONFLICT (uuid, bucket) DO UPDATE：把增量累加到汇总表"""
+    for model, _ in ROLLUP_MODELS:
+        rows = [
+            dict(agg, uuid=uuid, bucket=bucket)
+            for (m, uuid, bucket), agg in buckets.items() if m is model
+        ]
+        if not rows:
+            continue
+        stmt = _dialect_insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['uuid', 'bucket'],
+            set_={
+                'delta_up': model.delta_up + stmt.excluded.delta_up,
+                'delta_down': model.delta_down + stmt.excluded.delta_down,
+                'samples': model.samples + stmt.excluded.samples,
+                'cpu_sum': model.cpu_sum + stmt.excluded.cpu_sum,
+                'cpu_max': case((stmt.excluded.cpu_max > model.cpu_max, stmt.excluded.cpu_max), else_=model.cpu_max),
+            }
         )
-        db.session.add(record)
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error adding history: {e}")
+        db.session.execute(stmt, rows)
+
+def rebuild_history_rollups(uuids=None, since=None):
+    """
+    [写] 从 history_data 的累计值重算各行的 delta_up / delta_down，并重建汇总表 (不提交，由调用方提交)。
+    uuids 为 None 时处理全部节点；since 不为 None 时从 since 所在日期 00:00 起重建。
+    since 为 None 时从原始数据完整覆盖的第一天起重建：最早一条原始记录所在的那一天可能已被
+    过期清理/归档删掉一部分，该天已有汇总时保留它，从下一天起重建 (以该天最后一行为增量基准)；
+    该天没有汇总 (升级前的旧数据库) 时从该天起重建。更早的汇总 (原始数据已过期或已归档) 保持不变。
+    每一行在其 timestamp 所在的时间桶计一个采样点 (与写入时的增量汇总相同)。
+    返回重建的节点数。
+    """
+    if uuids is None:
+        uuids = get_history_uuids()
+
+    for uuid in uuids:
+        query = db.session.query(
+            HistoryData.id, HistoryData.timestamp, HistoryData.valid_until,
+            HistoryData.total_up, HistoryData.total_down, HistoryData.cpu_usage,
+            HistoryData.delta_up, HistoryData.delta_down
+        ).filter(HistoryData.uuid == uuid)
+
+        if since:
+            day_start = _floor_day(since)
+        else:
+            first = db.session.query(func.min(HistoryData.timestamp)).filter(HistoryData.uuid == uuid).scalar()
+            day_start = _floor_day(first) if first else None
+            if day_start is not None and db.session.query(HistoryDaily.id).filter(
+                HistoryDaily.uuid == uuid, HistoryDaily.bucket == day_start
+            ).first() is not None:
+                day_start += timedelta(days=1)
+
+        prev = None
+        samples = []
+        if day_start is not None:
+            before = query.filter(HistoryData.timestamp < day_start)\
+                .order_by(HistoryData.timestamp.desc()).first()
+            if before is not None:
+                prev = (before.total_up, before.total_down)
+            query = query.filter(HistoryData.timestamp >= day_start)
+
+        delta_updates = []
+        for row in query.order_by(HistoryData.timestamp.asc()):
+            delta_up = _counter_delta(row.total_up, prev[0]) if prev else 0
+            delta_down = _counter_delta(row.total_down, prev[1]) if prev else 0
+            if (row.delta_up, row.delta_down) != (delta_up, delta_down):
+                delta_updates.append({'id': row.id, 'delta_up': delta_up, 'delta_down': delta_down})
+            samples.append((row.timestamp, delta_up, delta_down, row.cpu_usage))
+            prev = (row.total_up, row.total_down)
+
+        if delta_updates:
+            db.session.execute(update(HistoryData), delta_updates)
+        buckets = {}
+        _accumulate_rollups(buckets, uuid, samples)
+        for model, _ in ROLLUP_MODELS:
+            stale = model.query.filter(model.uuid == uuid)
+            if day_start is not None:
+                stale = stale.filter(model.bucket >= day_start)
+            stale.delete(synchronize_session=False)
+        _apply_rollup_increments(buckets)
+    return len(uuids)
+
+def needs_rollup_rebuild():
+    """[读] 汇总表为空而 history_data 有数据 (升级前的旧数据库)"""
+    return db.session.query(HistoryHourly.id).first() is None \
+        and db.session.query(HistoryData.id).first() is not None
+
+def _latest_per_node(records_list):
+    """本批次中每个节点时间最新的一条记录"""
+    latest = {}
+    for record in records_list:
+        current = latest.get(record['uuid'])
+        if current is None or record['timestamp'] > current['timestamp']:
+            latest[record['uuid']] = record
+    return [
+        {'uuid': r['uuid'], 'timestamp': r['timestamp'], 'total_up': r['total_up'],
+         'total_down': r['total_down'], 'cpu_usage': r.get('cpu_usage')}
+        for r in latest.values()
+    ]
+
+def _upsert_node_latest(latest_rows):
+    """INSERT ... ON CONFLICT (uuid) DO UPDATE，只接受更新的采样 (乱序补采不会覆盖最新值)"""
+    if not latest_rows:
+        return
+    stmt = _dialect_insert(NodeLatest)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['uuid'],
+        set_={
+            'timestamp': stmt.excluded.timestamp,
+            'total_up': stmt.excluded.total_up,
+            'total_down': stmt.excluded.total_down,
+            'cpu_usage': stmt.excluded.cpu_usage,
+        },
+        where=NodeLatest.timestamp < stmt.excluded.timestamp
+    )
+    db.session.execute(stmt, latest_rows)
+
+def _write_history(records_list, extends, rollup_buckets, rollup_dirty, latest_rows):
+    """bulk_add_history 的写入步骤 (同一事务内：原始数据 + 最新快照 + 汇总表)"""
+    if extends:
+        db.session.execute(update(HistoryData), [
+            {'id': row_id, 'valid_until': valid_until} for row_id, valid_until in extends.items()
+        ])
+    if records_list:
+        _insert_history_ignore_duplicates(records_list)
+    _upsert_node_latest(latest_rows)
+    _apply_rollup_increments(rollup_buckets)
+    for uuid, since in rollup_dirty.items():
+        rebuild_history_rollups([uuid], since)
+
+# PostgreSQL 事务级 advisory 锁的键 (history_data 写入)
+HISTORY_WRITE_LOCK_KEY = 0x4B4D4844
+
+def _lock_history_writes():
+    """
+    在当前事务内串行化 history_data 的写入者，直到提交/回滚。
+    之后读取的各节点尾部在事务结束前不会被其他写入者改变，delta 与汇总增量不会基于过期的尾部重复累加。
+    - PostgreSQL: pg_advisory_xact_lock (节点还没有任何记录时同样有效)
+    - SQLite: 执行一条空 UPDATE 提前取得数据库写锁 (pysqlite 在第一条写语句前才 BEGIN，
+      否则读取尾部时还没有持有写锁)，其他写入者按 busy_timeout 等待
+    """
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': HISTORY_WRITE_LOCK_KEY})
+    else:
+        db.session.execute(update(NodeLatest).where(false()).values(uuid=NodeLatest.uuid))
+
+def _write_history_batch(records_list):
+    """
+    bulk_add_history 的一次写入尝试 (不提交)：加锁 → 读取各节点尾部 → 计算 delta / 游程压缩 / 汇总增量 → 写入。
+    计算过程会修改记录 (delta、valid_until)，这里复制一份，重试时从原始数据重新计算。
+    """
+    records_list = [dict(r) for r in records_list]
+    _lock_history_writes()
+
+    latest_rows = _get_latest_history_rows({r['uuid'] for r in records_list})
+    rollup_dirty = _assign_sample_deltas(records_list, latest_rows)
+    node_latest_rows = _latest_per_node(records_list)
+
+    extends = {}
+    if str(get_config('COMPRESS_IDLE_SNAPSHOTS', '1')).strip() not in ('0', 'false', 'False', ''):
+        records_list, extends = _collapse_unchanged_records(records_list, latest_rows)
+    rollup_buckets = _compute_rollup_increments(records_list, rollup_dirty)
+
+    _write_history(records_list, extends, rollup_buckets, rollup_dirty, node_latest_rows)
+
+def _insert_history_ignore_duplicates(records_list):
+    """INSERT ... ON CONFLICT (uuid, timestamp) DO NOTHING，重复采样点直接跳过。"""
+    stmt = _dialect_insert(HistoryData).on_conflict_do_nothing(
+        index_elements=['uuid', 'timestamp']
+    )
+    db.session.execute(stmt, records_list)
 
 # 增强版批量写入函数
 def bulk_add_history(records_list):
     """
-    [写] 批量写入历史数据。
+    [写] 批量写入历史数据 (幂等)。
     功能：
-    1. 手动补充 timestamp，解决 bulk_insert 忽略 default 问题。
-    2. [PostgreSQL] 自动捕获 Sequence 不同步错误并修复，防止 ID 冲突。
+    1. 没有源时间戳的记录补充当前时间，解决 bulk insert 忽略 default 问题。
+    2. 以 (uuid, timestamp) 去重：同一批次内先去重，落库时 ON CONFLICT DO NOTHING，
+       因此重复拉取同一时间窗口不会产生重复记录。
+    3. 计算每条记录相对上一采样点的 delta_up / delta_down (识别计数器重启归零)。
+    4. 游程压缩 (COMPRESS_IDLE_SNAPSHOTS)：计数器未变化的采样只延长上一行的 valid_until。
+    5. 同一事务内更新 node_latest，并按增量更新 history_hourly / history_daily 汇总表。
+       读取尾部之前先加写锁 (_lock_history_writes)，并发写入同一节点时汇总表不会重复累加。
+    6. [PostgreSQL] 自动捕获 Sequence 不同步错误并修复，防止 ID 冲突。
     """
     try:
         current_time = datetime.now()
-        # 遍历列表，确保每条数据都有 timestamp
+        # 遍历列表，确保每条数据都有 timestamp，并在批次内去重
+        unique_records = {}
         for record in records_list:
-            if 'timestamp' not in record:
+            if not record.get('timestamp'):
                 record['timestamp'] = current_time
-        
-        db.session.bulk_insert_mappings(HistoryData, records_list)
+            unique_records[(record['uuid'], record['timestamp'])] = record
+        records_list = list(unique_records.values())
+        if not records_list:
+            return True
+
+        _write_history_batch(records_list)
         db.session.commit()
+        return True
     
     except IntegrityError as e:
         # 专门捕获完整性错误 (IntegrityError)
@@ -412,27 +1103,461 @@ def bulk_add_history(records_list):
                     db.session.commit()
                     
                     print(">>> [DB Fix] 序列已重置，正在重试写入...")
-                    # 修复后立即重试一次
-                    db.session.bulk_insert_mappings(HistoryData, records_list)
+                    # 修复后立即重试一次 (重新加锁并读取尾部)
+                    _write_history_batch(records_list)
                     db.session.commit()
                     print(">>> [DB Fix] 重试写入成功！")
-                    return
+                    return True
             except Exception as fix_e:
                 print(f">>> [DB Fix] 自动修复失败: {fix_e}")
                 # 修复失败则抛出原始异常，避免掩盖问题
         
         print(f"Error bulk adding history (IntegrityError): {e}")
+        return False
 
     except Exception as e:
         db.session.rollback()
         print(f"Error bulk adding history: {e}")
+        return False
+
+def get_latest_history_timestamps():
+    """[读] 返回 {uuid: 最新一次确认的采样时间 (含 valid_until)}，用于采集时跳过已入库的采样点。"""
+    try:
+        rows = db.session.query(NodeLatest.uuid, NodeLatest.timestamp).all()
+        return {uuid: _as_datetime(ts) for uuid, ts in rows}
+    except Exception as e:
+        print(f"Error fetching latest history timestamps: {e}")
+        return {}
+
+def find_history_gaps(since, min_gap_seconds):
+    """
+    [读] 查找 since 之后各节点相邻两条记录间隔超过 min_gap_seconds 的缺口。
+    使用窗口函数 LAG 在数据库内完成计算 (SQLite 3.25+ / PostgreSQL)。
+    被游程压缩的记录以 valid_until 作为上一条的结束时间，不会被误判为缺口。
+    返回 [(uuid, gap_start, gap_end), ...]，gap_start/gap_end 为缺口两侧已有的记录时间。
+    """
+    try:
+        if 'postgresql' in db.engine.url.drivername:
+            gap_expr = "EXTRACT(EPOCH FROM (ts - prev_ts))"
+        else:
+            gap_expr = "(julianday(ts) - julianday(prev_ts)) * 86400"
+        sql = text(f"""
+            SELECT uuid, prev_ts, ts FROM (
+                SELECT uuid, timestamp AS ts,
+                       LAG(COALESCE(valid_until, timestamp)) OVER (PARTITION BY uuid ORDER BY timestamp) AS prev_ts
+                FROM history_data
+                WHERE timestamp >= :since
+            ) t
+            WHERE prev_ts IS NOT NULL AND {gap_expr} > :min_gap
+            ORDER BY uuid, prev_ts
+        """)
+        rows = db.session.execute(sql, {'since': since, 'min_gap': min_gap_seconds}).all()
+        return [(uuid, _as_datetime(start), _as_datetime(end)) for uuid, start, end in rows]
+    except Exception as e:
+        print(f"Error finding history gaps: {e}")
+        return []
+
+def _as_datetime(value):
+    """原生 SQL 在 SQLite 下返回字符串时间，统一转换为 datetime"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+def delete_expired_history_batch(cutoff, batch_size):
+    """
+    [写] 删除一批过期的历史记录，返回删除的行数 (失败返回 None)。
+    以 COALESCE(valid_until, timestamp) 判断过期：仍在延续的压缩记录 (valid_until 未过期) 会被保留。
+    每批单独提交，避免长事务阻塞采集写入。
+    """
+    try:
+        # timestamp < cutoff 是冗余条件 (COALESCE 不小于 timestamp)，用于命中索引 / PostgreSQL 分区裁剪
+        expired_ids = db.session.query(HistoryData.id)\
+            .filter(HistoryData.timestamp < cutoff)\
+            .filter(func.coalesce(HistoryData.valid_until, HistoryData.timestamp) < cutoff)\
+            .limit(batch_size).scalar_subquery()
+        result = db.session.execute(
+            HistoryData.__table__.delete()
+            .where(HistoryData.timestamp < cutoff)
+            .where(HistoryData.id.in_(expired_ids))
+        )
+        db.session.commit()
+        return result.rowcount
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error deleting expired history: {e}")
+        return None
+
+def get_history_uuids():
+    """[读] history_data 中出现过的节点 uuid"""
+    return [row[0] for row in db.session.query(HistoryData.uuid).distinct().all()]
+
+def get_archivable_history(uuid, before, limit):
+    """
+    [读] 某节点早于 before 的原始记录 (按时间升序，最多 limit 行)，用于归档。
+    与过期清理相同，仍在延续的压缩记录 (valid_until >= before) 不返回。
+    """
+    return db.session.query(
+        HistoryData.id, HistoryData.timestamp, HistoryData.valid_until,
+        HistoryData.total_up, HistoryData.total_down, HistoryData.cpu_usage,
+        HistoryData.delta_up, HistoryData.delta_down
+    ).filter(
+        HistoryData.uuid == uuid,
+        HistoryData.timestamp < before,
+        func.coalesce(HistoryData.valid_until, HistoryData.timestamp) < before
+    ).order_by(HistoryData.timestamp.asc()).limit(limit).all()
+
+def delete_history_by_ids(ids, batch_size=2000):
+    """[写] 按 id 分批删除历史记录 (每批单独提交)，返回删除的行数，失败返回 None"""
+    deleted = 0
+    try:
+        for i in range(0, len(ids), batch_size):
+            result = db.session.execute(
+                HistoryData.__table__.delete().where(HistoryData.id.in_(ids[i:i + batch_size]))
+            )
+            db.session.commit()
+            deleted += result.rowcount
+        return deleted
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error deleting archived history: {e}")
+        return None
+
+def get_db_size_bytes():
+    """[读] 数据库实际占用的字节数 (SQLite 按 page_count * page_size 计算)"""
+    try:
+        if 'postgresql' in db.engine.url.drivername:
+            return db.session.execute(text("SELECT pg_database_size(current_database())")).scalar() or 0
+        page_count = db.session.execute(text("PRAGMA page_count")).scalar() or 0
+        page_size = db.session.execute(text("PRAGMA page_size")).scalar() or 0
+        return page_count * page_size
+    except Exception as e:
+        print(f"Error getting database size: {e}")
+        return 0
+
+SQLITE_AUTO_VACUUM_INCREMENTAL = 2
+
+def get_sqlite_auto_vacuum():
+    """[读] SQLite 的 auto_vacuum 模式 (0=NONE, 1=FULL, 2=INCREMENTAL)，非 SQLite 返回 None"""
+    if 'sqlite' not in db.engine.url.drivername:
+        return None
+    with db.engine.connect() as conn:
+        return conn.execute(text("PRAGMA auto_vacuum")).scalar()
+
+def sqlite_incremental_vacuum(max_pages):
+    """
+    [写] SQLite 增量回收至多 max_pages 个空闲页，返回剩余的空闲页数。
+    非 SQLite 或 auto_vacuum 不是 INCREMENTAL (旧数据库，需先运行 python -m app.sqlite_vacuum) 时返回 0。
+    """
+    if get_sqlite_auto_vacuum() != SQLITE_AUTO_VACUUM_INCREMENTAL:
+        return 0
+    with db.engine.connect() as conn:
+        # incremental_vacuum 不能在事务中执行
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        conn.execute(text(f"PRAGMA incremental_vacuum({int(max_pages)})"))
+        return conn.execute(text("PRAGMA freelist_count")).scalar() or 0
+
+def sqlite_enable_incremental_vacuum():
+    """
+    [写] 把 SQLite 的 auto_vacuum 切换为 INCREMENTAL 并执行一次完整 VACUUM。
+    VACUUM 会重写整个数据库文件 (需要同等大小的空闲磁盘空间)，期间阻塞所有写入，只应在维护时手动执行。
+    返回是否执行了转换 (已是 INCREMENTAL 或非 SQLite 时返回 False)。
+    """
+    mode = get_sqlite_auto_vacuum()
+    if mode is None or mode == SQLITE_AUTO_VACUUM_INCREMENTAL:
+        return False
+    with db.engine.connect() as conn:
+        # VACUUM 不能在事务中执行
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+        conn.execute(text("VACUUM"))
+    return True
+
+def get_rollup_series(uuid, start_time, end_time, granularity='hour'):
+    """
+    [读] 节点在 [start_time, end_time] 内的小时 (granularity='hour') 或日 ('day') 汇总，按时间升序。
+    只查询需要的列，返回 (bucket, delta_up, delta_down) 元组，不构造 ORM 对象。
+    """
+    model = HistoryDaily if granularity == 'day' else HistoryHourly
+    return db.session.query(model.bucket, model.delta_up, model.delta_down).filter(
+        model.uuid == uuid,
+        model.bucket >= start_time,
+        model.bucket <= end_time
+    ).order_by(model.bucket.asc()).all()
+
+def get_daily_rollup_stamp(uuid, start_day, end_time):
+    """
+    [读] 某节点 [start_day, end_time] 的数据戳：各天日汇总行的 (天数, samples, delta_up, delta_down 之和)，
+    加上节点最新数据时间 (node_latest.timestamp，超过 end_time 时取 end_time)，没有任何数据时返回 None。
+    游程压缩只延长 valid_until、不改变汇总行，由最新数据时间反映；新采样、补采重建改变汇总行。
+    可用于判断缓存是否过期。
+    """
+    row = db.session.query(
+        func.count(HistoryDaily.id), func.sum(HistoryDaily.samples),
+        func.sum(HistoryDaily.delta_up), func.sum(HistoryDaily.delta_down)
+    ).filter(
+        HistoryDaily.uuid == uuid, HistoryDaily.bucket >= start_day, HistoryDaily.bucket <= end_time
+    ).one()
+    latest = db.session.query(NodeLatest.timestamp).filter(NodeLatest.uuid == uuid).scalar()
+    # 最新数据早于范围起点时与范围无关；晚于范围终点时范围内的数据不再变化
+    if latest is not None and latest < start_day:
+        latest = None
+    if not row[0] and latest is None:
+        return None
+    return tuple(int(v or 0) for v in row) + (min(latest, end_time) if latest is not None else None,)
+
+def get_daily_usage_ranking(start_day, end_day=None):
+    """
+    [读] 所有节点在 [start_day, end_day] 内的用量 (单次查询，按日汇总表求和)：
+    返回 [(Node, delta_up 或 None, delta_down 或 None), ...]
+    """
+    usage = db.session.query(
+        HistoryDaily.uuid,
+        func.sum(HistoryDaily.delta_up).label('delta_up'),
+        func.sum(HistoryDaily.delta_down).label('delta_down')
+    ).filter(
+        HistoryDaily.bucket >= start_day, HistoryDaily.bucket <= (end_day or start_day)
+    ).group_by(HistoryDaily.uuid).subquery()
+    return db.session.query(Node, usage.c.delta_up, usage.c.delta_down)\
+        .outerjoin(usage, usage.c.uuid == Node.uuid).all()
+
+# --- 4. 采集运行记录相关操作 ---
+
+def add_collector_run(run_info, retention_days=7):
+    """
+    [写] 保存一次采集运行记录，并清理超过保留期的旧记录。
+    run_info 字段与 CollectorRun 一致，node_latencies 传入字典。
+    """
+    try:
+        run_info = dict(run_info)
+        run_info['node_latencies'] = json.dumps(run_info.get('node_latencies') or {})
+        if run_info.get('error'):
+            run_info['error'] = str(run_info['error'])[:255]
+        db.session.add(CollectorRun(**run_info))
+
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        CollectorRun.query.filter(CollectorRun.started_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving collector run: {e}")
+        return False
+
+def get_collector_runs(since, job=None):
+    """[读] 查询 since 之后的采集运行记录 (按时间升序)"""
+    try:
+        query = CollectorRun.query.filter(CollectorRun.started_at >= since)
+        if job:
+            query = query.filter(CollectorRun.job == job)
+        return query.order_by(CollectorRun.started_at.asc()).all()
+    except Exception as e:
+        print(f"Error fetching collector runs: {e}")
+        return []
+
+def add_retention_run(run_info, retention_days=30):
+    """[写] 保存一次数据清理记录，并清理超过保留期的旧记录"""
+    try:
+        run_info = dict(run_info)
+        if run_info.get('error'):
+            run_info['error'] = str(run_info['error'])[:255]
+        db.session.add(RetentionRun(**run_info))
+
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        RetentionRun.query.filter(RetentionRun.started_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving retention run: {e}")
+        return False
+
+def get_recent_retention_runs(limit=10):
+    """[读] 最近的数据清理记录 (按时间倒序)"""
+    try:
+        return RetentionRun.query.order_by(RetentionRun.started_at.desc()).limit(limit).all()
+    except Exception as e:
+        print(f"Error fetching retention runs: {e}")
+        return []
+
+def create_refresh_job(job_id, node_uuids):
+    """[写] 创建手动刷新任务 (状态 queued)，node_uuids 为 None 表示全量刷新"""
+    try:
+        job = RefreshJob(
+            id=job_id, status='queued',
+            node_uuids=json.dumps(node_uuids) if node_uuids else None,
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error creating refresh job: {e}")
+        return None
+
+def get_refresh_job(job_id):
+    return RefreshJob.query.get(job_id)
+
+def get_active_refresh_jobs(since):
+    """[读] since 之后创建、仍在排队或执行中的刷新任务"""
+    return RefreshJob.query.filter(
+        RefreshJob.status.in_(('queued', 'running')), RefreshJob.created_at >= since
+    ).order_by(RefreshJob.created_at.asc()).all()
+
+def update_refresh_job(job_id, status, message=None, stats=None, finished=False):
+    """[写] 更新刷新任务的状态 (finished=True 时记录结束时间)"""
+    try:
+        values = {'status': status, 'message': (message or '')[:255] or None}
+        if stats is not None:
+            values['stats'] = json.dumps(stats)
+        if finished:
+            values['finished_at'] = datetime.now()
+        RefreshJob.query.filter_by(id=job_id).update(values, synchronize_session=False)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error updating refresh job {job_id}: {e}")
+        return False
+
+def delete_refresh_jobs_before(before):
+    """[写] 删除 before 之前创建的刷新任务"""
+    try:
+        RefreshJob.query.filter(RefreshJob.created_at < before).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error deleting refresh jobs: {e}")
+
+# --- 5. 历史补采任务相关操作 ---
+
+def create_backfill_job(gaps):
+    """[写] 根据缺口列表创建补采任务，返回 BackfillJob"""
+    try:
+        job = BackfillJob(status='running', total_tasks=len(gaps))
+        db.session.add(job)
+        db.session.flush()
+        db.session.bulk_insert_mappings(BackfillTask, [
+            {'job_id': job.id, 'uuid': uuid, 'gap_start': start, 'gap_end': end, 'status': 'pending'}
+            for uuid, start, end in gaps
+        ])
+        db.session.commit()
+        return job
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error creating backfill job: {e}")
+        return None
+
+def get_backfill_job(job_id):
+    return BackfillJob.query.get(job_id)
+
+def get_latest_backfill_job():
+    return BackfillJob.query.order_by(BackfillJob.id.desc()).first()
+
+def get_unfinished_backfill_job():
+    """[读] 返回仍处于 running 状态 (进程中断后可续跑) 的补采任务"""
+    return BackfillJob.query.filter_by(status='running').order_by(BackfillJob.id.desc()).first()
+
+def get_pending_backfill_tasks(job_id):
+    return BackfillTask.query.filter_by(job_id=job_id, status='pending')\
+        .order_by(BackfillTask.uuid, BackfillTask.gap_start).all()
+
+def update_backfill_tasks(job_id, task_ids, status, inserted=0, error=None):
+    """[写] 标记一批缺口的完成状态并累加 Job 进度 (断点保存)"""
+    try:
+        BackfillTask.query.filter(BackfillTask.id.in_(task_ids)).update(
+            {'status': status, 'error': (error or '')[:255] or None},
+            synchronize_session=False
+        )
+        job = BackfillJob.query.get(job_id)
+        if job:
+            if status == 'done':
+                job.done_tasks = (job.done_tasks or 0) + len(task_ids)
+            else:
+                job.failed_tasks = (job.failed_tasks or 0) + len(task_ids)
+            job.inserted_records = (job.inserted_records or 0) + inserted
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error updating backfill tasks: {e}")
+        return False
+
+def finish_backfill_job(job_id, status, message=None):
+    try:
+        job = BackfillJob.query.get(job_id)
+        if job:
+            job.status = status
+            job.message = message
+            job.finished_at = datetime.now()
+            db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error finishing backfill job {job_id}: {e}")
+        return False
+
+# --- 6. 采集器租约 ---
+
+def _db_utc_now(offset_seconds=0):
+    """数据库服务器的当前 UTC 时间 (SQL 表达式)，offset_seconds 为偏移秒数"""
+    if db.engine.dialect.name == 'postgresql':
+        now = func.timezone('UTC', func.now(), type_=db.DateTime)
+        return now + timedelta(seconds=offset_seconds) if offset_seconds else now
+    return func.datetime('now', f'{offset_seconds:+d} seconds', type_=db.DateTime)
+
+def try_acquire_lease(name, holder, ttl_seconds):
+    """
+    [写] 获取或续期租约，返回是否持有 (数据库异常时返回 None)。
+    仅当租约属于自己或已过期时才会被更新，单条 UPDATE / INSERT 保证多进程间的原子性。
+    获取时间与到期时间都取数据库的 UTC 时间，跨主机部署时不受各采集进程本机时钟偏差的影响。
+    """
+    now = _db_utc_now()
+    expires_at = _db_utc_now(ttl_seconds)
+    try:
+        result = db.session.execute(
+            update(CollectorLease)
+            .where(CollectorLease.name == name)
+            .where(or_(
+                CollectorLease.holder == holder,
+                CollectorLease.expires_at < now,
+                # 到期时间远超一个有效期：升级前按本机时间写入的旧租约，视为已失效
+                CollectorLease.expires_at > expires_at,
+            ))
+            .values(
+                holder=holder,
+                expires_at=expires_at,
+                acquired_at=case((CollectorLease.holder == holder, CollectorLease.acquired_at), else_=now),
+            )
+        )
+        if result.rowcount == 0:
+            # 租约行不存在时创建；已被他人持有则什么都不做
+            result = db.session.execute(
+                _dialect_insert(CollectorLease)
+                .values(name=name, holder=holder, acquired_at=now, expires_at=expires_at)
+                .on_conflict_do_nothing(index_elements=['name'])
+            )
+        db.session.commit()
+        return result.rowcount > 0
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error acquiring lease {name}: {e}")
+        return None
+
+def release_lease(name, holder):
+    """[写] 主动释放租约 (进程正常退出时调用)，备用进程无需等待过期即可接管"""
+    try:
+        CollectorLease.query.filter_by(name=name, holder=holder).delete(synchronize_session=False)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error releasing lease {name}: {e}")
+        return False
 
-def get_latest_history(uuid, limit=10):
-    return HistoryData.query.filter_by(uuid=uuid)\
-        .order_by(desc(HistoryData.timestamp))\
-        .limit(limit).all()
+def get_lease(name):
+    return CollectorLease.query.get(name)
 
-# --- 4. 用户相关操作 ---
+# --- 7. 用户相关操作 ---
 
 def get_user_by_username(username):
     try:
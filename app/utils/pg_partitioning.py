@@ -0,0 +1,216 @@
+# 文件路径：./app/utils/pg_partitioning.py
+
+from datetime import datetime, date
+
+from sqlalchemy import text
+
+from app.utils.db_manager import db
+
+# =========================================================
+#  PostgreSQL: history_data 按月分区 (可选，HISTORY_PARTITIONING=monthly)
+#  - history_data 成为按 timestamp 范围分区的父表，每月一个子表 history_data_pYYYYMM；
+#  - 分区提前创建 (当前月 + PARTITION_MONTHS_AHEAD 个月)，另有一个 DEFAULT 分区兜底；
+#  - 过期数据整月 DROP 分区，不再逐行 DELETE，避免表膨胀；
+#  - 按时间范围的查询只会扫描相关分区 (分区裁剪)。
+# =========================================================
+
+PARTITION_PREFIX = 'history_data_p'
+DEFAULT_PARTITION = 'history_data_default'
+PARTITION_MONTHS_AHEAD = 3
+PARTITION_MAINTENANCE_INTERVAL_HOURS = 12
+
+
+def _log(message):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [Partition] {message}")
+
+
+def _is_postgresql():
+    return 'postgresql' in db.engine.url.drivername
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + (month.month - 1) + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(month):
+    return f"{PARTITION_PREFIX}{month.year:04d}{month.month:02d}"
+
+
+def _parse_partition_month(name):
+    """history_data_pYYYYMM -> date(YYYY, MM, 1)，非本模块创建的分区返回 None"""
+    suffix = name[len(PARTITION_PREFIX):] if name.startswith(PARTITION_PREFIX) else ''
+    if len(suffix) != 6 or not suffix.isdigit():
+        return None
+    return date(int(suffix[:4]), int(suffix[4:]), 1)
+
+
+def is_history_partitioned():
+    """[读] history_data 是否为分区表 (仅 PostgreSQL)"""
+    if not _is_postgresql():
+        return False
+    return db.session.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'history_data' "
+        "AND pg_table_is_visible(c.oid))"
+    )).scalar()
+
+
+def list_history_partitions():
+    """[读] 返回 [(分区名, 月份起点)]，按月份升序 (不含 DEFAULT 分区)"""
+    rows = db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'history_data' AND pg_table_is_visible(p.oid)"
+    )).scalars().all()
+    partitions = [(name, _parse_partition_month(name)) for name in rows]
+    return sorted([(name, month) for name, month in partitions if month], key=lambda item: item[1])
+
+
+def _create_partition(month):
+    """创建某个月的分区 (已存在时跳过)。不提交。"""
+    db.session.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {_partition_name(month)} PARTITION OF history_data "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    ))
+
+
+def ensure_history_partitions(months_ahead=PARTITION_MONTHS_AHEAD):
+    """[写] 提前创建当前月及之后 months_ahead 个月的分区，返回新建的分区数"""
+    if not is_history_partitioned():
+        return 0
+    existing = {month for _, month in list_history_partitions()}
+    current = _month_start(datetime.now())
+    created = 0
+    for offset in range(months_ahead + 1):
+        month = _add_months(current, offset)
+        if month in existing:
+            continue
+        try:
+            _create_partition(month)
+            db.session.commit()
+            created += 1
+            _log(f"已创建分区 {_partition_name(month)}")
+        except Exception as e:
+            # DEFAULT 分区中已有该月数据时无法创建，需要人工迁移
+            db.session.rollback()
+            _log(f"创建分区 {_partition_name(month)} 失败: {e}")
+    return created
+
+
+def convert_history_to_partitioned(months_ahead=PARTITION_MONTHS_AHEAD):
+    """
+    [写] 把普通表 history_data 转换为按月分区表 (单个事务，失败整体回滚)。
+    旧表改名后按数据覆盖的月份创建分区，再整体复制数据。数据量大时耗时较长，仅在首次启用时执行一次。
+    """
+    old = 'history_data_unpartitioned'
+    _log("开始将 history_data 转换为按月分区表...")
+    try:
+        db.session.execute(text("LOCK TABLE history_data IN ACCESS EXCLUSIVE MODE"))
+        old_seq = db.session.execute(text("SELECT pg_get_serial_sequence('history_data', 'id')")).scalar()
+
+        # 旧表及其索引/约束/序列改名，释放名称给新的分区表
+        db.session.execute(text(f"ALTER TABLE history_data RENAME TO {old}"))
+        for index_name in db.session.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+        ), {'table': old}).scalars().all():
+            db.session.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_old"'))
+        for constraint in db.session.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'"
+        ), {'table': old}).scalars().all():
+            db.session.execute(text(f'ALTER TABLE {old} RENAME CONSTRAINT "{constraint}" TO "{constraint}_old"'))
+        if old_seq:
+            db.session.execute(text(f"ALTER SEQUENCE {old_seq} RENAME TO {old}_id_seq"))
+
+        # 分区表的主键/唯一索引必须包含分区键 timestamp
+        db.session.execute(text("""
+            CREATE TABLE history_data (
+                id BIGSERIAL,
+                uuid VARCHAR(36) NOT NULL REFERENCES nodes (uuid),
+                timestamp TIMESTAMP NOT NULL,
+                total_up BIGINT,
+                total_down BIGINT,
+                cpu_usage DOUBLE PRECISION,
+                valid_until TIMESTAMP,
+                delta_up BIGINT,
+                delta_down BIGINT,
+                CONSTRAINT history_data_pkey PRIMARY KEY (id, timestamp)
+            ) PARTITION BY RANGE (timestamp)
+        """))
+        db.session.execute(text("CREATE UNIQUE INDEX uq_history_uuid_timestamp ON history_data (uuid, timestamp)"))
+        db.session.execute(text("CREATE INDEX ix_history_data_timestamp ON history_data (timestamp)"))
+        db.session.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF history_data DEFAULT"))
+
+        oldest = db.session.execute(text(f"SELECT MIN(timestamp) FROM {old}")).scalar()
+        month = _month_start(oldest or datetime.now())
+        last = _add_months(_month_start(datetime.now()), months_ahead)
+        while month <= last:
+            _create_partition(month)
+            month = _add_months(month, 1)
+
+        db.session.execute(text(f"""
+            INSERT INTO history_data (id, uuid, timestamp, total_up, total_down, cpu_usage, valid_until,
+                                      delta_up, delta_down)
+            SELECT id, uuid, timestamp, total_up, total_down, cpu_usage, valid_until, delta_up, delta_down
+            FROM {old} WHERE timestamp IS NOT NULL
+        """))
+        db.session.execute(text(
+            "SELECT setval(pg_get_serial_sequence('history_data', 'id'), "
+            "(SELECT COALESCE(MAX(id), 0) + 1 FROM history_data), false)"
+        ))
+        db.session.execute(text(f"DROP TABLE {old}"))
+        db.session.commit()
+        _log("history_data 已转换为按月分区表")
+        return True
+    except Exception as e:
+        db.session.rollback()
+        _log(f"转换失败，已回滚: {e}")
+        return False
+
+
+def drop_expired_history_partitions(cutoff):
+    """
+    [写] 删除整月都早于 cutoff 的分区，返回 (删除的行数, 释放的字节数)。
+    分区内仍有延续到 cutoff 之后的压缩记录 (valid_until >= cutoff) 时保留该分区，交给逐行清理。
+    """
+    if not is_history_partitioned():
+        return 0, 0
+    rows_dropped = 0
+    bytes_freed = 0
+    for name, month in list_history_partitions():
+        if datetime.combine(_add_months(month, 1), datetime.min.time()) > cutoff:
+            break
+        try:
+            still_valid = db.session.execute(text(
+                f"SELECT EXISTS (SELECT 1 FROM {name} WHERE valid_until >= :cutoff)"
+            ), {'cutoff': cutoff}).scalar()
+            if still_valid:
+                continue
+            rows = db.session.execute(text(f"SELECT COUNT(*) FROM {name}")).scalar() or 0
+            size = db.session.execute(text(f"SELECT pg_total_relation_size('{name}')")).scalar() or 0
+            db.session.execute(text(f"ALTER TABLE history_data DETACH PARTITION {name}"))
+            db.session.execute(text(f"DROP TABLE {name}"))
+            db.session.commit()
+            rows_dropped += rows
+            bytes_freed += size
+            _log(f"已删除过期分区 {name} ({rows} 行)")
+        except Exception as e:
+            db.session.rollback()
+            _log(f"删除分区 {name} 失败: {e}")
+    return rows_dropped, bytes_freed
+
+
+def run_periodic_partition_maintenance():
+    """[定时任务] 提前创建后续月份的分区 (APScheduler 调用)"""
+    from app.utils.scheduler import scheduler
+
+    if not (hasattr(scheduler, 'app') and scheduler.app):
+        print(">>> [Error] Scheduler 未绑定 app 实例，无法维护分区。")
+        return
+    with scheduler.app.app_context():
+        ensure_history_partitions()
@@ -0,0 +1,82 @@
+# 文件路径：./app/utils/sqlite_profile.py
+
+from datetime import datetime
+
+from sqlalchemy import event, text
+
+# =========================================================
+#  SQLite 性能配置
+#  默认的回滚日志模式下，采集写入会阻塞页面读取 ("database is locked")。
+#  每个新连接建立时通过 connect 事件应用以下 PRAGMA：
+#    - WAL：读写互不阻塞，只有写与写之间串行
+#    - synchronous=NORMAL：WAL 模式下仍保证数据库一致性，只在断电时可能丢失最后的事务
+#    - busy_timeout：写锁被占用时等待而不是立即报错
+#    - auto_vacuum=INCREMENTAL：只对新建的数据库生效 (必须在建表和切换 WAL 之前设置)，
+#      已有数据库需运行一次 python -m app.sqlite_vacuum 转换
+# =========================================================
+
+SQLITE_PRAGMAS = (
+    ('auto_vacuum', 'INCREMENTAL'),
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 30000),            # 毫秒
+    ('cache_size', -64000),             # 负数单位为 KiB，约 64 MB
+    ('mmap_size', 268435456),           # 256 MB
+    ('temp_store', 'MEMORY'),
+)
+
+WAL_CHECKPOINT_INTERVAL_MINUTES = 15
+
+
+def _is_sqlite(engine):
+    return engine.url.drivername.startswith('sqlite')
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def configure_sqlite_engine(engine):
+    """为 SQLite 引擎注册 connect 事件 (幂等)；其他数据库不做处理。"""
+    if not _is_sqlite(engine):
+        return False
+    if not event.contains(engine, 'connect', _apply_pragmas):
+        event.listen(engine, 'connect', _apply_pragmas)
+        # 已存在的连接不会触发 connect 事件，丢弃后按新配置重建
+        engine.dispose()
+    return True
+
+
+def checkpoint_wal(engine, mode='TRUNCATE'):
+    """
+    执行 WAL 检查点，把 -wal 文件中的页写回主库并截断，防止 WAL 文件无限增长。
+    返回 (busy, wal 页数, 已写回页数)；非 SQLite 返回 None。
+    """
+    if not _is_sqlite(engine):
+        return None
+    with engine.connect() as conn:
+        return tuple(conn.execute(text(f"PRAGMA wal_checkpoint({mode})")).fetchone())
+
+
+def run_periodic_wal_checkpoint():
+    """[定时任务] 任务入口 (APScheduler 调用)"""
+    from app.utils.scheduler import scheduler
+    from app.utils.db_manager import db
+
+    if not (hasattr(scheduler, 'app') and scheduler.app):
+        print(">>> [Error] Scheduler 未绑定 app 实例，无法执行 WAL 检查点。")
+        return
+    with scheduler.app.app_context():
+        try:
+            result = checkpoint_wal(db.engine)
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] [SQLite] WAL 检查点失败: {e}")
+            return
+        if result and result[0]:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] [SQLite] WAL 检查点被读事务阻塞，下次重试 "
+                  f"(已写回 {result[2]}/{result[1]} 页)")
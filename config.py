@@ -78,6 +78,18 @@ class Config:
     _db_mode = os.environ.get('KOMARI_DB_MODE') or _db_config.get('db_mode', 'sqlite')
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # 是否在 Web 进程内运行采集调度器 (环境变量 SCHEDULER_ENABLED=0 关闭)
+    # 多 Worker 部署时建议关闭，改用独立采集进程: python -m app.collector
+    SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+    # [PostgreSQL] history_data 分区方式: none (普通表) / monthly (按月分区，过期数据整月删除)
+    HISTORY_PARTITIONING = os.environ.get('HISTORY_PARTITIONING') or _db_config.get('history_partitioning', 'none')
+
+    # 历史归档目录 (ARCHIVE_ENABLED=1 时，较早的原始数据按节点/月份压缩存放于此)
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or _db_config.get('archive_dir', 'archive')
+    if not os.path.isabs(ARCHIVE_DIR):
+        ARCHIVE_DIR = os.path.join(basedir, ARCHIVE_DIR)
     
     if _db_mode == 'psql':
         # PostgreSQL 配置
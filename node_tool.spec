@@ -78,7 +78,8 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=added_datas, 
-    hiddenimports=['engineio.async_drivers.threading'],
+    # app.collector: 独立采集进程入口 (./NodeTool collector)
+    hiddenimports=['engineio.async_drivers.threading', 'app.collector'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1,5 +1,13 @@
+import sys
+
 from app import create_app
 
+if __name__ == '__main__' and sys.argv[1:2] == ['collector']:
+    # 独立采集进程: ./NodeTool collector (等同于 python -m app.collector)
+    from app.collector import main
+    main()
+    sys.exit(0)
+
 # 创建应用实例
 app = create_app()
 
@@ -0,0 +1,206 @@
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from app import create_app
+from app.utils.db_manager import db, upsert_node
+
+
+@pytest.fixture
+def app(tmp_path):
+    """使用临时 SQLite 数据库的应用实例 (不启动采集调度器)"""
+
+    class TestConfig(Config):
+        TESTING = True
+        LOGIN_DISABLED = True
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'test.db')
+        ARCHIVE_DIR = str(tmp_path / 'archive')
+
+    app = create_app(TestConfig, with_scheduler=False)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def add_nodes(app):
+    def _add(*uuids):
+        with app.app_context():
+            for uuid in uuids:
+                upsert_node({'uuid': uuid, 'name': uuid})
+    return _add
+
+
+class FakeKomariClient:
+    """只实现快照采集用到的接口：每个节点返回一个新的采样点，fail_uuids 中的节点请求失败"""
+
+    def __init__(self):
+        self.requests = 0
+        self.fail_uuids = set()
+
+    def open_circuits(self):
+        return []
+
+    def get_recent(self, uuid, timeout=15):
+        self.requests += 1
+        if uuid in self.fail_uuids:
+            raise ConnectionError(f'{uuid} unreachable')
+        ts = (datetime.now() - timedelta(seconds=30)).replace(microsecond=0)
+        return {'data': [{
+            'updated_at': ts.isoformat(),
+            'network': {'totalUp': 1000, 'totalDown': 2000},
+            'cpu': {'usage': 1.0},
+        }]}
+
+
+@pytest.fixture
+def fake_komari_client(monkeypatch):
+    from app.modules.data_core import komari_api
+
+    client = FakeKomariClient()
+    monkeypatch.setattr(komari_api, 'get_komari_client', lambda: client)
+    return client
+
+
+# ----------------------------------------------------
+# 本地 WebSocket 模拟服务 (模拟 Komari 的 /api/clients)
+# 每收到一次 "get" 返回全部节点的实时状态，累计流量逐帧递增。
+# ----------------------------------------------------
+
+_WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def _recv_exact(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _recv_frame(conn):
+    header = _recv_exact(conn, 2)
+    if header is None:
+        return None
+    opcode, length = header[0] & 0x0F, header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', _recv_exact(conn, 2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', _recv_exact(conn, 8))[0]
+    mask = _recv_exact(conn, 4)
+    payload = bytearray(_recv_exact(conn, length) or b'')
+    for i in range(len(payload)):
+        payload[i] ^= mask[i % 4]
+    return opcode, bytes(payload)
+
+
+def _send_text(conn, text):
+    data = text.encode()
+    if len(data) < 126:
+        header = bytes([0x81, len(data)])
+    elif len(data) < 65536:
+        header = bytes([0x81, 126]) + struct.pack('>H', len(data))
+    else:
+        header = bytes([0x81, 127]) + struct.pack('>Q', len(data))
+    conn.sendall(header + data)
+
+
+class MockKomariServer:
+    def __init__(self, uuids, drop_after=None):
+        self.uuids = list(uuids)
+        self.drop_after = drop_after      # 每条连接发送 N 帧后主动断开 (测试重连)
+        self.frames = 0
+        self.connections = 0
+        self.started_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self._sock = socket.socket()
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen()
+        self.port = self._sock.getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            chunk = conn.recv(1024)
+            if not chunk:
+                conn.close()
+                return
+            request += chunk
+        key = next(
+            line.split(':', 1)[1].strip()
+            for line in request.decode().split('\r\n')
+            if line.lower().startswith('sec-websocket-key')
+        )
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        conn.sendall(
+            'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n'.encode()
+        )
+        self.connections += 1
+        sent = 0
+        try:
+            while True:
+                frame = _recv_frame(conn)
+                if not frame or frame[0] == 0x8:
+                    break
+                if frame[1] != b'get':
+                    continue
+                self.frames += 1
+                n = self.frames
+                # 每帧的采样时间相差 1 秒 (Komari 的 updated_at 精确到秒参与去重)
+                updated_at = (self.started_at + timedelta(seconds=n)).isoformat()
+                data = {
+                    uuid: {
+                        'cpu': {'usage': 2.0},
+                        'network': {'totalUp': n * 100, 'totalDown': n * 300},
+                        'updated_at': updated_at,
+                    }
+                    for uuid in self.uuids
+                }
+                _send_text(conn, json.dumps({'status': 'success', 'data': {'online': self.uuids, 'data': data}}))
+                sent += 1
+                if self.drop_after and sent >= self.drop_after:
+                    break
+        finally:
+            conn.close()
+
+    def close(self):
+        self._sock.close()
+
+
+@pytest.fixture
+def komari_ws():
+    servers = []
+
+    def _start(uuids, drop_after=None):
+        server = MockKomariServer(uuids, drop_after=drop_after)
+        servers.append(server)
+        return server
+
+    yield _start
+    for server in servers:
+        server.close()
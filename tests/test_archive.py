@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from app.modules.data_core import archive
+from app.utils.db_manager import HistoryData, bulk_add_history, set_config
+
+
+def _seed(uuid, days_ago, count):
+    start = datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=days_ago)
+    records = [
+        {'uuid': uuid, 'timestamp': start + timedelta(minutes=5 * i),
+         'total_up': i * 100, 'total_down': i * 300, 'cpu_usage': 1.0}
+        for i in range(count)
+    ]
+    assert bulk_add_history(records)
+    return start, records
+
+
+def test_archive_respects_time_budget_per_block(app, add_nodes, monkeypatch):
+    add_nodes('node-a')
+    monkeypatch.setattr(archive, 'ARCHIVE_FETCH_LIMIT', 10)
+    with app.app_context():
+        start, records = _seed('node-a', 30, 35)
+
+        # 每写一个数据块 (单节点单月) 耗时 100 秒：第一个数据块写完后时间预算耗尽
+        clock = [0.0]
+        merge = archive._merge_into_month
+
+        def _slow_merge(*args):
+            merge(*args)
+            clock[0] += 100
+        monkeypatch.setattr(archive.time, 'monotonic', lambda: clock[0])
+        monkeypatch.setattr(archive, '_merge_into_month', _slow_merge)
+        result = archive.archive_old_history(time_budget=60)
+        assert result == {'nodes': 1, 'rows': 10, 'completed': False}
+        assert HistoryData.query.count() == 25
+
+        monkeypatch.undo()
+        result = archive.archive_old_history()
+        assert result['completed'] and result['rows'] == 25
+        assert HistoryData.query.count() == 0
+
+        rows = archive.read_archived_rows('node-a', start, start + timedelta(days=1))
+        assert [(r.timestamp, r.total_up) for r in rows] == [(r['timestamp'], r['total_up']) for r in records]
+        # 增量列随归档保存 (节点的第一条记录为 0)
+        assert [r.delta_up for r in rows] == [0] + [100] * (len(records) - 1)
+
+
+def test_archive_days_stay_below_retention(app, add_nodes):
+    add_nodes('node-a')
+    with app.app_context():
+        _seed('node-a', 12, 5)
+        set_config('RAW_DATA_RETENTION_DAYS', '10')
+        # 归档天数不小于保留天数：按 保留天数 - 1 归档，不会被过期清理抢先删除
+        set_config('ARCHIVE_AFTER_DAYS', '20')
+        assert archive._archive_after_days() == 9
+        assert archive.archive_old_history()['rows'] == 5
+
+        # 保留天数过短，留不出归档窗口：跳过归档
+        set_config('RAW_DATA_RETENTION_DAYS', '3')
+        assert archive._archive_after_days() is None
+        assert archive.archive_old_history() == {'nodes': 0, 'rows': 0, 'completed': True}
@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.mark.parametrize('method, path', [
+    ('post', '/api/komari/manual-refresh'),
+    ('get', '/api/komari/refresh/unknown-job'),
+    ('post', '/api/komari/backfill'),
+    ('get', '/api/komari/backfill/status'),
+])
+def test_komari_api_requires_login(app, method, path):
+    app.config['LOGIN_DISABLED'] = False
+    response = getattr(app.test_client(), method)(path)
+    # 未登录时跳转到登录页，不执行任务
+    assert response.status_code in (302, 401)
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+from app.modules.data_core import backfill
+from app.utils.db_manager import BackfillTask, get_backfill_job
+
+
+def test_api_only_enqueues_backfill(app, add_nodes, monkeypatch):
+    add_nodes('node-a')
+    now = datetime.now().replace(microsecond=0)
+    gaps = [('node-a', now - timedelta(hours=2), now - timedelta(hours=1))]
+    monkeypatch.setattr(backfill, 'detect_gaps', lambda: gaps)
+    client = app.test_client()
+
+    first = client.post('/api/komari/backfill').get_json()
+    assert first['job']['status'] == 'running'
+    # Web 进程只提交任务，不启动补采线程：缺口保持待补采，由活跃采集器执行
+    assert not backfill.is_backfill_running()
+    with app.app_context():
+        assert [t.status for t in BackfillTask.query.all()] == ['pending']
+
+    # 重复提交返回同一个未完成的任务
+    second = client.post('/api/komari/backfill').get_json()
+    assert second['job']['id'] == first['job']['id']
+    assert client.get('/api/komari/backfill/status').get_json()['running'] is True
+
+
+def test_collector_runs_enqueued_backfill(app, add_nodes, monkeypatch):
+    add_nodes('node-a')
+    now = datetime.now().replace(microsecond=0)
+    gap_start, gap_end = now - timedelta(hours=2), now - timedelta(hours=1)
+    monkeypatch.setattr(backfill, 'detect_gaps', lambda: [('node-a', gap_start, gap_end)])
+
+    class FakeClient:
+        def get_json(self, path, timeout=15, node_uuid=None):
+            ts = gap_start + timedelta(minutes=30)
+            return {'data': [{'time': ts.isoformat(), 'net_total_up': 100, 'net_total_down': 200}]}
+
+    import app.modules.data_core.komari_api as komari_api
+    monkeypatch.setattr(komari_api, 'get_komari_client', lambda: FakeClient())
+
+    with app.app_context():
+        job_id, created = backfill.enqueue_backfill()
+        assert created
+        assert backfill.start_backfill(app) == (job_id, True)
+        assert backfill.wait_for_backfill(10)
+        job = get_backfill_job(job_id)
+        assert job.status == 'completed'
+        assert job.done_tasks == 1 and job.inserted_records == 1
@@ -0,0 +1,41 @@
+from app.modules.data_core import komari_api
+from app.utils.db_manager import CollectorRun, HistoryData
+
+
+def test_failed_history_write_marks_run_failed(app, add_nodes, fake_komari_client, monkeypatch):
+    add_nodes('node-a', 'node-b')
+    # bulk_add_history 回滚后返回 False
+    monkeypatch.setattr(komari_api, 'bulk_add_history', lambda records: False)
+    with app.app_context():
+        komari_api._run_and_record('snapshot', komari_api.fetch_and_save_snapshots)
+
+        run = CollectorRun.query.one()
+        assert run.records_written == 0
+        assert run.error and '失败' in run.error
+        assert HistoryData.query.count() == 0
+
+
+def test_successful_write_is_recorded(app, add_nodes, fake_komari_client):
+    add_nodes('node-a', 'node-b')
+    with app.app_context():
+        komari_api._run_and_record('snapshot', komari_api.fetch_and_save_snapshots)
+
+        run = CollectorRun.query.one()
+        assert run.error is None
+        assert run.records_written == 2
+        assert HistoryData.query.count() == 2
+
+
+def test_adaptive_tick_without_due_nodes_is_not_recorded(app, add_nodes, fake_komari_client, monkeypatch):
+    add_nodes('node-a', 'node-b')
+    monkeypatch.setattr(komari_api, 'is_adaptive_polling', lambda: True)
+    monkeypatch.setattr(komari_api, '_poll_planner', komari_api.AdaptivePollPlanner())
+    with app.app_context():
+        # 第一个 tick：新节点立即到期
+        komari_api._run_and_record('snapshot', komari_api.fetch_and_save_snapshots)
+        assert fake_komari_client.requests == 2
+        # 之后的 tick 在下次采集时间之前：没有请求，也不写运行记录
+        for _ in range(3):
+            komari_api._run_and_record('snapshot', komari_api.fetch_and_save_snapshots)
+        assert fake_komari_client.requests == 2
+        assert CollectorRun.query.count() == 1
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.modules.history.routes import clear_history_caches
+from app.utils.db_manager import bulk_add_history
+
+GB = 1024 * 1024 * 1024
+
+
+@pytest.fixture(autouse=True)
+def _fresh_caches():
+    clear_history_caches()
+    yield
+    clear_history_caches()
+
+
+def _day_start(days_ago):
+    return datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=days_ago)
+
+
+def test_raw_line_total_matches_bars_and_ranking(app, add_nodes):
+    add_nodes('node-a')
+    day = _day_start(1)
+    with app.app_context():
+        # 前一天最后一个采样点之后，每 5 分钟上传 1 GB：当天第一个点的增量同样属于当天
+        assert bulk_add_history([
+            {'uuid': 'node-a', 'timestamp': day + timedelta(minutes=5 * i),
+             'total_up': (i + 1) * GB, 'total_down': 0, 'cpu_usage': 1.0}
+            for i in range(-1, 288)
+        ])
+
+    client = app.test_client()
+    data = client.get(f'/history/api/chart_data?uuid=node-a&date={day:%Y-%m-%d}').get_json()['data']
+    assert data['resolution'] == 'raw'
+    ranking = client.get(f'/history/api/ranking?date={day:%Y-%m-%d}').get_json()['data']['ranking']
+
+    assert data['line']['totals'][0] == 0
+    assert data['line']['totals'][-1] == sum(data['bar']['up']) == ranking[0]['usage'] == 288
+
+
+def test_chart_etag_changes_when_idle_run_is_extended(app, add_nodes):
+    add_nodes('node-a')
+    day = _day_start(0)
+    sample = {'uuid': 'node-a', 'total_up': GB, 'total_down': 0, 'cpu_usage': 1.0}
+    with app.app_context():
+        assert bulk_add_history([dict(sample, timestamp=day + timedelta(minutes=10)),
+                                 dict(sample, timestamp=day + timedelta(minutes=15), total_up=2 * GB)])
+
+    client = app.test_client()
+    url = f'/history/api/chart_data?uuid=node-a&date={day:%Y-%m-%d}'
+    first = client.get(url)
+    assert first.get_json()['data']['line']['times'][-2:] == ['00:10', '00:15']
+    etag = first.headers['ETag']
+
+    with app.app_context():
+        # 计数器未变化的采样只延长上一行的 valid_until，日汇总行不变
+        assert bulk_add_history([dict(sample, timestamp=day + timedelta(minutes=40), total_up=2 * GB)])
+
+    second = client.get(url, headers={'If-None-Match': etag})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != etag
+    assert second.get_json()['data']['line']['times'][-3:] == ['00:10', '00:15', '00:40']
+
+
+def test_downsampled_line_keeps_usage_spikes(app, add_nodes):
+    add_nodes('node-a')
+    day = _day_start(1)
+    # 每 5 分钟 0~2 GB 的平稳流量，其中 7 个时刻突发 8 GB
+    spikes = [20, 60, 100, 140, 180, 220, 260]
+    totals, total = [], 0
+    for i in range(288):
+        total += 8 if i in spikes else i % 3
+        totals.append(total)
+    with app.app_context():
+        assert bulk_add_history([
+            {'uuid': 'node-a', 'timestamp': day + timedelta(minutes=5 * i),
+             'total_up': totals[i] * GB, 'total_down': 0, 'cpu_usage': 1.0}
+            for i in range(288)
+        ])
+
+    line = app.test_client().get(
+        f'/history/api/chart_data?uuid=node-a&date={day:%Y-%m-%d}&max_points=20'
+    ).get_json()['data']['line']
+    assert len(line['times']) == 20
+    # 在单点增量上选点：每个突发时刻都被保留 (在累计曲线上选点只能保留其中几个)
+    for i in spikes:
+        assert (day + timedelta(minutes=5 * i)).strftime('%H:%M') in line['times']
@@ -0,0 +1,156 @@
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from app.utils import db_manager
+from app.utils.db_manager import (
+    db,
+    HistoryData,
+    HistoryHourly,
+    HistoryDaily,
+    bulk_add_history,
+    rebuild_history_rollups,
+    set_config,
+)
+
+BASE = datetime(2025, 3, 1, 10, 0, 0)
+
+
+def _records(uuid, start, count, step=100, cpu=1.0):
+    return [
+        {'uuid': uuid, 'timestamp': BASE + timedelta(minutes=5 * i),
+         'total_up': (start + i) * step, 'total_down': (start + i) * step * 3, 'cpu_usage': cpu + i}
+        for i in range(count)
+    ]
+
+
+def _raw_totals():
+    return tuple(int(v or 0) for v in db.session.query(
+        func.sum(HistoryData.delta_up), func.sum(HistoryData.delta_down), func.count(HistoryData.id)
+    ).one())
+
+
+def _rollup_rows(model):
+    return sorted(
+        (r.uuid, r.bucket, r.delta_up, r.delta_down, r.samples, round(r.cpu_sum, 6), r.cpu_max)
+        for r in model.query.all()
+    )
+
+
+def _assert_rollups_match_raw():
+    raw = _raw_totals()
+    for model in (HistoryHourly, HistoryDaily):
+        rollup = tuple(int(v or 0) for v in db.session.query(
+            func.sum(model.delta_up), func.sum(model.delta_down), func.sum(model.samples)
+        ).one())
+        assert rollup == raw, model.__tablename__
+
+
+def test_concurrent_overlapping_writers_do_not_double_count(app, add_nodes, monkeypatch):
+    add_nodes('node-a')
+    with app.app_context():
+        assert bulk_add_history(_records('node-a', 0, 1))
+
+    # 两个写入者在读取尾部之后互相等待：未加锁时两者都基于同一个过期的尾部计算增量
+    barrier = threading.Barrier(2)
+    original = db_manager._get_latest_history_rows
+
+    def _slow_latest_rows(uuids):
+        rows = original(uuids)
+        try:
+            barrier.wait(timeout=1)
+        except threading.BrokenBarrierError:
+            pass
+        return rows
+    monkeypatch.setattr(db_manager, '_get_latest_history_rows', _slow_latest_rows)
+
+    batch = _records('node-a', 0, 8)[1:]
+    results = []
+
+    def _writer():
+        with app.app_context():
+            results.append(bulk_add_history(batch))
+    threads = [threading.Thread(target=_writer) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(60)
+
+    assert results == [True, True]
+    with app.app_context():
+        assert _raw_totals() == (700, 2100, 8)
+        _assert_rollups_match_raw()
+
+
+def test_duplicate_batch_is_idempotent(app, add_nodes):
+    add_nodes('node-a')
+    with app.app_context():
+        batch = _records('node-a', 0, 6)
+        assert bulk_add_history(batch)
+        before = _rollup_rows(HistoryHourly)
+        # 重复写入同一批 (重试/重叠的补采)
+        assert bulk_add_history(batch)
+        assert _rollup_rows(HistoryHourly) == before
+        _assert_rollups_match_raw()
+
+
+def test_ingest_and_rebuild_agree_on_samples_and_cpu(app, add_nodes):
+    add_nodes('node-a')
+    with app.app_context():
+        set_config('COMPRESS_IDLE_SNAPSHOTS', '1')
+        records = _records('node-a', 0, 4)
+        # 计数器不变的采样被游程压缩 (跨越整点，valid_until 落在下一个小时)
+        for i in range(4, 16):
+            records.append({'uuid': 'node-a', 'timestamp': BASE + timedelta(minutes=5 * i),
+                            'total_up': 300, 'total_down': 900, 'cpu_usage': 50.0})
+        records.extend(
+            {'uuid': 'node-a', 'timestamp': BASE + timedelta(minutes=5 * i),
+             'total_up': 300 + (i - 15) * 10, 'total_down': 900, 'cpu_usage': 2.0}
+            for i in range(16, 20)
+        )
+        # 分两批写入，第二批延长第一批的尾部
+        assert bulk_add_history(records[:10])
+        assert bulk_add_history(records[10:])
+        assert db.session.query(HistoryData).count() < len(records)
+
+        ingested = {model: _rollup_rows(model) for model in (HistoryHourly, HistoryDaily)}
+        _assert_rollups_match_raw()
+
+        # 汇总表为空 (升级前的旧数据库) 时从最早一天起重建
+        for model in (HistoryHourly, HistoryDaily):
+            model.query.delete()
+        rebuild_history_rollups(['node-a'])
+        db.session.commit()
+        for model, rows in ingested.items():
+            assert _rollup_rows(model) == rows, model.__tablename__
+
+
+def test_full_rebuild_keeps_partially_expired_first_day(app, add_nodes):
+    add_nodes('node-a')
+    day = datetime(2025, 3, 1)
+    with app.app_context():
+        # 三天数据，每小时一个采样点，每小时上传 100
+        assert bulk_add_history([
+            {'uuid': 'node-a', 'timestamp': day + timedelta(hours=i),
+             'total_up': i * 100, 'total_down': i * 300, 'cpu_usage': 1.0}
+            for i in range(72)
+        ])
+        ingested = {model: _rollup_rows(model) for model in (HistoryHourly, HistoryDaily)}
+        # 过期清理在第一天中午截断了原始数据
+        HistoryData.query.filter(HistoryData.timestamp < day + timedelta(hours=12)).delete()
+        first_kept = HistoryData.query.order_by(HistoryData.timestamp).first()
+        first_delta = (first_kept.delta_up, first_kept.delta_down)
+        # 之后的汇总被破坏，需要全量重建
+        HistoryDaily.query.filter(HistoryDaily.bucket > day).update({'delta_up': 0})
+        db.session.commit()
+
+        rebuild_history_rollups(['node-a'])
+        db.session.commit()
+
+        # 第一天的完整汇总不被残缺的原始数据覆盖，之后的汇总恢复
+        for model, rows in ingested.items():
+            assert _rollup_rows(model) == rows, model.__tablename__
+        db.session.expire_all()
+        first_kept = HistoryData.query.order_by(HistoryData.timestamp).first()
+        assert (first_kept.delta_up, first_kept.delta_down) == first_delta == (100, 300)
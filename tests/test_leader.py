@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.dialects import postgresql
+
+from app.modules.data_core import leader as leader_module
+from app.modules.data_core.leader import CollectorLeader, should_stand_down
+from app.utils.db_manager import db, CollectorLease, try_acquire_lease, get_lease, _db_utc_now
+
+
+def _utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _set_expiry(app, name, expires_at):
+    with app.app_context():
+        CollectorLease.query.filter_by(name=name).update({'expires_at': expires_at})
+        db.session.commit()
+
+
+def test_lease_uses_database_time(app):
+    with app.app_context():
+        assert try_acquire_lease('collector', 'a', 60) is True
+        assert try_acquire_lease('collector', 'b', 60) is False
+        assert try_acquire_lease('collector', 'a', 60) is True
+
+        lease = get_lease('collector')
+        assert lease.holder == 'a'
+        # 租约时间为数据库的 UTC 时间
+        utc_now = _utc_now()
+        assert abs((lease.expires_at - utc_now) - timedelta(seconds=60)) < timedelta(seconds=5)
+        assert abs(lease.acquired_at - utc_now) < timedelta(seconds=5)
+
+    # 过期后可被其他进程接管
+    _set_expiry(app, 'collector', _utc_now() - timedelta(seconds=1))
+    with app.app_context():
+        assert try_acquire_lease('collector', 'b', 60) is True
+        assert get_lease('collector').holder == 'b'
+
+
+def test_lease_from_skewed_clock_is_not_honoured(app):
+    with app.app_context():
+        assert try_acquire_lease('collector', 'a', 60) is True
+    # 按本机时间 (时钟超前或旧版本写入的本地时间) 写入、远超有效期的到期时间
+    _set_expiry(app, 'collector', _utc_now() + timedelta(hours=8))
+    with app.app_context():
+        assert try_acquire_lease('collector', 'b', 60) is True
+
+
+def test_postgresql_lease_expression_uses_server_clock(app, monkeypatch):
+    with app.app_context():
+        monkeypatch.setattr(db.engine.dialect, 'name', 'postgresql')
+        sql = str(_db_utc_now(60).compile(dialect=postgresql.dialect()))
+    assert 'timezone' in sql and 'now()' in sql
+
+
+def test_demotion_sets_stand_down(app):
+    calls = []
+    leader = CollectorLeader(app, on_elected=lambda: calls.append('elected'),
+                             on_demoted=lambda: calls.append(('demoted', should_stand_down())))
+    leader.tick()
+    assert leader.is_leader and not should_stand_down()
+
+    _set_expiry(app, leader_module.LEASE_NAME, _utc_now() - timedelta(seconds=1))
+    with app.app_context():
+        assert try_acquire_lease(leader_module.LEASE_NAME, 'other', 60) is True
+    leader.tick()
+    assert not leader.is_leader
+    # on_demoted 执行时已在运行的任务可以看到停止标记
+    assert calls == ['elected', ('demoted', True)]
+    assert should_stand_down()
+
+    # 重新当选后清除标记
+    with app.app_context():
+        CollectorLease.query.delete()
+        db.session.commit()
+    leader.tick()
+    assert leader.is_leader and not should_stand_down()
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from app.modules.data_core import komari_api
+from app.modules.data_core.refresh_jobs import submit_refresh, get_refresh_job
+
+
+def _wait_finished(app, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with app.app_context():
+            job = get_refresh_job(job_id)
+        if not job.is_active:
+            return job
+        time.sleep(0.05)
+    raise AssertionError('刷新任务未在时限内结束')
+
+
+@pytest.fixture
+def adaptive(monkeypatch):
+    monkeypatch.setattr(komari_api, 'is_adaptive_polling', lambda: True)
+    monkeypatch.setattr(komari_api, '_poll_planner', komari_api.AdaptivePollPlanner())
+
+
+def test_full_refresh_ignores_adaptive_plan(app, add_nodes, fake_komari_client, adaptive, monkeypatch):
+    add_nodes('node-a', 'node-b')
+    monkeypatch.setattr(komari_api, 'sync_node_list', lambda stats=None: True)
+    with app.app_context():
+        # 一个自适应 tick 之后两个节点都还没到下次采集时间
+        komari_api.fetch_and_save_snapshots()
+        assert fake_komari_client.requests == 2
+
+        job, created = submit_refresh(app)
+    assert created
+    job = _wait_finished(app, job.id)
+    assert job.status == 'done'
+    assert fake_komari_client.requests == 4
+
+
+def test_refresh_reports_partial_and_failed(app, add_nodes, fake_komari_client, monkeypatch):
+    add_nodes('node-a', 'node-b')
+    monkeypatch.setattr(komari_api, 'sync_node_list', lambda stats=None: False)
+
+    fake_komari_client.fail_uuids = {'node-b'}
+    with app.app_context():
+        job, _ = submit_refresh(app)
+    job = _wait_finished(app, job.id)
+    assert job.status == 'partial'
+    assert '节点列表同步失败' in job.message and job.stats['failure_count'] == 1
+
+    fake_komari_client.fail_uuids = {'node-a', 'node-b'}
+    with app.app_context():
+        job, _ = submit_refresh(app)
+    job = _wait_finished(app, job.id)
+    assert job.status == 'failed'
+
+
+def test_refresh_job_is_shared_through_database(app, add_nodes, fake_komari_client):
+    add_nodes('node-a')
+    client = app.test_client()
+    job_id = client.post('/api/komari/manual-refresh', json={'uuids': ['node-a']}).get_json()['job']['id']
+    _wait_finished(app, job_id)
+
+    # 任务状态从数据库读取 (另一个 Worker 同样能查询)，包括执行统计
+    body = client.get(f'/api/komari/refresh/{job_id}').get_json()
+    assert body['job']['status'] == 'done'
+    assert body['job']['success_count'] == 1
@@ -0,0 +1,32 @@
+from app.modules.history import series
+
+
+def test_cumulative_and_steps_roundtrip():
+    # 第一个点的增量同样计入 (起点是否属于本时间段由调用方决定)
+    assert list(series.cumulative([5, 1])) == [5, 6]
+    acc = series.cumulative([0, 50, 20, 30])
+    assert list(acc) == [0, 50, 70, 100]
+    # 单点增量：第一个点为 0，其余为相邻两点之差
+    assert list(series.steps(acc)) == [0, 50, 20, 30]
+    assert series.cumulative([]) == []
+    assert series.steps([]) == []
+
+
+def test_expand_intervals_and_bucket_sums():
+    offsets, (values,) = series.expand_intervals([-5, 10, 40], [None, 30, 100], [1, 2, 3], end_offset=60)
+    assert offsets.tolist() == [0, 10, 30, 40, 60]
+    assert values.tolist() == [1, 2, 2, 3, 3]
+
+    # 超出桶范围的值丢弃
+    assert series.bucket_sums([0, 9, 10, 25, 35], [1, 2, 3, 4, 5], 10, 3) == [3, 3, 4]
+
+
+def test_lttb_keeps_endpoints_and_spike():
+    x = list(range(100))
+    y = [0] * 100
+    y[37] = 1000
+    indices = series.lttb_indices(x, y, 10)
+    assert len(indices) == 10
+    assert indices[0] == 0 and indices[-1] == 99
+    assert 37 in indices
+    assert series.take(y, indices).count(1000) == 1
@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import Config
+from app import create_app
+from app.utils import sqlite_profile
+from app.utils.db_manager import db, bulk_upsert_nodes, bulk_add_history
+
+READ_HOLD_SECONDS = 1.5     # 读事务保持打开的时间
+NODES = 20
+
+
+def _make_app(tmp_path, monkeypatch, journal_mode):
+    pragmas = tuple(
+        (name, journal_mode if name == 'journal_mode' else value)
+        for name, value in sqlite_profile.SQLITE_PRAGMAS
+    )
+    monkeypatch.setattr(sqlite_profile, 'SQLITE_PRAGMAS', pragmas)
+
+    class ContentionConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'contention.db')
+        ARCHIVE_DIR = str(tmp_path / 'archive')
+
+    app = create_app(ContentionConfig, with_scheduler=False)
+    return app, str(tmp_path / 'contention.db'), pragmas
+
+
+def _run_contention(app, db_path, pragmas):
+    """
+    一个独立连接打开长时间的读事务 (模拟页面查询)，同时两个写线程通过应用的连接池调用 bulk_add_history。
+    返回 (读事务期间完成的写入次数, 写入结果列表, 读事务内前后两次计数)。
+    """
+    uuids = [f'node-{i:03d}' for i in range(NODES)]
+    with app.app_context():
+        bulk_upsert_nodes([{'uuid': uuid, 'name': uuid, 'traffic_limit': 0} for uuid in uuids])
+
+    reading = threading.Event()
+    done = threading.Event()
+    window = {}
+    counts = []
+    commits = []
+    lock = threading.Lock()
+
+    def reader():
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        for name, value in pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        try:
+            conn.execute("BEGIN")
+            counts.append(conn.execute("SELECT COUNT(*) FROM history_data").fetchone()[0])
+            window['start'] = time.monotonic()
+            reading.set()
+            time.sleep(READ_HOLD_SECONDS)
+            counts.append(conn.execute("SELECT COUNT(*) FROM history_data").fetchone()[0])
+            window['end'] = time.monotonic()
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+            done.set()
+
+    def writer(offset_seconds):
+        base = datetime(2025, 1, 1) + timedelta(seconds=offset_seconds)
+        reading.wait(10)
+        with app.app_context():
+            step = 0
+            while not done.is_set() or step < 2:
+                step += 1
+                ts = base + timedelta(minutes=step)
+                ok = bulk_add_history([
+                    {'uuid': uuid, 'timestamp': ts, 'total_up': step * 1000, 'total_down': step * 2000,
+                     'cpu_usage': 1.0}
+                    for uuid in uuids
+                ])
+                with lock:
+                    commits.append((time.monotonic(), ok))
+                time.sleep(0.02)
+            db.session.remove()
+
+    threads = [threading.Thread(target=reader)]
+    threads += [threading.Thread(target=writer, args=(i * 30,)) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(60)
+
+    during_read = sum(1 for at, ok in commits if ok and window['start'] < at < window['end'])
+    with app.app_context():
+        db.engine.dispose()
+    return during_read, [ok for _, ok in commits], counts
+
+
+def test_writers_commit_while_a_long_read_is_open(tmp_path, monkeypatch):
+    app, db_path, pragmas = _make_app(tmp_path, monkeypatch, 'WAL')
+    during_read, results, counts = _run_contention(app, db_path, pragmas)
+
+    assert all(results)
+    # WAL：写入不等待读事务结束
+    assert during_read >= 2
+    # 读事务看到一致的快照
+    assert counts[0] == counts[1]
+
+
+def test_rollback_journal_blocks_writers(tmp_path, monkeypatch):
+    """对照组：journal_mode=DELETE 时写入必须等读事务结束，上面的检查会失败"""
+    app, db_path, pragmas = _make_app(tmp_path, monkeypatch, 'DELETE')
+    during_read, results, _ = _run_contention(app, db_path, pragmas)
+
+    assert all(results)
+    assert during_read == 0
@@ -0,0 +1,47 @@
+import sqlite3
+
+from app.modules.data_core import retention
+from app.utils.db_manager import (
+    db,
+    get_sqlite_auto_vacuum,
+    sqlite_incremental_vacuum,
+    sqlite_enable_incremental_vacuum,
+    SQLITE_AUTO_VACUUM_INCREMENTAL,
+)
+
+
+def _db_path(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+
+
+def test_new_database_uses_incremental_vacuum(app):
+    with app.app_context():
+        assert get_sqlite_auto_vacuum() == SQLITE_AUTO_VACUUM_INCREMENTAL
+
+
+def test_retention_never_runs_full_vacuum(app, monkeypatch):
+    # 模拟旧数据库: auto_vacuum=NONE
+    with app.app_context():
+        db.engine.dispose()
+    conn = sqlite3.connect(_db_path(app), isolation_level=None)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.execute('PRAGMA auto_vacuum=NONE')
+    conn.execute('VACUUM')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()
+
+    statements = []
+    with app.app_context():
+        from sqlalchemy import event
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        assert get_sqlite_auto_vacuum() == 0
+        assert sqlite_incremental_vacuum(100) == 0
+        retention.prune_expired_history(time_budget=5)
+        assert not any(s.strip().upper() == 'VACUUM' for s in statements)
+        assert get_sqlite_auto_vacuum() == 0
+
+        # 显式的维护步骤才会转换
+        assert sqlite_enable_incremental_vacuum() is True
+        assert get_sqlite_auto_vacuum() == SQLITE_AUTO_VACUUM_INCREMENTAL
+        assert sqlite_enable_incremental_vacuum() is False
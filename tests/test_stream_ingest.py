@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from app.modules.data_core import stream_ingest
+from app.modules.data_core.stream_ingest import KomariStreamIngestor, parse_clients_frame
+from app.utils.db_manager import HistoryData, set_config
+
+
+def _wait_until(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _make_ingestor(app, base_url):
+    with app.app_context():
+        set_config('KOMARI_BASE_URL', base_url)
+        set_config('STREAM_SAMPLE_SECONDS', 1)
+        set_config('STREAM_FLUSH_SECONDS', 3600)   # 由测试显式 flush
+    return KomariStreamIngestor(app)
+
+
+def _history_rows(app):
+    with app.app_context():
+        return [
+            (r.uuid, r.total_up, r.total_down)
+            for r in HistoryData.query.order_by(HistoryData.uuid, HistoryData.timestamp).all()
+        ]
+
+
+def test_parse_clients_frame_rejects_bad_frames():
+    assert parse_clients_frame('not json') == {}
+    assert parse_clients_frame('{"status": "error"}') == {}
+    assert parse_clients_frame('{"status": "success", "data": {"data": {"a": {}}}}') == {'a': {}}
+
+
+def test_stream_ingest_end_to_end(app, add_nodes, komari_ws):
+    add_nodes('node-a', 'node-b')
+    # node-x 不在 nodes 表中，写库时应被丢弃
+    server = komari_ws(['node-a', 'node-b', 'node-x'], drop_after=2)
+    ingestor = _make_ingestor(app, server.base_url)
+    ingestor.start()
+    try:
+        # 服务端每条连接发送 2 帧后断开，采集器需要自动重连
+        assert _wait_until(lambda: server.connections >= 2 and len(ingestor._buffer) >= 9)
+    finally:
+        ingestor.stop()
+
+    rows = _history_rows(app)
+    assert {uuid for uuid, _, _ in rows} == {'node-a', 'node-b'}
+    node_a = [(up, down) for uuid, up, down in rows if uuid == 'node-a']
+    assert len(node_a) >= 3
+    assert node_a[:3] == [(100, 300), (200, 600), (300, 900)]
+    assert ingestor._buffer == []
+
+
+def test_flush_requeues_failed_batch(app, add_nodes, komari_ws, monkeypatch):
+    add_nodes('node-a')
+    server = komari_ws(['node-a'])
+    ingestor = _make_ingestor(app, server.base_url)
+    frame = '{"status": "success", "data": {"data": {"node-a": {"updated_at": "%s", "network": {"totalUp": %d}}}}}'
+    ingestor.handle_frame(frame % ('2025-01-01T00:00:00Z', 10))
+    ingestor.handle_frame(frame % ('2025-01-01T00:00:10Z', 20))
+
+    monkeypatch.setattr(stream_ingest, 'bulk_add_history', lambda records: False)
+    assert ingestor.flush() == 0
+    assert [r['total_up'] for r in ingestor._buffer] == [10, 20]
+
+    def _raise(records):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(stream_ingest, 'bulk_add_history', _raise)
+    ingestor.handle_frame(frame % ('2025-01-01T00:00:20Z', 30))
+    with pytest.raises(RuntimeError):
+        ingestor.flush()
+    # 失败的批次放回队首，新到的数据排在后面
+    assert [r['total_up'] for r in ingestor._buffer] == [10, 20, 30]
+
+    monkeypatch.undo()
+    assert ingestor.flush() == 3
+    assert ingestor._buffer == []
+    assert [up for _, up, _ in _history_rows(app)] == [10, 20, 30]
+
+
+def test_requeue_is_bounded(app, add_nodes, komari_ws, monkeypatch):
+    add_nodes('node-a')
+    server = komari_ws(['node-a'])
+    ingestor = _make_ingestor(app, server.base_url)
+    monkeypatch.setattr(stream_ingest, 'MAX_BUFFERED_RECORDS', 3)
+    monkeypatch.setattr(stream_ingest, 'bulk_add_history', lambda records: False)
+    frame = '{"status": "success", "data": {"data": {"node-a": {"updated_at": "2025-01-01T00:00:%02dZ", "network": {"totalUp": %d}}}}}'
+    for i in range(3):
+        ingestor.handle_frame(frame % (i, i))
+    ingestor.flush()
+    for i in range(3, 5):
+        ingestor.handle_frame(frame % (i, i))
+    # 超出上限时丢弃最旧的数据
+    assert [r['total_up'] for r in ingestor._buffer] == [2, 3, 4]